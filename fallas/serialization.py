@@ -0,0 +1,66 @@
+'''
+Serialización de las tareas, para el archivo de tareas y para las respuestas de la API.
+
+- JSON compacto (sin indentación ni espacios), codificado con orjson si está instalado.
+- JSON indentado, el formato anterior de tasks.json.
+- MessagePack, si está instalado el paquete msgpack.
+
+El lector reconoce el formato por el primer byte, así que un archivo escrito en cualquiera de ellos
+(incluidos los anteriores, indentados) se puede leer aunque se haya cambiado el formato configurado.
+'''
+
+import json
+
+try:
+    import orjson
+except ImportError:  # Opcional: codificador JSON más rápido (pip install orjson)
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Opcional: formato binario (pip install msgpack)
+    msgpack = None
+
+# Formatos del archivo de tareas (TASKS_FILE_FORMAT)
+FILE_FORMATS = ('json', 'pretty', 'msgpack')
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def dumps_json(data, sort_keys=False, fast=True):
+    """JSON compacto en UTF-8 (bytes); con orjson si está instalado y fast es True"""
+    if fast and orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys).encode('utf-8')
+
+
+def loads_json(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def dumps_msgpack(data):
+    if msgpack is None:
+        raise RuntimeError("El formato msgpack requiere el paquete msgpack (pip install msgpack)")
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def dumps_document(data, file_format):
+    """Contenido del archivo de tareas en el formato indicado"""
+    if file_format == 'msgpack':
+        return dumps_msgpack(data)
+    if file_format == 'pretty':
+        return json.dumps(data, indent=4, ensure_ascii=False).encode('utf-8')
+    return dumps_json(data)
+
+
+def loads_document(raw):
+    """Lee el archivo de tareas en cualquiera de los formatos; lanza ValueError si está dañado"""
+    if raw.lstrip()[:1] in (b'{', b'[', b''):
+        return loads_json(raw)  # orjson.JSONDecodeError y json.JSONDecodeError son ValueError
+    if msgpack is None:
+        raise ValueError("El archivo no es JSON y el paquete msgpack no está instalado")
+    try:
+        return msgpack.unpackb(raw, raw=False)
+    except Exception as e:
+        raise ValueError(f"Archivo MessagePack inválido: {e}") from e
@@ -2,63 +2,391 @@
 Este archivo implementa una API web para gestionar tareas usando Flask
 '''
 
-import json
+import atexit
+import gzip
+import hashlib
 import os
+import re
 import sys
 import requests
 from datetime import datetime
 from flask import Flask, jsonify, request, render_template, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.routing import BaseConverter
+from event_shipper import EventShipper
+from search import parse_query
+from storage import (TASK_ID_PATTERN, VersionConflict, check_version, create_store, decode_cursor,
+                     encode_cursor, sort_key)
+from serialization import JSON_MIMETYPE, MSGPACK_MIMETYPES, dumps_json, dumps_msgpack, msgpack
+from task_events import TaskEventLog
 
 # Definimos la ruta del archivo 'tasks.json' dentro de la carpeta del proyecto
 TASKS_FILE = os.path.join(os.path.dirname(__file__), 'tasks.json')
+# Motor de almacenamiento: "json" (tasks.json), "sqlite" (tasks.db en modo WAL, importa tasks.json la
+# primera vez) o "journal" (tasks.json como instantánea + tasks.journal con una línea por operación)
+TASKS_STORAGE = os.environ.get("TASKS_STORAGE", "json")
+TASKS_DB = os.path.join(os.path.dirname(__file__), 'tasks.db')
+TASKS_JOURNAL_MAX_BYTES = int(os.environ.get("TASKS_JOURNAL_MAX_BYTES", 1024 * 1024))  # Compactar al superarlo
+TASKS_JOURNAL_FSYNC = os.environ.get("TASKS_JOURNAL_FSYNC", "1") == "1"  # fsync después de cada operación
+# Formato del archivo de tareas: "json" (compacto), "pretty" (indentado, el anterior) o "msgpack"
+TASKS_FILE_FORMAT = os.environ.get("TASKS_FILE_FORMAT", "json")
+# Respuestas de la API: orjson si está instalado, y gzip para las de al menos TASKS_GZIP_MIN_BYTES
+TASKS_FAST_JSON = os.environ.get("TASKS_FAST_JSON", "1") == "1"
+TASKS_GZIP_MIN_BYTES = int(os.environ.get("TASKS_GZIP_MIN_BYTES", 8192))
+TASKS_GZIP_LEVEL = int(os.environ.get("TASKS_GZIP_LEVEL", 5))
+# Listados paginados: tamaño de página por defecto y máximo de la API, y tareas por página de la interfaz
+TASKS_PAGE_SIZE = int(os.environ.get("TASKS_PAGE_SIZE", 50))
+TASKS_MAX_PAGE_SIZE = int(os.environ.get("TASKS_MAX_PAGE_SIZE", 500))
+TASKS_WEB_PAGE_SIZE = int(os.environ.get("TASKS_WEB_PAGE_SIZE", 20))
+# Máximo de operaciones por solicitud en POST /api/tasks/batch
+TASKS_BATCH_MAX = int(os.environ.get("TASKS_BATCH_MAX", 10000))
+# Máximo de términos de una búsqueda (GET /api/tasks/search?q=)
+TASKS_SEARCH_MAX_TERMS = int(os.environ.get("TASKS_SEARCH_MAX_TERMS", 10))
+# Eventos de cambios (GET /api/tasks/events): archivo compartido por las instancias, tamaño antes de
+# rotarlo, segundos entre comentarios de keep-alive y máximo de conexiones abiertas por proceso
+TASKS_EVENTS_FILE = os.path.join(os.path.dirname(__file__), 'tasks.events')
+TASKS_EVENTS_MAX_BYTES = int(os.environ.get("TASKS_EVENTS_MAX_BYTES", 1024 * 1024))
+TASKS_EVENTS_HEARTBEAT = float(os.environ.get("TASKS_EVENTS_HEARTBEAT", 15))
+TASKS_EVENTS_MAX_CLIENTS = int(os.environ.get("TASKS_EVENTS_MAX_CLIENTS", 100))
+
+TASK_FIELDS = ('id', 'title', 'completed')
+# Valor de ?sort= -> (criterio de orden, descendente)
+SORTS = {'id': ('id', False), '-id': ('id', True), 'title': ('title', False), '-title': ('title', True)}
+# ETag de una versión de las tareas: "v12", con sufijos para las otras representaciones ("v12-msgpack-gzip")
+VERSION_ETAG = re.compile(r"v([0-9]+)(?:-[a-z]+)*")
+
+
+class TaskIdConverter(BaseConverter):
+    """Id estable de una tarea ("t12"); un número solo es una posición (rutas antiguas)"""
+    regex = TASK_ID_PATTERN
+
+
+class CompactJSONProvider(DefaultJSONProvider):
+    """jsonify sin indentar (también con debug=True) y con orjson si TASKS_FAST_JSON está activo"""
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        if TASKS_FAST_JSON:
+            return dumps_json(obj, sort_keys=self.sort_keys).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
 
 app = Flask(__name__)
+app.json = CompactJSONProvider(app)
+app.url_map.converters['task_id'] = TaskIdConverter
+store = create_store(TASKS_STORAGE, TASKS_FILE, TASKS_DB, TASKS_JOURNAL_MAX_BYTES, TASKS_JOURNAL_FSYNC,
+                     TASKS_FILE_FORMAT)
+task_events = TaskEventLog(TASKS_EVENTS_FILE, TASKS_EVENTS_MAX_BYTES)
+
+# Envío de eventos al servicio de logs: en lotes y en segundo plano (event_shipper.py)
+LOG_SERVICE_URL = os.environ.get("LOG_SERVICE_URL", "http://localhost:5003/log")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))  # Eventos en espera antes de descartar
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 200))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 1.0))  # Segundos máximos antes de enviar un lote
+LOG_SPILL_DIR = os.environ.get("LOG_SPILL_DIR", os.path.dirname(os.path.abspath(__file__)))
+LOG_SPILL_MAX_BYTES = int(os.environ.get("LOG_SPILL_MAX_BYTES", 16 * 1024 * 1024))
+
+event_shipper = EventShipper(LOG_SERVICE_URL, LOG_SPILL_DIR, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                             flush_interval=LOG_FLUSH_INTERVAL, spill_max_bytes=LOG_SPILL_MAX_BYTES, source="app")
+atexit.register(event_shipper.close)
+
+
+def after_fork():
+    """Estado propio de cada worker de serve.py: lo llama el hook post_fork en el proceso hijo"""
+    store.after_fork()
+    task_events.after_fork()
+    event_shipper.after_fork()
+
+
+def worker_stopping():
+    """El worker se detiene: los streams de eventos terminan para no demorar su salida"""
+    task_events.close()
+
 
 # Función para registrar eventos en el servicio de logs
 def log_event(message):
-    try:
-        requests.post("http://localhost:5003/log", json={"message": message}, timeout=1)
-    except:
-        # Si falla el servicio de logs, no interrumpir la operación principal
-        pass
+    # Solo encola el evento: la solicitud no espera al servicio de logs
+    event_shipper.emit(message)
+
+def publish_changes(version, changes):
+    """Publica los cambios de una escritura para GET /api/tasks/events (en todas las instancias)"""
+    if changes:
+        task_events.publish(version, changes)
+
+
+def task_change(op, task):
+    """Cambio compacto: la tarea completa al crearla; al completarla o borrarla basta con el id"""
+    return {"op": "add", "task": task} if op == "add" else {"op": op, "id": task['id']}
+
 
 def load_tasks():
     """
-    Carga las tareas desde el archivo JSON. Si el archivo no existe o tiene un formato incorrecto, retorna una lista vacía.
-    Filtra las tareas que no contienen el campo 'title' y asegura que todas tengan 'completed'.
+    Carga las tareas desde el motor de almacenamiento configurado.
+    """
+    return store.list()
+
+
+def if_match_version():
+    """
+    Versión exigida por el encabezado If-Match de la API (p. ej. If-Match: "v12" o "v12-gzip").
+    Retorna None si no hay precondición; un ETag que no es de esta API no coincide con ninguna versión.
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    tags = request.if_match.as_set()
+    if len(tags) == 1:
+        match = VERSION_ETAG.fullmatch(tags.pop())
+        if match:
+            return int(match.group(1))
+    return -1
+
+
+def form_version():
+    """Versión de las tareas con la que se generó la página, enviada por los formularios web"""
+    version = request.form.get('version', '')
+    return int(version) if version.isdigit() else None
+
+
+def list_query(args):
+    """
+    Parámetros de un listado paginado (?limit=&after=&completed=&prefix=&sort=&fields=).
+    Retorna (argumentos para store.page, campos a incluir); lanza ValueError si alguno es inválido.
+    """
+    if args.get('sort', 'id') not in SORTS:
+        raise ValueError(f"sort debe ser uno de: {', '.join(SORTS)}")
+    sort, descending = SORTS[args.get('sort', 'id')]
+    after = args.get('after')
+    return {
+        'limit': query_limit(args),
+        'after': decode_cursor(sort, after) if after else None,
+        'sort': sort,
+        'descending': descending,
+        'completed': query_completed(args),
+        'prefix': args.get('prefix') or None,
+    }, query_fields(args)
+
+
+def search_query(args):
+    """
+    Parámetros de una búsqueda (?q=&limit=&completed=&fields=).
+    Retorna (argumentos para store.search, campos a incluir); lanza ValueError si alguno es inválido.
+    """
+    clauses = parse_query(args.get('q', ''))
+    if not clauses:
+        raise ValueError("q debe tener al menos un término")
+    if len(clauses) > TASKS_SEARCH_MAX_TERMS:
+        raise ValueError(f"q admite hasta {TASKS_SEARCH_MAX_TERMS} términos")
+    return {
+        'clauses': clauses,
+        'limit': query_limit(args),
+        'completed': query_completed(args),
+    }, query_fields(args)
+
+
+def query_limit(args):
+    limit = args.get('limit', str(TASKS_PAGE_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= TASKS_MAX_PAGE_SIZE:
+        raise ValueError(f"limit debe ser un número entre 1 y {TASKS_MAX_PAGE_SIZE}")
+    return int(limit)
+
+
+def query_completed(args):
+    completed = args.get('completed')
+    if completed not in (None, 'true', 'false'):
+        raise ValueError("completed debe ser true o false")
+    return None if completed is None else completed == 'true'
+
+
+def query_fields(args):
+    fields = args.get('fields')
+    fields = tuple(fields.split(',')) if fields else TASK_FIELDS
+    unknown = set(fields) - set(TASK_FIELDS)
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    return fields
+
+
+# Operación de la API de lotes -> operación del almacenamiento
+BATCH_OPS = {'create': 'add', 'complete': 'complete', 'delete': 'delete'}
+
+
+def parse_batch(items):
+    """
+    Valida todas las operaciones de un lote antes de aplicar ninguna.
+    Retorna (operaciones para store.apply_batch, errores con la posición de cada operación inválida).
     """
-    if not os.path.exists(TASKS_FILE):
-        return []  # Si no existe el archivo, retornamos una lista vacía
+    operations, errors = [], []
+    for position, item in enumerate(items):
+        op = item.get('op') if isinstance(item, dict) else None
+        if op not in BATCH_OPS:
+            errors.append({"index": position, "error": "op debe ser create, complete o delete"})
+        elif op == 'create':
+            title = item.get('title')
+            if isinstance(title, str) and title.strip():
+                operations.append({"op": "add", "title": title})
+            else:
+                errors.append({"index": position, "error": "El título de la tarea es requerido"})
+        else:
+            task_id = item.get('id')
+            if isinstance(task_id, str) and re.fullmatch(TASK_ID_PATTERN, task_id):
+                operations.append({"op": BATCH_OPS[op], "id": task_id})
+            else:
+                errors.append({"index": position, "error": "id de tarea inválido"})
+    return operations, errors
+
+
+# Representaciones de las tareas que se pueden pedir con Accept
+PAYLOAD_MIMETYPES = (JSON_MIMETYPE,) + (MSGPACK_MIMETYPES if msgpack is not None else ())
+
+
+def payload_mimetype():
+    return request.accept_mimetypes.best_match(PAYLOAD_MIMETYPES, default=JSON_MIMETYPE)
 
-    with open(TASKS_FILE, "r") as file:
+
+def payload_etag(version, mimetype, gzipped=False):
+    """ETag fuerte de una representación: cada formato y cada codificación tienen bytes distintos"""
+    etag = f"v{version}-msgpack" if mimetype in MSGPACK_MIMETYPES else f"v{version}"
+    return f"{etag}-gzip" if gzipped else etag
+
+
+def task_payload(data, version, status=200):
+    """
+    Respuesta con tareas en la representación pedida en Accept (JSON o MessagePack), comprimida con
+    gzip si es grande y el cliente lo acepta, y con el ETag de la versión.
+    """
+    mimetype = payload_mimetype()
+    if mimetype in MSGPACK_MIMETYPES:
+        body = dumps_msgpack(data)
+    else:
+        body = dumps_json(data, sort_keys=True, fast=TASKS_FAST_JSON)
+    response = app.response_class(body, status=status, mimetype=mimetype)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    gzipped = len(body) >= TASKS_GZIP_MIN_BYTES and bool(request.accept_encodings['gzip'])
+    if gzipped:
+        response.set_data(gzip.compress(body, TASKS_GZIP_LEVEL))
+        response.content_encoding = 'gzip'
+    response.set_etag(payload_etag(version, mimetype, gzipped))
+    return response
+
+
+def not_modified(etags):
+    """Respuesta 304 si el cliente ya tiene alguno de los ETags (If-None-Match), o None"""
+    for etag in etags:
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+    return None
+
+
+def payload_not_modified():
+    """
+    304 si el cliente ya tiene la versión actual en la representación que pide, o None. Solo consulta
+    la versión del almacenamiento: no se leen ni serializan las tareas.
+    """
+    if not request.if_none_match:
+        return None
+    version, mimetype = store.version(), payload_mimetype()
+    etags = [payload_etag(version, mimetype)]
+    if request.accept_encodings['gzip']:
+        etags.append(payload_etag(version, mimetype, gzipped=True))
+    response = not_modified(etags)
+    if response is not None:
+        response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+
+def with_etag(response, version):
+    response.set_etag(f"v{version}")
+    return response
+
+
+def precondition_failed(conflict):
+    """El If-Match del cliente no coincide con la versión actual de las tareas"""
+    response = jsonify({
+        "error": "Las tareas cambiaron; vuelve a leerlas e intenta de nuevo",
+        "version": conflict.current_version
+    })
+    return with_etag(response, conflict.current_version), 412
+
+
+def write_at_index(index, expected_version, write):
+    """
+    Aplica write(id, versión esperada) a la tarea en la posición 'index' (rutas antiguas).
+    La escritura exige la versión en la que se resolvió la posición: si otra escritura se cuela en
+    medio, la posición se vuelve a resolver, salvo que el cliente haya pedido una versión concreta.
+    """
+    while True:
+        version, task_id = store.id_at(index)
+        check_version(version, expected_version)
+        if task_id is None:
+            return None, version
         try:
-            tasks = json.load(file)  # Cargamos las tareas desde el archivo
-            valid_tasks = []
-            for task in tasks:
-                if isinstance(task, dict) and 'title' in task:
-                    if 'completed' not in task:
-                        task['completed'] = False  # Si no tiene 'completed', lo agregamos como False
-                    valid_tasks.append(task)
-            return valid_tasks
-        except json.JSONDecodeError:
-            return []  # Si hay un error al decodificar, retornamos una lista vacía
+            return write(task_id, version)
+        except VersionConflict:
+            if expected_version is not None:
+                raise
+
 
+def stale_form():
+    """El formulario se generó con una versión anterior: el índice puede apuntar a otra tarea"""
+    return (
+        "Las tareas cambiaron desde que se cargó la página. "
+        f"<a href=\"{url_for('index')}\">Recarga la lista</a> e intenta de nuevo."
+    ), 409
 
-def save_tasks(tasks):
+
+# El ETag de la página incluye un hash de la plantilla, para que un cambio en ella no deje copias viejas
+with open(os.path.join(app.root_path, 'templates', 'index.html'), 'rb') as template_file:
+    INDEX_TEMPLATE_HASH = hashlib.sha1(template_file.read()).hexdigest()[:8]
+
+
+def index_etag(version):
     """
-    Guarda las tareas en el archivo JSON.
+    ETag de la página de una versión. La página muestra el puerto de request.host (y en fallas, un
+    color que depende de él): detrás del balanceador, cada backend renderiza bytes distintos y un
+    backend no debe responder 304 a la copia que renderizó otro.
     """
-    with open(TASKS_FILE, "w") as file:
-        json.dump(tasks, file, indent=4)  # Guardamos las tareas con una indentación para legibilidad
+    host = hashlib.sha1(request.host.encode()).hexdigest()[:8]
+    return f"v{version}-html-{INDEX_TEMPLATE_HASH}-{host}"
 
 
 # Ruta principal - Muestra la interfaz de usuario
 @app.route('/')
 def index():
-    tasks = load_tasks()
+    # Si el navegador ya tiene la página de esta versión, no se lee ni se renderiza nada
+    if request.if_none_match:
+        response = not_modified([index_etag(store.version())])
+        if response is not None:
+            return response
+
+    # La página muestra TASKS_WEB_PAGE_SIZE tareas a partir del cursor ?after= (o antes de ?before=)
+    after, before = request.args.get('after'), request.args.get('before')
+    try:
+        if before:
+            version, tasks, more = store.page(TASKS_WEB_PAGE_SIZE, decode_cursor('id', before), descending=True)
+            tasks = tasks[::-1]
+            has_previous, has_next = more, True
+        else:
+            version, tasks, more = store.page(TASKS_WEB_PAGE_SIZE, decode_cursor('id', after) if after else None)
+            has_previous, has_next = bool(after), more
+    except ValueError:
+        return redirect(url_for('index'))
+
+    previous_cursor = next_cursor = None
+    if tasks:
+        previous_cursor = encode_cursor('id', sort_key('id', tasks[0])) if has_previous else None
+        next_cursor = encode_cursor('id', sort_key('id', tasks[-1])) if has_next else None
+    elif has_previous or before:
+        # La página quedó vacía (p. ej. se borraron sus tareas): volver al inicio
+        return redirect(url_for('index'))
     # Definir un color según el puerto
     background_color = "#e6f7ff" if request.host.endswith('5001') else "#ffe6e6"
-    return render_template('index.html', tasks=tasks, background_color=background_color)
+    response = app.make_response(render_template('index.html', tasks=tasks, background_color=background_color,
+                                                 previous_cursor=previous_cursor, next_cursor=next_cursor,
+                                                 version=version))
+    response.set_etag(index_etag(version))
+    return response
 
 
 # API - Información del servidor
@@ -66,112 +394,307 @@ def index():
 def server_info():
     return jsonify({
         'server_port': request.host.split(':')[1],
+        'pid': os.getpid(),
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     })
 
+# Estado del envío de eventos al servicio de logs
+@app.route('/log/stats')
+def log_stats():
+    return jsonify(event_shipper.stats())
+
+# Estado de los eventos de cambios de las tareas (GET /api/tasks/events)
+@app.route('/events/stats')
+def task_events_stats():
+    return jsonify(task_events.stats())
+
 # Endpoint para health check
 @app.route("/health", methods=["GET"])
 def health_check():
     """Endpoint para verificar si el servidor está activo"""
     return jsonify({"status": "ok"}), 200
 
-# API - Obtener todas las tareas
+# API - Obtener las tareas: sin parámetros, la lista completa; con parámetros, una página
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    tasks = load_tasks()
-    return jsonify(tasks)
+    # Lectura condicional (If-None-Match): 304 sin leer las tareas si la versión no cambió
+    if not request.args:
+        response = payload_not_modified()
+        if response is not None:
+            return response
+        version, tasks = store.read()
+        return task_payload(tasks, version)
+
+    try:
+        query, fields = list_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = payload_not_modified()
+    if response is not None:
+        return response
+    version, tasks, more = store.page(**query)
+    next_cursor = encode_cursor(query['sort'], sort_key(query['sort'], tasks[-1])) if more else None
+    return task_payload({
+        "tasks": [{field: task[field] for field in fields} for task in tasks],
+        "next_cursor": next_cursor
+    }, version)
 
 
 # API - Agregar una nueva tarea
 @app.route('/api/tasks', methods=['POST'])
 def add_task():
-    tasks = load_tasks()
     data = request.json
 
     if 'title' in data:
-        new_task = {'title': data['title'], 'completed': False}
-        tasks.append(new_task)
-        save_tasks(tasks)
+        try:
+            new_task, version = store.add(data['title'], if_match_version())
+        except VersionConflict as conflict:
+            return precondition_failed(conflict)
+        publish_changes(version, [task_change("add", new_task)])
         # Registrar el evento
         log_event(f"API: Nueva tarea añadida: {data['title']}")
-        return jsonify(new_task), 201
+        return with_etag(jsonify(new_task), version), 201
     return jsonify({"error": "El título de la tarea es requerido"}), 400
 
 
-# API - Marcar una tarea como completada
-@app.route('/api/tasks/<int:task_id>/complete', methods=['PUT'])
-def complete_task(task_id):
-    tasks = load_tasks()
+# API - Aplicar un lote de operaciones con una sola escritura
+@app.route('/api/tasks/batch', methods=['POST'])
+def batch_tasks():
+    data = request.get_json(silent=True)
+    items = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Se requiere una lista 'operations' con al menos una operación"}), 400
+    if len(items) > TASKS_BATCH_MAX:
+        return jsonify({"error": f"El lote supera el máximo de {TASKS_BATCH_MAX} operaciones"}), 413
 
-    if 0 <= task_id < len(tasks):
-        tasks[task_id]['completed'] = True
-        save_tasks(tasks)
+    operations, errors = parse_batch(items)
+    if errors:
+        return jsonify({"error": "Hay operaciones inválidas; no se aplicó ninguna", "errors": errors[:100]}), 400
+
+    try:
+        tasks, version = store.apply_batch(operations, if_match_version())
+    except VersionConflict as conflict:
+        return precondition_failed(conflict)
+    publish_changes(version, [task_change(operation['op'], task)
+                              for operation, task in zip(operations, tasks) if task is not None])
+
+    results, counts = [], {op: 0 for op in BATCH_OPS}
+    for item, task in zip(items, tasks):
+        if task is None:
+            results.append({"status": 404, "error": "Tarea no encontrada"})
+        else:
+            counts[item['op']] += 1
+            results.append({"status": 201 if item['op'] == 'create' else 200, "task": task})
+    # Un solo evento por lote en lugar de uno por tarea
+    log_event(f"API: Lote de {len(items)} operaciones: {counts['create']} creadas, "
+              f"{counts['complete']} completadas, {counts['delete']} eliminadas")
+    return task_payload({"results": results, "version": version}, version)
+
+
+# API - Buscar tareas por el texto del título (?q=revisar+inf*), de la más a la menos relevante
+@app.route('/api/tasks/search', methods=['GET'])
+def search_tasks():
+    try:
+        query, fields = search_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = payload_not_modified()
+    if response is not None:
+        return response
+    version, tasks = store.search(**query)
+    return task_payload({"tasks": [{field: task[field] for field in fields} for task in tasks]}, version)
+
+
+# API - Cambios de las tareas en tiempo real (Server-Sent Events), hechos por cualquier instancia
+@app.route('/api/tasks/events', methods=['GET'])
+def task_events_stream():
+    # Al reconectarse, EventSource envía Last-Event-ID; la página pasa ?since= con la versión que muestra
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since', '')
+    if task_events.stats()["subscribers"] >= TASKS_EVENTS_MAX_CLIENTS:
+        response = jsonify({"error": "Demasiadas conexiones de eventos abiertas"})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+    subscription = task_events.subscribe(int(last_event_id) if last_event_id.isdigit() else None)
+
+    def stream():
+        try:
+            yield b"retry: 3000\n\n"  # Espera de EventSource antes de reconectarse
+            yield from subscription.frames(TASKS_EVENTS_HEARTBEAT)
+        finally:
+            task_events.unsubscribe(subscription)
+
+    response = app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Que un proxy intermedio no acumule los eventos
+    return response
+
+
+# API - Obtener una tarea por su id
+@app.route('/api/tasks/<task_id:task_id>', methods=['GET'])
+def get_task(task_id):
+    response = payload_not_modified()
+    if response is not None:
+        return response
+    version, task = store.get(task_id)
+    if task is None:
+        return jsonify({"error": "Tarea no encontrada"}), 404
+    return task_payload(task, version)
+
+
+def complete_response(write):
+    try:
+        task, version = write()
+    except VersionConflict as conflict:
+        return precondition_failed(conflict)
+
+    if task is not None:
+        publish_changes(version, [task_change("complete", task)])
         # Registrar el evento
-        log_event(f"API: Tarea completada: {tasks[task_id]['title']}")
-        return jsonify(tasks[task_id])
+        log_event(f"API: Tarea completada: {task['title']}")
+        return with_etag(jsonify(task), version)
     return jsonify({"error": "Tarea no encontrada"}), 404
 
 
-# API - Eliminar una tarea
-@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
-def delete_task(task_id):
-    tasks = load_tasks()
+def delete_response(write):
+    try:
+        deleted_task, version = write()
+    except VersionConflict as conflict:
+        return precondition_failed(conflict)
 
-    if 0 <= task_id < len(tasks):
-        deleted_task = tasks.pop(task_id)
-        save_tasks(tasks)
+    if deleted_task is not None:
+        publish_changes(version, [task_change("delete", deleted_task)])
         # Registrar el evento
         log_event(f"API: Tarea eliminada: {deleted_task['title']}")
-        return jsonify(deleted_task)
+        return with_etag(jsonify(deleted_task), version)
     return jsonify({"error": "Tarea no encontrada"}), 404
 
 
+# API - Marcar una tarea como completada
+@app.route('/api/tasks/<task_id:task_id>/complete', methods=['PUT'])
+def complete_task(task_id):
+    return complete_response(lambda: store.complete(task_id, if_match_version()))
+
+
+# API - Eliminar una tarea
+@app.route('/api/tasks/<task_id:task_id>', methods=['DELETE'])
+def delete_task(task_id):
+    return delete_response(lambda: store.delete(task_id, if_match_version()))
+
+
+# API - Rutas antiguas por posición en la lista (compatibilidad)
+@app.route('/api/tasks/<int:index>/complete', methods=['PUT'])
+def complete_task_at(index):
+    return complete_response(lambda: write_at_index(index, if_match_version(), store.complete))
+
+
+@app.route('/api/tasks/<int:index>', methods=['DELETE'])
+def delete_task_at(index):
+    return delete_response(lambda: write_at_index(index, if_match_version(), store.delete))
+
+
 # Rutas web para interacción desde el navegador
 @app.route('/tasks/add', methods=['POST'])
 def web_add_task():
-    tasks = load_tasks()
     title = request.form.get('title')
 
     if title:
-        new_task = {'title': title, 'completed': False}
-        tasks.append(new_task)
-        save_tasks(tasks)
+        task, version = store.add(title)
+        publish_changes(version, [task_change("add", task)])
         # Registrar el evento
         log_event(f"WEB: Nueva tarea añadida: {title} (servidor {request.host})")
 
     return redirect(url_for('index'))
 
 
-@app.route('/tasks/<int:task_id>/complete', methods=['POST'])
-def web_complete_task(task_id):
-    tasks = load_tasks()
+def web_complete(write):
+    try:
+        task, version = write()
+    except VersionConflict:
+        return stale_form()
 
-    if 0 <= task_id < len(tasks):
-        task_title = tasks[task_id]['title']
-        tasks[task_id]['completed'] = True
-        save_tasks(tasks)
+    if task is not None:
+        publish_changes(version, [task_change("complete", task)])
         # Registrar el evento
-        log_event(f"WEB: Tarea completada: {task_title} (servidor {request.host})")
+        log_event(f"WEB: Tarea completada: {task['title']} (servidor {request.host})")
 
     return redirect(url_for('index'))
 
 
-@app.route('/tasks/<int:task_id>/delete', methods=['POST'])
-def web_delete_task(task_id):
-    tasks = load_tasks()
+def web_delete(write):
+    try:
+        task, version = write()
+    except VersionConflict:
+        return stale_form()
 
-    if 0 <= task_id < len(tasks):
-        task_title = tasks[task_id]['title']
-        tasks.pop(task_id)
-        save_tasks(tasks)
+    if task is not None:
+        publish_changes(version, [task_change("delete", task)])
         # Registrar el evento
-        log_event(f"WEB: Tarea eliminada: {task_title} (servidor {request.host})")
+        log_event(f"WEB: Tarea eliminada: {task['title']} (servidor {request.host})")
 
     return redirect(url_for('index'))
 
 
+@app.route('/tasks/<task_id:task_id>/complete', methods=['POST'])
+def web_complete_task(task_id):
+    return web_complete(lambda: store.complete(task_id))
+
+
+@app.route('/tasks/<task_id:task_id>/delete', methods=['POST'])
+def web_delete_task(task_id):
+    return web_delete(lambda: store.delete(task_id))
+
+
+# Formularios antiguos por posición: envían la versión con la que se generó la página
+@app.route('/tasks/<int:index>/complete', methods=['POST'])
+def web_complete_task_at(index):
+    return web_complete(lambda: write_at_index(index, form_version(), store.complete))
+
+
+@app.route('/tasks/<int:index>/delete', methods=['POST'])
+def web_delete_task_at(index):
+    return web_delete(lambda: write_at_index(index, form_version(), store.delete))
+
+
+# Registro automático en el balanceador (opcional): BALANCER_URL=http://localhost:8080
+BALANCER_URL = os.environ.get("BALANCER_URL")
+BACKEND_WEIGHT = int(os.environ.get("BACKEND_WEIGHT", 1))
+# El mismo LB_ADMIN_TOKEN del balanceador; sin él, el balanceador solo acepta registros desde su máquina
+ADMIN_TOKEN = os.environ.get("LB_ADMIN_TOKEN", "")
+
+
+def register_with_balancer(backend_url):
+    """Se registra en el balanceador y programa la baja (con drenaje) al terminar el proceso"""
+    headers = {"X-Admin-Token": ADMIN_TOKEN} if ADMIN_TOKEN else {}
+    try:
+        response = requests.post(f"{BALANCER_URL}/admin/backends",
+                                 json={"url": backend_url, "weight": BACKEND_WEIGHT}, headers=headers, timeout=2)
+    except requests.RequestException as e:
+        print(f"No se pudo registrar en el balanceador: {e}")
+        return
+    if response.status_code != 201:
+        hint = "" if ADMIN_TOKEN else " (¿falta LB_ADMIN_TOKEN?)"
+        print(f"El balanceador rechazó el registro: {response.status_code} {response.text.strip()}{hint}")
+        return
+    print(f"Registrado en el balanceador {BALANCER_URL} como {backend_url}")
+
+    pid = os.getpid()
+
+    def deregister():
+        if os.getpid() != pid:
+            return  # Un worker de serve.py: la baja la da el proceso principal
+        try:
+            requests.delete(f"{BALANCER_URL}/admin/backends", json={"url": backend_url}, headers=headers, timeout=2)
+        except requests.RequestException:
+            pass
+
+    atexit.register(deregister)
+
+
 if __name__ == "__main__":
     # Determinar el puerto desde los argumentos de línea de comandos o usar 5000 por defecto
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
     print(f"Servidor iniciado en puerto: {port}")
+    # Con debug=True solo se registra el proceso que atiende solicitudes, no el del reloader
+    if BALANCER_URL and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        register_with_balancer(os.environ.get("BACKEND_URL", f"http://localhost:{port}"))
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,383 @@
+'''
+Motor asíncrono del balanceador basado en asyncio + aiohttp.
+
+Mantiene las mismas rutas (proxy de /<path>, /status, /metrics y /admin/backends), los circuit breakers por servidor y el
+encabezado X-Upstream-Server que el motor Flask, pero atiende miles de solicitudes concurrentes
+en un solo thread: mientras un backend lento responde, el event loop sigue atendiendo a los demás.
+
+Uso: python load_balancer.py async   (o LB_ENGINE=async python load_balancer.py)
+'''
+
+import asyncio
+import threading
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+import load_balancer as lb
+from response_cache import MUTATING_METHODS, etag_matches, with_if_none_match
+from retries import IDEMPOTENT_METHODS, is_connection_refused, is_retryable
+
+UPSTREAM_TIMEOUT = ClientTimeout(total=None, sock_connect=3, sock_read=3)
+EVENT_STREAM_TIMEOUT = ClientTimeout(total=None, sock_connect=3, sock_read=lb.EVENT_STREAM_TIMEOUT)
+HEALTH_TIMEOUT = ClientTimeout(total=2)
+
+
+async def check_server_health(session, server):
+    """Verificar si un servidor está activo"""
+    try:
+        async with session.get(f"{server}/health", timeout=HEALTH_TIMEOUT) as response:
+            await response.read()
+            return response.status == 200
+    except Exception as e:
+        lb.logger.warning(f"Error en health check para {server}: {str(e)}")
+        return False
+
+
+async def run_probe(session, semaphore, server):
+    async with semaphore:
+        is_healthy = await check_server_health(session, server)
+    lb.probe_scheduler.record(server, is_healthy)
+    lb.update_server_health(server, is_healthy)
+
+
+async def health_check_loop(app):
+    """Verifica el estado de los servidores en paralelo, con los intervalos adaptativos de probe_scheduler"""
+    session = app['session']
+    semaphore = asyncio.Semaphore(lb.HEALTH_CHECK_CONCURRENCY)
+    probes = set()  # Referencias a las tareas en curso para que no se recolecten antes de terminar
+    while True:
+        servers = lb.backend_registry.servers()
+        for server in lb.probe_scheduler.due(servers, time.time()):
+            task = asyncio.create_task(run_probe(session, semaphore, server))
+            probes.add(task)
+            task.add_done_callback(probes.discard)
+        # Despertar al menos cada segundo para atender servidores marcados como sospechosos
+        await asyncio.sleep(min(1.0, lb.probe_scheduler.seconds_until_next(servers, time.time())) or 0.05)
+
+
+async def forward_request(session, server, method, url, headers, params, body, timeout=UPSTREAM_TIMEOUT):
+    """Envía la solicitud a un backend y registra el resultado; retorna la respuesta con el cuerpo sin leer"""
+    lb.load_tracker.start(server)
+    started = time.time()
+    try:
+        resp = await session.request(
+            method,
+            url,
+            headers=headers,
+            params=params,
+            data=body,
+            allow_redirects=False,
+            timeout=timeout
+        )
+    except asyncio.CancelledError:
+        # El cliente se desconectó o era la copia perdedora de un hedge: no cuenta como fallo
+        lb.load_tracker.finish(server)
+        lb.breakers.get(server).release()
+        raise
+    except Exception as e:
+        # Un fallo cuenta como una muestra de latencia alta para la estrategia
+        lb.load_tracker.record_latency(server, time.time() - started)
+        lb.load_tracker.finish(server)
+        lb.logger.error(f"❌ Error al conectar con {server}: {str(e)}")
+        lb.breakers.get(server).record_failure(type(e).__name__)
+        lb.metrics.record_error(server, type(e).__name__)
+        raise
+
+    latency = time.time() - started
+    lb.load_tracker.record_latency(server, latency)
+    lb.latency_window.add(latency)
+    lb.metrics.observe_upstream(server, resp.status, latency)
+    lb.logger.info(f"✅ Solicitud exitosa a: {url}")
+
+    # Circuit breaker y detección pasiva: los fallos o respuestas lentas seguidas sacan al servidor
+    lb.record_outcome(server, resp.status, latency)
+    return resp
+
+
+def discard_upstream_response(server, resp):
+    """Cierra la respuesta de un backend que no se entregará al cliente"""
+    resp.close()
+    lb.load_tracker.finish(server)
+
+
+async def hedged_request(session, server, backups, tried, method, path, headers, params):
+    """
+    Envía una solicitud idempotente sin cuerpo a 'server' y, si no respondió tras el retardo de hedge,
+    una copia a uno de 'backups'; retorna (servidor, respuesta) de la primera que responda.
+    """
+    def send(target):
+        return asyncio.create_task(forward_request(session, target, method, f"{target}/{path}", headers, params, None))
+
+    tasks = {send(server): server}
+    winner = None
+    error = None
+    pending = set(tasks)
+    try:
+        done, _ = await asyncio.wait(pending, timeout=lb.hedge_delay())
+        if not done:
+            backup = lb.reserve_hedge_backup(backups, tried)
+            if backup:
+                task = send(backup)
+                tasks[task] = backup
+                pending.add(task)
+
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = (tasks[task], task.result())
+                else:
+                    discard_upstream_response(tasks[task], task.result())
+    finally:
+        # La copia que sigue en curso se cancela (también si el cliente se desconectó)
+        for task in pending:
+            task.cancel()
+
+    if winner is None:
+        raise error
+    if winner[0] != server:
+        lb.metrics.record_retry("hedge_win")
+    return winner
+
+
+def cached_response(request, cached, cache_status):
+    status, headers, body = cached.reply(request.headers.get('If-None-Match'))
+    response = web.Response(status=status, body=body)
+    for k, v in headers:
+        response.headers.add(k, v)
+    response.headers['X-Cache'] = cache_status
+    lb.metrics.record_response(status)
+    return response
+
+
+async def proxy(request):
+    path = request.match_info['path']
+
+    # Caché de respuestas para las rutas de lectura
+    route = f"/{path}"
+    cache_ttl = lb.response_cache.ttl_for(request.method, route)
+    cache_key = stale = None
+    if cache_ttl:
+        cache_key = lb.response_cache.key(request.method, route, request.query_string.encode('latin-1'), request.headers)
+        cached = lb.response_cache.get(cache_key)
+        if cached is not None:
+            # 304 si el cliente ya tiene la versión guardada (If-None-Match)
+            return cached_response(request, cached, 'HIT')
+        cache_generation = lb.response_cache.generation
+        # Una copia vencida con ETag se revalida con el backend en lugar de pedir el cuerpo otra vez
+        stale = lb.response_cache.stale(cache_key)
+    elif request.method in MUTATING_METHODS:
+        # Invalidar antes de la escritura descarta también las lecturas que están en camino
+        lb.response_cache.invalidate()
+
+    active_servers = lb.get_active_servers()
+    lb.retry_budget.record_request()
+
+    # Intentar con cada servidor hasta encontrar uno que funcione
+    method = request.method
+    session = request.app['session']
+    last_error = None
+    tried = set()
+
+    for server in active_servers:
+        if server in tried:
+            continue
+        if tried and not is_retryable(method, last_error):
+            # Una solicitud no idempotente pudo haberse procesado: repetirla podría duplicarla
+            lb.logger.error(f"❌ {method} a {server} no se reintenta: {str(last_error)}")
+            lb.metrics.record_response(502)
+            return web.Response(
+                text="El servidor backend falló y la solicitud no se reintentó para evitar duplicarla.",
+                status=502
+            )
+
+        # En HALF_OPEN solo pasa un número limitado de solicitudes de prueba
+        breaker = lb.breakers.get(server)
+        if not breaker.allow_request():
+            continue
+        if tried and not lb.spend_retry("retry"):
+            breaker.release()
+            break
+        tried.add(server)
+
+        headers = {
+            k: v for k, v in request.headers.items()
+            if k.lower() != 'host' and k.lower() not in lb.HOP_BY_HOP_HEADERS
+        }
+        if stale is not None:
+            headers = with_if_none_match(headers, stale.etag)
+        # El cuerpo se reenvía por bloques directamente desde el socket del cliente
+        body = request.content if request.body_exists else None
+
+        try:
+            if lb.accepts_event_stream(request.headers):
+                # Un stream de eventos (SSE) no se duplica con hedging y puede pasar hasta
+                # EVENT_STREAM_TIMEOUT sin datos
+                resp = await forward_request(session, server, method, f"{server}/{path}", headers, request.query, body,
+                                             EVENT_STREAM_TIMEOUT)
+            elif lb.HEDGE_ENABLED and method in IDEMPOTENT_METHODS and body is None:
+                # Si el backend tarda más que el percentil configurado, se envía una copia a otro
+                backups = [s for s in active_servers if s not in tried]
+                server, resp = await hedged_request(session, server, backups, tried, method, path, headers, request.query)
+            else:
+                resp = await forward_request(session, server, method, f"{server}/{path}", headers, request.query, body)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            last_error = e
+
+            # Un cuerpo ya enviado parcialmente no puede repetirse en otro servidor (total_bytes cuenta lo
+            # recibido del cliente; si la conexión fue rechazada, todavía no se leyó nada)
+            if body is not None and body.total_bytes > 0 and not is_connection_refused(e):
+                lb.metrics.record_response(502)
+                return web.Response(text="El servidor backend falló mientras recibía la solicitud.", status=502)
+            # Continuar con el siguiente servidor
+            continue
+
+        event_stream = False
+        try:
+            if stale is not None and resp.status == 304 and etag_matches(stale.etag, resp.headers.get('ETag')):
+                # La copia vencida sigue vigente: se renueva y se responde desde la caché
+                lb.response_cache.revalidate(cache_key, stale, cache_ttl, cache_generation)
+                return cached_response(request, stale, 'REVALIDATED')
+
+            if method in MUTATING_METHODS:
+                lb.response_cache.invalidate()
+
+            if lb.is_event_stream(resp.headers.get('Content-Type')):
+                # Un stream de eventos puede durar horas: no cuenta como solicitud en curso para el balanceo
+                event_stream = True
+                lb.load_tracker.finish(server)
+
+            upstream_headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in lb.HOP_BY_HOP_HEADERS]
+            cache_writer = None
+            if cache_key is not None:
+                cache_headers = [(k, v) for k, v in upstream_headers if k.lower() != 'content-length']
+                cache_headers.append(('X-Upstream-Server', server))
+                cache_writer = lb.response_cache.writer(
+                    cache_key, cache_ttl, cache_generation, resp.status, cache_headers
+                )
+
+            response = web.StreamResponse(status=resp.status)
+            for k, v in upstream_headers:
+                response.headers.add(k, v)
+
+            # Agregar un encabezado personalizado que indica qué servidor atendió la solicitud
+            response.headers['X-Upstream-Server'] = server
+            if cache_key is not None:
+                response.headers['X-Cache'] = 'MISS'
+
+            lb.metrics.record_response(resp.status)
+            await response.prepare(request)
+            async for chunk in resp.content.iter_chunked(lb.STREAM_CHUNK_SIZE):
+                if cache_writer:
+                    cache_writer.write(chunk)
+                await response.write(chunk)
+            await response.write_eof()
+
+            # Solo una respuesta transmitida completa se guarda en la caché
+            if cache_writer:
+                cache_writer.commit()
+            return response
+        except ConnectionResetError:
+            if event_stream:
+                return response  # El cliente cerró el stream de eventos: es la forma normal de terminar
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # La respuesta ya comenzó a enviarse al cliente: no se puede cambiar de servidor
+            lb.logger.error(f"❌ Error durante la transmisión desde {server}: {str(e)}")
+            raise
+        finally:
+            # Si el cliente se desconectó, la conexión con el backend se cierra en lugar de volver al pool
+            resp.release()
+            if not event_stream:
+                lb.load_tracker.finish(server)
+
+    # Si llegamos aquí, todos los servidores intentados fallaron (o se agotó el presupuesto de reintentos)
+    lb.logger.critical(f"TODOS LOS SERVIDORES FALLARON. Último error: {str(last_error)}")
+    lb.metrics.record_response(503)
+    return web.Response(
+        text="No se pudo completar la solicitud. Todos los servidores están caídos o no responden.",
+        status=503
+    )
+
+
+async def server_status(request):
+    """Endpoint para verificar el estado de los servidores"""
+    return web.Response(text=lb.render_status_html(), content_type='text/html')
+
+
+async def metrics_endpoint(request):
+    """Métricas en formato de texto de Prometheus"""
+    return web.Response(text=lb.render_metrics(), content_type='text/plain')
+
+
+async def admin_backends(request):
+    """API de administración para registrar y quitar backends"""
+    payload = None
+    if request.body_exists:
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+    body, status = lb.handle_admin_backends(request.method, payload, request.headers.get('X-Admin-Token'),
+                                            request.remote)
+    return web.json_response(body, status=status)
+
+
+async def on_startup(app):
+    # auto_decompress=False: los cuerpos se reenvían tal como llegan, con su Content-Encoding
+    app['session'] = ClientSession(
+        connector=TCPConnector(limit=0, keepalive_timeout=lb.POOL_IDLE_TIMEOUT),
+        auto_decompress=False
+    )
+
+    # Verificar servidores al inicio (en paralelo)
+    lb.logger.info("Verificando servidores al inicio...")
+    servers = lb.probe_scheduler.due(lb.backend_registry.servers(), float("inf"))
+    results = await asyncio.gather(*(check_server_health(app['session'], s) for s in servers))
+    for server, is_healthy in zip(servers, results):
+        lb.probe_scheduler.record(server, is_healthy)
+        if is_healthy:
+            lb.logger.info(f"✅ Servidor {server} activo")
+        else:
+            lb.breakers.get(server).force_open("no responde al inicio")
+            lb.logger.warning(f"❌ Servidor {server} no responde al inicio")
+
+    app['health_task'] = asyncio.create_task(health_check_loop(app))
+
+    # La vigilancia del archivo de backends solo hace E/S local y puede correr en un thread
+    threading.Thread(target=lb.registry_watch_loop, daemon=True).start()
+
+
+async def on_cleanup(app):
+    app['health_task'].cancel()
+    await app['session'].close()
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_get('/status', server_status)
+    app.router.add_get('/metrics', metrics_endpoint)
+    for method in ('GET', 'POST', 'DELETE'):
+        app.router.add_route(method, '/admin/backends', admin_backends)
+    for method in ('GET', 'HEAD', 'POST', 'PUT', 'DELETE'):
+        app.router.add_route(method, '/{path:.*}', proxy)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main():
+    lb.logger.info("Balanceador de carga (motor asíncrono) iniciado en http://localhost:8080")
+    lb.logger.info("Puedes verificar el estado de los servidores en http://localhost:8080/status")
+    web.run_app(create_app(), host='0.0.0.0', port=8080, print=None)
+
+
+if __name__ == '__main__':
+    main()
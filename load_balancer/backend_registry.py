@@ -0,0 +1,144 @@
+'''
+Registro dinámico de servidores backend del balanceador.
+
+Los backends provienen de dos fuentes:
+- el archivo de configuración (servers.json), que se vuelve a leer cuando cambia, y
+- las instancias que se registran a sí mismas a través de la API de administración.
+
+Un backend que se quita no se elimina de golpe: pasa a "drenando", deja de recibir solicitudes
+nuevas y se elimina cuando terminan las que tenía en curso.
+'''
+
+import json
+import os
+import threading
+import time
+
+
+class BackendRegistry:
+    """Lista de backends activos y en drenaje, segura para usar desde varios threads"""
+
+    def __init__(self, config_file, default_servers, weights, on_removed=None, logger=None):
+        self.config_file = config_file
+        self.default_servers = list(default_servers)
+        self.weights = weights  # Diccionario compartido con la estrategia de balanceo
+        self.default_weights = dict(weights)  # Pesos de LB_SERVER_WEIGHTS, para entradas sin "weight"
+        self.on_removed = on_removed
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._file_backends = {}  # url -> peso
+        self._registered = {}  # url -> peso
+        self._draining = {}  # url -> momento en que empezó el drenaje
+        self._servers = []
+        self._mtime = None
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(message)
+
+    def _rebuild(self):
+        """Recalcula la lista de servidores activos y los pesos (con el lock tomado)"""
+        previous = set(self._servers)
+        merged = dict(self._file_backends)
+        merged.update(self._registered)
+        self._servers = list(merged)
+        for url, weight in merged.items():
+            self.weights[url] = weight
+            self._draining.pop(url, None)
+        for url in previous - set(merged):
+            self._draining[url] = time.time()
+            self._log(f"🔻 Backend {url} quitado: drenando solicitudes en curso")
+        for url in set(merged) - previous:
+            self._log(f"🔺 Backend {url} agregado (peso {merged[url]})")
+
+    def load_file(self):
+        """Lee el archivo de configuración si cambió; retorna True si se recargó"""
+        try:
+            mtime = os.stat(self.config_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        with self._lock:
+            if mtime == self._mtime and self._servers:
+                return False
+            self._mtime = mtime
+
+            if mtime is None:
+                backends = {url: self.default_weights.get(url, 1) for url in self.default_servers}
+            else:
+                try:
+                    with open(self.config_file, "r") as file:
+                        config = json.load(file)
+                    backends = {}
+                    for entry in config.get("backends", []):
+                        url = entry["url"].rstrip("/")
+                        backends[url] = int(entry.get("weight", self.default_weights.get(url, 1)))
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                    # Un archivo a medio escribir o inválido no debe vaciar la lista de backends
+                    if self.logger:
+                        self.logger.error(f"Configuración de backends inválida en {self.config_file}: {e}")
+                    return False
+
+            self._file_backends = backends
+            self._rebuild()
+        self._log(f"Backends cargados desde {self.config_file}: {', '.join(self._servers) or 'ninguno'}")
+        return True
+
+    def register(self, url, weight=1):
+        url = url.rstrip("/")
+        with self._lock:
+            self._registered[url] = int(weight)
+            self._rebuild()
+
+    def deregister(self, url):
+        """Quita un backend registrado por la API; retorna False si no estaba registrado"""
+        url = url.rstrip("/")
+        with self._lock:
+            if url not in self._registered:
+                return False
+            del self._registered[url]
+            self._rebuild()
+            return True
+
+    def servers(self):
+        """Backends que pueden recibir solicitudes nuevas"""
+        with self._lock:
+            return list(self._servers)
+
+    def draining(self):
+        with self._lock:
+            return dict(self._draining)
+
+    def finish_drained(self, outstanding):
+        """Elimina definitivamente los backends en drenaje que ya no tienen solicitudes en curso"""
+        with self._lock:
+            done = [url for url in self._draining if outstanding(url) == 0]
+            for url in done:
+                del self._draining[url]
+                self.weights.pop(url, None)
+        for url in done:
+            self._log(f"Backend {url} drenado y eliminado")
+            if self.on_removed:
+                self.on_removed(url)
+
+    def snapshot(self):
+        with self._lock:
+            backends = []
+            for url in self._servers:
+                source = "registro" if url in self._registered else "archivo"
+                backends.append({"url": url, "weight": self.weights.get(url, 1), "source": source, "state": "active"})
+            for url, since in self._draining.items():
+                backends.append({"url": url, "state": "draining", "draining_for": int(time.time() - since)})
+            return backends
+
+    def watch(self, poll_interval, outstanding):
+        """Bucle que recarga el archivo cuando cambia y termina los drenajes"""
+        while True:
+            time.sleep(poll_interval)
+            try:
+                self.load_file()
+                self.finish_drained(outstanding)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error al actualizar el registro de backends: {e}")
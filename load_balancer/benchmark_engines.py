@@ -0,0 +1,154 @@
+'''
+Benchmark que compara los motores del balanceador (Flask vs asyncio).
+
+Levanta dos backends simulados en los puertos 5001 y 5002 (con una latencia fija por solicitud),
+inicia cada motor del balanceador en el puerto 8080 y mide throughput y latencias con distintos
+niveles de concurrencia.
+
+Uso:
+    python benchmark_engines.py [--requests 2000] [--concurrency 10,100,1000] [--delay 0.05]
+'''
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BALANCER_URL = "http://localhost:8080"
+BACKEND_PORTS = (5001, 5002)
+
+
+def run_backend(port, delay):
+    """Backend simulado: responde /health y /api/tasks después de 'delay' segundos"""
+    body = b'[{"title": "tarea de prueba", "completed": false}]'
+
+    async def tasks(request):
+        await asyncio.sleep(delay)
+        return web.Response(body=body, content_type='application/json')
+
+    async def health(request):
+        return web.json_response({"status": "ok"})
+
+    app = web.Application()
+    app.router.add_get('/health', health)
+    app.router.add_get('/api/tasks', tasks)
+    web.run_app(app, host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+async def wait_until_ready(url, timeout=15):
+    deadline = time.time() + timeout
+    async with ClientSession() as session:
+        while time.time() < deadline:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except Exception:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió a tiempo")
+
+
+async def run_load(total, concurrency):
+    """Envía 'total' solicitudes GET /api/tasks con 'concurrency' solicitudes simultáneas"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = TCPConnector(limit=0, force_close=True)
+
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=60)) as session:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.get(f"{BALANCER_URL}/api/tasks") as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            errors += 1
+                            return
+                except Exception:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(0.50),
+        "p99": percentile(0.99),
+        "errors": errors,
+    }
+
+
+def start_process(args, workdir):
+    return subprocess.Popen(
+        [sys.executable] + args,
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', default='10,100,1000')
+    parser.add_argument('--delay', type=float, default=0.05, help='Latencia simulada del backend (segundos)')
+    parser.add_argument('--engines', default='flask,async')
+    parser.add_argument('--backend', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        run_backend(args.backend, args.delay)
+        return
+
+    # Los procesos escriben sus logs en un directorio temporal para no ensuciar el proyecto
+    workdir = tempfile.mkdtemp(prefix='lb-bench-')
+    script = os.path.abspath(__file__)
+    backends = [
+        start_process([script, '--backend', str(port), '--delay', str(args.delay)], workdir)
+        for port in BACKEND_PORTS
+    ]
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    try:
+        for port in BACKEND_PORTS:
+            asyncio.run(wait_until_ready(f"http://localhost:{port}/health"))
+
+        print(f"{'motor':<8}{'concurrencia':>14}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errores':>10}")
+        for engine in args.engines.split(','):
+            balancer = start_process([os.path.join(HERE, 'load_balancer.py'), engine], workdir)
+            try:
+                asyncio.run(wait_until_ready(f"{BALANCER_URL}/status"))
+                for concurrency in levels:
+                    result = asyncio.run(run_load(args.requests, concurrency))
+                    print(f"{engine:<8}{concurrency:>14}{result['rps']:>10.0f}{result['p50']:>10.1f}"
+                          f"{result['p99']:>10.1f}{result['errors']:>10}")
+            finally:
+                balancer.terminate()
+                balancer.wait()
+    finally:
+        for backend in backends:
+            backend.terminate()
+            backend.wait()
+
+
+if __name__ == '__main__':
+    main()
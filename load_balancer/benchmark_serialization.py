@@ -0,0 +1,85 @@
+'''
+Benchmark de los formatos de serialización de las tareas (serialization.py).
+
+Para cada cantidad de tareas mide el tamaño y el tiempo de codificar y decodificar el documento
+{"version", "next_id", "tasks"} en: JSON indentado (el formato anterior de tasks.json), JSON compacto
+con la librería estándar, JSON compacto con orjson, MessagePack y JSON compacto comprimido con gzip
+(como las respuestas grandes de la API). Los formatos cuyas librerías no están instaladas se omiten.
+
+Uso:
+    python benchmark_serialization.py [--sizes 1000,100000,1000000] [--gzip-level 5]
+'''
+
+import argparse
+import gzip
+import json
+import time
+
+from serialization import dumps_json, loads_json, msgpack, orjson
+
+
+def make_document(count):
+    tasks = [
+        {'id': f't{i + 1}', 'title': f'Tarea de prueba número {i + 1}', 'completed': i % 3 == 0}
+        for i in range(count)
+    ]
+    return {"version": count, "next_id": count + 1, "tasks": tasks}
+
+
+def formats(gzip_level):
+    """Nombre -> (codificar, decodificar)"""
+    result = {
+        "json indentado": (
+            lambda data: json.dumps(data, indent=4).encode('utf-8'),
+            json.loads,
+        ),
+        "json compacto": (
+            lambda data: dumps_json(data, fast=False),
+            json.loads,
+        ),
+    }
+    if orjson is not None:
+        result["json compacto (orjson)"] = (dumps_json, loads_json)
+    if msgpack is not None:
+        result["msgpack"] = (
+            lambda data: msgpack.packb(data, use_bin_type=True),
+            lambda raw: msgpack.unpackb(raw, raw=False),
+        )
+    result[f"json compacto + gzip {gzip_level}"] = (
+        lambda data: gzip.compress(dumps_json(data), gzip_level),
+        lambda raw: loads_json(gzip.decompress(raw)),
+    )
+    return result
+
+
+def measure(function, argument, repeat):
+    """Mejor tiempo (segundos) de 'repeat' ejecuciones, y el último resultado"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Cantidades de tareas separadas por comas")
+    parser.add_argument("--gzip-level", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'tareas':>9}  {'formato':<26} {'bytes':>12} {'codificar':>11} {'decodificar':>12}")
+    for count in [int(size) for size in args.sizes.split(",")]:
+        document = make_document(count)
+        repeat = max(1, min(20, 200000 // count))
+        for name, (encode, decode) in formats(args.gzip_level).items():
+            encode_time, raw = measure(encode, document, repeat)
+            decode_time, decoded = measure(decode, raw, repeat)
+            assert decoded == document
+            print(f"{count:>9}  {name:<26} {len(raw):>12,} {encode_time * 1000:>9.1f}ms {decode_time * 1000:>10.1f}ms")
+        print()
+
+
+if __name__ == "__main__":
+    main()
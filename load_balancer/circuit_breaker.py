@@ -0,0 +1,199 @@
+'''
+Circuit breaker por backend para el balanceador.
+
+- CLOSED: el servidor recibe tráfico; se registra el resultado de las últimas solicitudes en una
+  ventana deslizante y, si la tasa de fallos supera el umbral, el circuito se abre.
+- OPEN: el servidor no recibe tráfico durante un periodo que crece exponencialmente con cada
+  apertura consecutiva.
+- HALF_OPEN: se permite un número limitado de solicitudes de prueba; si todas salen bien el
+  circuito se cierra, y con el primer fallo vuelve a abrirse.
+'''
+
+import threading
+import time
+from collections import deque
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+    """Circuit breaker de un único servidor backend"""
+
+    def __init__(self, server, window=20, min_requests=5, failure_threshold=0.5,
+                 open_time=5, max_open_time=60, half_open_trials=3, on_transition=None):
+        self.server = server
+        self.min_requests = min_requests
+        self.failure_threshold = failure_threshold
+        self.open_time = open_time
+        self.max_open_time = max_open_time
+        self.half_open_trials = half_open_trials
+        self.on_transition = on_transition
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._results = deque(maxlen=window)  # True = éxito, False = fallo
+        self._consecutive_opens = 0
+        self._opened_at = 0
+        self._open_until = 0
+        self._hold_until = 0  # Mientras no pase, un health check sano no adelanta el HALF_OPEN
+        self._trials_in_flight = 0
+        self._trial_successes = 0
+
+    # --- Transiciones (siempre con el lock tomado) ---
+
+    def _transition(self, new_state, reason):
+        old_state = self._state
+        self._state = new_state
+        if new_state == CLOSED:
+            self._results.clear()
+            self._consecutive_opens = 0
+        elif new_state == HALF_OPEN:
+            self._trials_in_flight = 0
+            self._trial_successes = 0
+        return (self.server, old_state, new_state, reason)
+
+    def _open(self, reason, hold=0):
+        now = time.time()
+        self._consecutive_opens += 1
+        duration = min(self.max_open_time, self.open_time * 2 ** (self._consecutive_opens - 1))
+        duration = max(duration, hold)
+        self._opened_at = now
+        self._open_until = now + duration
+        self._hold_until = now + hold
+        return self._transition(OPEN, f"{reason}; abierto por {duration:.0f} s")
+
+    def _refresh(self):
+        """Pasa de OPEN a HALF_OPEN cuando termina el periodo de apertura"""
+        if self._state == OPEN and time.time() >= self._open_until:
+            return self._transition(HALF_OPEN, "terminó el periodo de apertura")
+        return None
+
+    def _notify(self, *transitions):
+        for transition in transitions:
+            if transition and self.on_transition:
+                self.on_transition(*transition)
+
+    # --- API pública ---
+
+    @property
+    def state(self):
+        with self._lock:
+            transition = self._refresh()
+            state = self._state
+        self._notify(transition)
+        return state
+
+    def available(self):
+        """Indica si el servidor puede recibir una solicitud (sin reservar un turno de prueba)"""
+        with self._lock:
+            transition = self._refresh()
+            available = (
+                self._state == CLOSED
+                or (self._state == HALF_OPEN and self._trials_in_flight < self.half_open_trials)
+            )
+        self._notify(transition)
+        return available
+
+    def allow_request(self):
+        """Reserva el envío de una solicitud; en HALF_OPEN consume uno de los turnos de prueba"""
+        with self._lock:
+            transition = self._refresh()
+            if self._state == CLOSED:
+                allowed = True
+            elif self._state == HALF_OPEN and self._trials_in_flight < self.half_open_trials:
+                self._trials_in_flight += 1
+                allowed = True
+            else:
+                allowed = False
+        self._notify(transition)
+        return allowed
+
+    def release(self):
+        """Libera un turno reservado cuya solicitud terminó sin resultado (p. ej. el cliente se desconectó)"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials_in_flight > 0:
+                self._trials_in_flight -= 1
+
+    def record_success(self):
+        transition = None
+        with self._lock:
+            if self._state == CLOSED:
+                self._results.append(True)
+            elif self._state == HALF_OPEN and self._trials_in_flight > 0:
+                self._trials_in_flight -= 1
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_trials:
+                    transition = self._transition(CLOSED, f"{self._trial_successes} solicitudes de prueba exitosas")
+        self._notify(transition)
+
+    def record_failure(self, reason="error de conexión"):
+        transition = None
+        with self._lock:
+            if self._state == CLOSED:
+                self._results.append(False)
+                failures = self._results.count(False)
+                if (len(self._results) >= self.min_requests
+                        and failures / len(self._results) >= self.failure_threshold):
+                    transition = self._open(f"{failures} fallos en las últimas {len(self._results)} solicitudes ({reason})")
+            elif self._state == HALF_OPEN:
+                transition = self._open(f"falló una solicitud de prueba ({reason})")
+        self._notify(transition)
+
+    def on_health_check(self, healthy):
+        """Un health check fallido abre el circuito; uno exitoso adelanta el paso a HALF_OPEN"""
+        transition = None
+        with self._lock:
+            refreshed = self._refresh()
+            if not healthy and self._state != OPEN:
+                transition = self._open("falló el health check")
+            elif healthy and self._state == OPEN and time.time() >= self._hold_until:
+                transition = self._transition(HALF_OPEN, "health check exitoso")
+        self._notify(refreshed, transition)
+
+    def force_open(self, reason, hold=0):
+        """Abre el circuito inmediatamente; 'hold' es el tiempo mínimo que debe permanecer abierto"""
+        with self._lock:
+            transition = self._open(reason, hold)
+        self._notify(transition)
+
+    def snapshot(self):
+        with self._lock:
+            transition = self._refresh()
+            now = time.time()
+            failures = self._results.count(False)
+            info = {
+                "state": self._state,
+                "failure_rate": failures / len(self._results) if self._results else 0.0,
+                "window": len(self._results),
+                "open_for": int(now - self._opened_at) if self._state == OPEN else 0,
+                "retry_in": max(0, int(self._open_until - now)) if self._state == OPEN else 0,
+                "trials_in_flight": self._trials_in_flight,
+            }
+        self._notify(transition)
+        return info
+
+
+class BreakerRegistry:
+    """Circuit breakers de todos los backends, con el historial de transiciones para /status"""
+
+    def __init__(self, on_transition=None, history=20, **settings):
+        self.settings = settings
+        self.on_transition = on_transition
+        self.transitions = deque(maxlen=history)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _record_transition(self, server, old_state, new_state, reason):
+        self.transitions.append((time.time(), server, old_state, new_state, reason))
+        if self.on_transition:
+            self.on_transition(server, old_state, new_state, reason)
+
+    def get(self, server):
+        with self._lock:
+            breaker = self._breakers.get(server)
+            if breaker is None:
+                breaker = CircuitBreaker(server, on_transition=self._record_transition, **self.settings)
+                self._breakers[server] = breaker
+            return breaker
@@ -0,0 +1,217 @@
+'''
+Envío de eventos al servicio de logs sin bloquear las solicitudes.
+
+log_event() solo agrega el evento a una cola acotada; un thread en segundo plano los agrupa (por
+cantidad o por tiempo) y envía cada lote en un único POST NDJSON (una línea JSON por evento) sobre
+una conexión keep-alive.
+
+- Si la cola está llena, el evento se descarta y se cuenta en 'dropped' (no se bloquea la solicitud).
+- Si el servicio de logs no responde, los lotes se guardan en un archivo local (spill) y se reenvían,
+  en orden, cuando vuelve a estar disponible. Los archivos que dejó un proceso anterior se reenvían
+  también.
+'''
+
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+_STOP = object()
+
+
+class EventShipper:
+    def __init__(self, url, spill_dir, queue_size=10000, batch_size=200, flush_interval=1.0, timeout=2.0,
+                 retry_interval=5.0, spill_max_bytes=16 * 1024 * 1024, source=None):
+        self.url = url
+        self.spill_dir = spill_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.spill_max_bytes = spill_max_bytes
+        self.source = source
+        self._queue_size = queue_size
+        self._start()
+
+    def after_fork(self):
+        """
+        En un proceso hijo creado con fork (serve.py): cola, conexión, spill y thread propios. Los
+        eventos que quedaron en la cola del proceso padre los envía el padre.
+        """
+        self._start()
+
+    def _start(self):
+        self.spill_path = os.path.join(self.spill_dir, f"log_spill.{os.getpid()}.ndjson")
+
+        # Estadísticas
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed_posts = 0
+
+        self._queue = queue.Queue(maxsize=self._queue_size)
+        self._session = requests.Session()  # Reutiliza la conexión entre lotes
+        self._down_until = 0.0  # Mientras el servicio está caído no se intenta enviar
+        # Puede haber eventos guardados por un proceso anterior: se intentan reenviar al inicio
+        self._spill_pending = bool(glob.glob(os.path.join(self.spill_dir, "log_spill.*.ndjson")))
+        self._thread = threading.Thread(target=self._run, daemon=True, name="event-shipper")
+        self._thread.start()
+
+    def emit(self, message, **fields):
+        """Encola un evento; nunca bloquea ni lanza excepciones"""
+        event = {"timestamp": datetime.now().isoformat(timespec="milliseconds"), "message": message}
+        if self.source:
+            event["source"] = self.source
+        event.update(fields)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=None):
+        """Envía (o guarda en el spill) lo que quede en la cola; pensado para atexit"""
+        try:
+            self._queue.put(_STOP, timeout=1)
+        except queue.Full:
+            return
+        self._thread.join(self.timeout + 1 if timeout is None else timeout)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "failed_posts": self.failed_posts,
+            "spill_pending": self._spill_pending,
+        }
+
+    # --- Thread de envío ---
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            if batch:
+                timeout = max(0.0, deadline - time.monotonic())
+            else:
+                timeout = self.retry_interval if self._spill_pending else None
+            try:
+                event = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                event = None
+
+            if event is _STOP:
+                if batch:
+                    self._ship(batch)
+                return
+            if event is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(json.dumps(event, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+                if len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+
+            try:
+                if batch:
+                    self._ship(batch)
+                elif self._spill_pending:
+                    self._drain_spill()
+            except OSError as e:
+                print(f"Error al guardar eventos en {self.spill_dir}: {e}")
+            batch = []
+
+    def _post(self, body):
+        if time.monotonic() < self._down_until:
+            return False
+        try:
+            response = self._session.post(self.url, data=body, timeout=self.timeout,
+                                          headers={"Content-Type": "application/x-ndjson"})
+            if response.ok:
+                return True
+        except requests.RequestException:
+            pass
+        self.failed_posts += 1
+        self._down_until = time.monotonic() + self.retry_interval
+        return False
+
+    def _ship(self, lines):
+        body = b"".join(lines)
+        if self._spill_pending:
+            # Lo guardado antes debe llegar primero: el lote va detrás en el spill
+            self._spill(body, len(lines))
+            self._drain_spill()
+        elif self._post(body):
+            self.sent += len(lines)
+        else:
+            self._spill(body, len(lines))
+
+    # --- Spill a disco ---
+
+    def _spill_files(self):
+        """
+        Archivos de spill a reenviar: los de procesos que ya terminaron (solo en POSIX), que este
+        proceso adopta renombrándolos para que otro no los envíe también, y al final el propio.
+        """
+        pid = str(os.getpid())
+        files = []
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "log_spill.*.ndjson"))):
+            name = os.path.basename(path)
+            owner = name.split(".")[1]
+            if owner == pid:
+                files.append(path)
+            elif os.name == "posix" and owner.isdigit() and not _process_alive(int(owner)):
+                adopted = os.path.join(self.spill_dir, f"log_spill.{pid}.from-{name[len('log_spill.'):]}")
+                try:
+                    os.rename(path, adopted)
+                except FileNotFoundError:
+                    continue  # Otro proceso lo adoptó primero
+                files.append(adopted)
+        return sorted(files, key=lambda path: path == self.spill_path)
+
+    def _spill(self, body, count):
+        try:
+            size = os.path.getsize(self.spill_path)
+        except FileNotFoundError:
+            size = 0
+        if size + len(body) > self.spill_max_bytes:
+            self.dropped += count
+            return
+        with open(self.spill_path, "ab") as file:
+            file.write(body)
+        self.spilled += count
+        self._spill_pending = True
+
+    def _drain_spill(self):
+        """Reenvía los archivos de spill en lotes; si falla, deja el resto para el próximo intento"""
+        if time.monotonic() < self._down_until:
+            return
+        for path in self._spill_files():
+            with open(path, "rb") as file:
+                # Una línea sin salto final quedó a medio escribir (el proceso se cayó)
+                lines = [line for line in file if line.endswith(b"\n")]
+            for start in range(0, len(lines), self.batch_size):
+                chunk = lines[start:start + self.batch_size]
+                if not self._post(b"".join(chunk)):
+                    with open(path + ".tmp", "wb") as file:
+                        file.writelines(lines[start:])
+                    os.replace(path + ".tmp", path)
+                    return
+                self.sent += len(chunk)
+            os.unlink(path)
+        self._spill_pending = False
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,182 @@
+'''
+Health checks activos (concurrentes y con intervalos adaptativos) y detección pasiva de
+backends anómalos a partir del resultado real de las solicitudes que pasan por el proxy.
+'''
+
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ProbeScheduler:
+    """
+    Calcula cuándo volver a verificar cada servidor.
+
+    Tras un cambio de estado (o si el servidor es sospechoso) se verifica cada min_interval segundos,
+    y el intervalo se duplica con cada resultado igual al anterior hasta un tope: max_interval para
+    servidores sanos y estables, base_interval para servidores caídos.
+    Todos los intervalos llevan jitter para que las verificaciones no se sincronicen.
+    """
+
+    def __init__(self, base_interval, min_interval, max_interval, jitter=0.2):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self._state = {}  # servidor -> {"next": t, "interval": s, "healthy": bool | None}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def _jittered(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _get(self, server):
+        state = self._state.get(server)
+        if state is None:
+            state = self._state[server] = {"next": 0, "interval": self.min_interval, "healthy": None}
+        return state
+
+    def due(self, servers, now):
+        """Retorna los servidores que deben verificarse ahora y los marca como en curso"""
+        with self._lock:
+            due = [
+                s for s in servers
+                if s not in self._in_flight and self._get(s)["next"] <= now
+            ]
+            self._in_flight.update(due)
+            return due
+
+    def record(self, server, healthy, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._in_flight.discard(server)
+            state = self._get(server)
+            if healthy != state["healthy"]:
+                # Cambio de estado: volver a verificar pronto para confirmarlo
+                state["interval"] = self.min_interval
+            else:
+                cap = self.max_interval if healthy else self.base_interval
+                state["interval"] = min(cap, state["interval"] * 2)
+            state["healthy"] = healthy
+            state["next"] = now + self._jittered(state["interval"])
+
+    def mark_suspect(self, server):
+        """Fuerza una verificación inmediata y rápida de un servidor sospechoso"""
+        with self._lock:
+            state = self._get(server)
+            state["interval"] = self.min_interval
+            state["next"] = 0
+
+    def seconds_until_next(self, servers, now):
+        with self._lock:
+            pending = [self._get(s)["next"] for s in servers if s not in self._in_flight]
+        if not pending:
+            return self.min_interval
+        return max(0.0, min(pending) - now)
+
+    def intervals(self):
+        with self._lock:
+            return {server: state["interval"] for server, state in self._state.items()}
+
+
+class HealthChecker:
+    """Ejecuta los health checks en paralelo con un límite de concurrencia (motor Flask)"""
+
+    def __init__(self, probe, on_result, scheduler, concurrency):
+        self.probe = probe
+        self.on_result = on_result
+        self.scheduler = scheduler
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="health")
+        self._wakeup = threading.Event()
+
+    def _run_probe(self, server):
+        healthy = False
+        try:
+            healthy = self.probe(server)
+        finally:
+            self.scheduler.record(server, healthy)
+            self.on_result(server, healthy)
+        return healthy
+
+    def probe_all(self, servers):
+        """Verifica todos los servidores a la vez y retorna {servidor: sano}"""
+        servers = list(servers)
+        self.scheduler.due(servers, float("inf"))
+        results = list(self._executor.map(self.probe, servers))
+        for server, healthy in zip(servers, results):
+            self.scheduler.record(server, healthy)
+        return dict(zip(servers, results))
+
+    def mark_suspect(self, server):
+        self.scheduler.mark_suspect(server)
+        self._wakeup.set()
+
+    def run(self, get_servers):
+        """Bucle principal: lanza las verificaciones pendientes y duerme hasta la siguiente"""
+        while True:
+            servers = list(get_servers())
+            for server in self.scheduler.due(servers, time.time()):
+                self._executor.submit(self._run_probe, server)
+            self._wakeup.wait(self.scheduler.seconds_until_next(servers, time.time()))
+            self._wakeup.clear()
+
+
+class OutlierDetector:
+    """
+    Expulsión pasiva: saca de rotación a un backend tras varias respuestas 5xx seguidas
+    o varias respuestas mucho más lentas que las del resto de los backends.
+    """
+
+    def __init__(self, tracker, eject, consecutive_5xx=5, consecutive_slow=3,
+                 latency_factor=3.0, latency_min=0.5):
+        self.tracker = tracker
+        self.eject = eject
+        self.consecutive_5xx = consecutive_5xx
+        self.consecutive_slow = consecutive_slow
+        self.latency_factor = latency_factor
+        self.latency_min = latency_min
+        self._errors = {}
+        self._slow = {}
+        self._lock = threading.Lock()
+
+    def _latency_threshold(self, server, servers):
+        others = [self.tracker.snapshot(s)[1] for s in servers if s != server]
+        others = [ewma for ewma in others if ewma is not None]
+        if not others:
+            return None
+        return max(self.latency_min, self.latency_factor * statistics.median(others))
+
+    def record(self, server, status, latency, servers):
+        """
+        Registra el resultado de una solicitud del proxy; retorna el motivo si el backend fue expulsado.
+        'servers' son los backends con los que se compara la latencia.
+        """
+        threshold = self._latency_threshold(server, servers)
+        reason = None
+        with self._lock:
+            if status >= 500:
+                self._errors[server] = self._errors.get(server, 0) + 1
+            else:
+                self._errors[server] = 0
+
+            if threshold is not None and latency > threshold:
+                self._slow[server] = self._slow.get(server, 0) + 1
+            else:
+                self._slow[server] = 0
+
+            if self._errors[server] >= self.consecutive_5xx:
+                reason = f"{self._errors[server]} respuestas 5xx consecutivas"
+            elif self._slow[server] >= self.consecutive_slow:
+                reason = f"{self._slow[server]} respuestas lentas consecutivas (umbral {threshold:.2f}s)"
+
+            if reason:
+                self._errors[server] = 0
+                self._slow[server] = 0
+
+        # eject() puede negarse (por ejemplo, si es el último servidor activo)
+        if reason and self.eject(server, reason):
+            return reason
+        return None
@@ -1,169 +1,671 @@
-from flask import Flask, request, Response
-import requests
-import random
+from flask import Flask, request, Response, jsonify
 import time
 import threading
+import atexit
+import hmac
 import logging
-
-# Configuración del logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("balancer.log"),
-        logging.StreamHandler()
-    ]
-)
+import logging.handlers
+import os
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from upstream_pool import PoolManager
+from strategies import LoadTracker, create_strategy, parse_weights
+from health_checker import HealthChecker, OutlierDetector, ProbeScheduler
+from circuit_breaker import BreakerRegistry, CLOSED, OPEN, HALF_OPEN
+from response_cache import ResponseCache, MUTATING_METHODS, etag_matches, parse_route_ttls, with_if_none_match
+from backend_registry import BackendRegistry
+from metrics import Metrics, format_sample
+from retries import IDEMPOTENT_METHODS, LatencyWindow, RetryBudget, is_retryable
+from urllib.parse import urlsplit
+
+# Registros pendientes de escribir; si la cola se llena se descartan en lugar de frenar al proxy
+LOG_QUEUE_SIZE = int(os.environ.get("LB_LOG_QUEUE_SIZE", 10000))
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Encola los registros para un thread de escritura y cuenta los descartados con la cola llena"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+# Configuración del logging: el proxy solo encola, la escritura a disco ocurre en otro thread
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [logging.FileHandler("balancer.log"), logging.StreamHandler()]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = queue.Queue(LOG_QUEUE_SIZE)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+queue_handler = DroppingQueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))  # El formato final lo aplican log_handlers
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+log_listener.start()
+atexit.register(log_listener.stop)  # Escribe los registros pendientes al terminar
 logger = logging.getLogger("balanceador")
 
 app = Flask(__name__)
 
-# Lista de servidores backend
+# Lista de servidores backend por defecto (se usa si no existe el archivo de configuración)
 SERVERS = [
     "http://localhost:5001",
     "http://localhost:5002"
 ]
 
-# Registrar servidores caídos y su tiempo de caída
-failed_servers = {}
-RETRY_INTERVAL = 30  # Tiempo en segundos para reintentar con un servidor caído
-HEALTH_CHECK_INTERVAL = 5  # Segundos entre health checks
+# Registro dinámico de backends: archivo de configuración recargado en caliente + API de administración
+BACKENDS_FILE = os.environ.get("LB_BACKENDS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "servers.json"))
+BACKENDS_POLL_INTERVAL = float(os.environ.get("LB_BACKENDS_POLL_INTERVAL", 2))  # Segundos entre revisiones del archivo
+# Con LB_ADMIN_TOKEN, /admin/backends exige el encabezado X-Admin-Token; sin él, solo acepta solicitudes
+# desde la misma máquina (quien pudiera registrar backends usaría al balanceador como proxy abierto)
+ADMIN_TOKEN = os.environ.get("LB_ADMIN_TOKEN", "")
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1", "::ffff:127.0.0.1"}
+
+# Circuit breaker por servidor (reemplaza el intervalo fijo de reintento para servidores caídos)
+BREAKER_WINDOW = int(os.environ.get("LB_BREAKER_WINDOW", 20))  # Solicitudes en la ventana deslizante
+BREAKER_MIN_REQUESTS = int(os.environ.get("LB_BREAKER_MIN_REQUESTS", 5))  # Mínimo antes de evaluar la tasa
+BREAKER_FAILURE_THRESHOLD = float(os.environ.get("LB_BREAKER_FAILURE_THRESHOLD", 0.5))  # Tasa de fallos que abre
+BREAKER_OPEN_TIME = float(os.environ.get("LB_BREAKER_OPEN_TIME", 5))  # Primer periodo abierto (se duplica)
+BREAKER_MAX_OPEN_TIME = float(os.environ.get("LB_BREAKER_MAX_OPEN_TIME", 60))  # Tope del periodo abierto
+BREAKER_HALF_OPEN_TRIALS = int(os.environ.get("LB_BREAKER_HALF_OPEN_TRIALS", 3))  # Solicitudes de prueba
+# Códigos del backend que cuentan como fallo (además de los errores de conexión y timeouts)
+BREAKER_FAILURE_STATUSES = {502, 503, 504}
+HEALTH_CHECK_INTERVAL = 5  # Segundos entre health checks (tope para servidores caídos)
+
+# Health checks adaptativos: rápidos para servidores sospechosos, espaciados para los estables
+HEALTH_CHECK_MIN_INTERVAL = float(os.environ.get("LB_HEALTH_MIN_INTERVAL", 1))
+HEALTH_CHECK_MAX_INTERVAL = float(os.environ.get("LB_HEALTH_MAX_INTERVAL", 15))
+HEALTH_CHECK_JITTER = float(os.environ.get("LB_HEALTH_JITTER", 0.2))  # ±20% aleatorio en cada intervalo
+HEALTH_CHECK_CONCURRENCY = int(os.environ.get("LB_HEALTH_CONCURRENCY", 8))  # Verificaciones simultáneas
+
+# Detección pasiva de backends anómalos a partir de las respuestas del proxy
+OUTLIER_CONSECUTIVE_5XX = int(os.environ.get("LB_OUTLIER_5XX", 5))
+OUTLIER_CONSECUTIVE_SLOW = int(os.environ.get("LB_OUTLIER_SLOW", 3))
+OUTLIER_LATENCY_FACTOR = float(os.environ.get("LB_OUTLIER_LATENCY_FACTOR", 3))  # Veces la mediana de los demás
+OUTLIER_LATENCY_MIN = float(os.environ.get("LB_OUTLIER_LATENCY_MIN", 0.5))  # Segundos; nunca es "lento" por debajo
+OUTLIER_EJECTION_TIME = float(os.environ.get("LB_OUTLIER_EJECTION_TIME", 15))  # Segundos fuera de rotación
+
+# Motor del balanceador: "flask" (un thread por solicitud) o "async" (event loop con aiohttp)
+ENGINE = os.environ.get("LB_ENGINE", "flask")
+
+# Configuración del pool de conexiones keep-alive hacia los backends
+POOL_MAX_SIZE = int(os.environ.get("LB_POOL_MAX_SIZE", 10))  # Conexiones inactivas por servidor
+POOL_IDLE_TIMEOUT = float(os.environ.get("LB_POOL_IDLE_TIMEOUT", 60))  # Segundos antes de cerrar una conexión inactiva
+POOL_MAX_REQUESTS = int(os.environ.get("LB_POOL_MAX_REQUESTS", 1000))  # Solicitudes máximas por conexión
+
+# Encabezados hop-by-hop que no deben reenviarse entre cliente y backend
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade'
+}
+
+# Modo de retransmisión en streaming: los cuerpos se reenvían por bloques sin almacenarlos completos
+STREAM_RELAY = os.environ.get("LB_STREAM_RELAY", "1") == "1"
+STREAM_CHUNK_SIZE = int(os.environ.get("LB_STREAM_CHUNK_SIZE", 64 * 1024))  # Bytes por bloque
+# Streams de eventos (text/event-stream, p. ej. /api/tasks/events): quedan abiertos y se cortan solo si
+# pasan estos segundos sin datos (el backend envía un comentario de keep-alive cada 15 s)
+EVENT_STREAM_TIMEOUT = float(os.environ.get("LB_EVENT_STREAM_TIMEOUT", 60))
+
+# Estrategia de balanceo: random, round_robin, weighted_round_robin, least_outstanding o p2c_ewma
+LB_STRATEGY = os.environ.get("LB_STRATEGY", "p2c_ewma")
+EWMA_ALPHA = float(os.environ.get("LB_EWMA_ALPHA", 0.3))  # Peso de la muestra más reciente en la latencia EWMA
+# Pesos para weighted_round_robin, p. ej. "http://localhost:5001=3,http://localhost:5002=1"
+SERVER_WEIGHTS = parse_weights(os.environ.get("LB_SERVER_WEIGHTS", ""))
+
+# Caché de respuestas para rutas de lectura: TTL en segundos por ruta, p. ej. "/api/tasks=2,/=2,/info=1"
+CACHE_ROUTE_TTLS = parse_route_ttls(os.environ.get("LB_CACHE_TTLS", "/api/tasks=2,/=2,/info=1"))
+CACHE_MAX_ENTRIES = int(os.environ.get("LB_CACHE_MAX_ENTRIES", 256))
+CACHE_MAX_BYTES = int(os.environ.get("LB_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+CACHE_MAX_ENTRY_BYTES = int(os.environ.get("LB_CACHE_MAX_ENTRY_BYTES", 4 * 1024 * 1024))
+
+# Hedging para GET y HEAD: si el backend no respondió en el percentil HEDGE_PERCENTILE de la latencia
+# reciente, se envía una copia a otro backend y se usa la primera respuesta
+HEDGE_ENABLED = os.environ.get("LB_HEDGE", "1") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("LB_HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY = float(os.environ.get("LB_HEDGE_MIN_DELAY", 0.05))  # Segundos; nunca antes de este retardo
+HEDGE_DEFAULT_DELAY = float(os.environ.get("LB_HEDGE_DEFAULT_DELAY", 0.5))  # Mientras no haya muestras suficientes
+# Solo motor Flask: solicitudes en curso con hedging; con todos los threads ocupados, las siguientes
+# se envían sin hedging desde su propio thread (nunca esperan en la cola del executor)
+HEDGE_MAX_THREADS = int(os.environ.get("LB_HEDGE_MAX_THREADS", 64))
+
+# Presupuesto global de reintentos y hedges: RATIO de las solicitudes de la ventana, más un mínimo por segundo
+RETRY_BUDGET_RATIO = float(os.environ.get("LB_RETRY_BUDGET_RATIO", 0.2))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.environ.get("LB_RETRY_BUDGET_MIN_PER_SECOND", 1))
+RETRY_BUDGET_WINDOW = int(os.environ.get("LB_RETRY_BUDGET_WINDOW", 10))  # Segundos
+
+metrics = Metrics()
+retry_budget = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_PER_SECOND, RETRY_BUDGET_WINDOW)
+latency_window = LatencyWindow()
+hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_THREADS, thread_name_prefix="hedge")
+hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_THREADS)  # Threads libres de hedge_executor
+pool_manager = PoolManager(POOL_MAX_SIZE, POOL_IDLE_TIMEOUT, POOL_MAX_REQUESTS)
+load_tracker = LoadTracker(EWMA_ALPHA)
+strategy = create_strategy(LB_STRATEGY, load_tracker, SERVER_WEIGHTS)
+response_cache = ResponseCache(CACHE_ROUTE_TTLS, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_MAX_ENTRY_BYTES)
+backend_registry = BackendRegistry(
+    BACKENDS_FILE, SERVERS, SERVER_WEIGHTS, on_removed=pool_manager.evict, logger=logger
+)
+backend_registry.load_file()
+probe_scheduler = ProbeScheduler(
+    HEALTH_CHECK_INTERVAL, HEALTH_CHECK_MIN_INTERVAL, HEALTH_CHECK_MAX_INTERVAL, HEALTH_CHECK_JITTER
+)
+
+
+class RequestBodyReader:
+    """Lee el cuerpo de la solicitud entrante por bloques, contando los bytes ya enviados al backend"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def is_event_stream(content_type):
+    return (content_type or '').split(';')[0].strip().lower() == 'text/event-stream'
+
+
+def accepts_event_stream(headers):
+    """EventSource pide los streams de eventos con Accept: text/event-stream"""
+    return 'text/event-stream' in headers.get('Accept', '')
+
+
+def stream_upstream_response(server, conn, resp, cache_writer=None, track_load=True):
+    """Entrega el cuerpo de la respuesta del backend al cliente a medida que llega"""
+    try:
+        while True:
+            chunk = resp.read1(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            if cache_writer:
+                cache_writer.write(chunk)
+            yield chunk
+        # Solo una respuesta transmitida completa se guarda en la caché
+        if cache_writer:
+            cache_writer.commit()
+    finally:
+        # Si el cliente se desconectó antes de terminar, la conexión se cierra en lugar de volver al pool
+        pool_manager.release(server, conn, resp)
+        if track_load:
+            load_tracker.finish(server)
+
+
+def on_breaker_transition(server, old_state, new_state, reason):
+    """Registra los cambios de estado del circuito y descarta las conexiones de un servidor caído"""
+    if new_state == OPEN:
+        pool_manager.evict(server)
+        health_checker.mark_suspect(server)
+        logger.warning(f"❌ Circuito de {server}: {old_state} → {new_state} ({reason})")
+    elif new_state == CLOSED:
+        logger.info(f"⚡ Circuito de {server}: {old_state} → {new_state} ({reason}), vuelve a estar activo")
+    else:
+        logger.info(f"🔎 Circuito de {server}: {old_state} → {new_state} ({reason})")
+
+
+breakers = BreakerRegistry(
+    on_transition=on_breaker_transition,
+    window=BREAKER_WINDOW,
+    min_requests=BREAKER_MIN_REQUESTS,
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    open_time=BREAKER_OPEN_TIME,
+    max_open_time=BREAKER_MAX_OPEN_TIME,
+    half_open_trials=BREAKER_HALF_OPEN_TRIALS
+)
+
+
+def closed_servers():
+    """Servidores con el circuito cerrado (reciben tráfico normal)"""
+    return [s for s in backend_registry.servers() if breakers.get(s).state == CLOSED]
+
+
+def eject_server(server, reason):
+    """Expulsión pasiva de un backend anómalo; nunca se expulsa al último servidor activo"""
+    others = [s for s in closed_servers() if s != server]
+    if not others:
+        logger.warning(f"⚠️ Servidor {server} anómalo ({reason}), pero es el último activo: no se expulsa")
+        return False
+    logger.warning(f"🚫 Servidor {server} expulsado de la rotación: {reason}")
+    breakers.get(server).force_open(f"expulsado: {reason}", hold=OUTLIER_EJECTION_TIME)
+    return True
+
+
+def record_outcome(server, status, latency):
+    """Informa al circuit breaker y al detector de anomalías el resultado de una solicitud del proxy"""
+    breaker = breakers.get(server)
+    if status in BREAKER_FAILURE_STATUSES:
+        breaker.record_failure(f"respuesta {status}")
+    else:
+        breaker.record_success()
+    outlier_detector.record(server, status, latency, closed_servers())
+
+
+def hedge_delay():
+    """Retardo antes de enviar la copia de un hedge"""
+    delay = latency_window.percentile(HEDGE_PERCENTILE)
+    return HEDGE_DEFAULT_DELAY if delay is None else max(HEDGE_MIN_DELAY, delay)
+
+
+def spend_retry(kind):
+    """Consume un reintento o una copia de hedge del presupuesto global"""
+    if retry_budget.try_spend():
+        metrics.record_retry(kind)
+        return True
+    logger.warning(f"⚠️ Presupuesto de reintentos agotado: no se envía el {kind}")
+    metrics.record_retry("budget_exhausted")
+    return False
+
+
+def reserve_hedge_backup(backups, tried):
+    """Elige el backend para la copia de un hedge y reserva su turno; None si no hay o no queda presupuesto"""
+    for backup in backups:
+        if backup in tried:
+            continue
+        breaker = breakers.get(backup)
+        if not breaker.allow_request():
+            continue
+        if not spend_retry("hedge"):
+            breaker.release()
+            return None
+        tried.add(backup)
+        return backup
+    return None
 
 
 def check_server_health(server):
     """Verificar si un servidor está activo"""
     try:
-        response = requests.get(f"{server}/health", timeout=2)
-        return response.status_code == 200
+        response, conn = pool_manager.request(server, "GET", "/health", timeout=2)
+        response.read()
+        pool_manager.release(server, conn, response)
+        return response.status == 200
     except Exception as e:
         logger.warning(f"Error en health check para {server}: {str(e)}")
         return False
 
 
 def get_active_servers():
-    """Retorna lista de servidores activos basado en el estado actual"""
-    current_time = time.time()
-    active_servers = []
+    """
+    Retorna los servidores que pueden recibir la solicitud (circuito cerrado, o semiabierto con
+    turnos de prueba libres) en el orden que decide la estrategia de balanceo.
+    """
+    # Los backends que se están drenando ya no figuran en el registro y no reciben solicitudes nuevas
+    active_servers = [s for s in backend_registry.servers() if breakers.get(s).available()]
+
+    if not active_servers:
+        # Con todos los circuitos abiertos se responde de inmediato en lugar de esperar timeouts
+        logger.error("¡ALERTA! No hay servidores activos disponibles.")
+    return strategy.order(active_servers)
+
 
-    for server in SERVERS:
-        # Si el servidor no está en la lista de fallidos, o ha pasado el tiempo de reintento
-        if server not in failed_servers or current_time - failed_servers[server] > RETRY_INTERVAL:
-            active_servers.append(server)
+def update_server_health(server, is_healthy):
+    """Informa al circuit breaker el resultado de un health check"""
+    breakers.get(server).on_health_check(is_healthy)
 
-    # Si hay servidores activos, retornar lista ordenada aleatoriamente
-    if active_servers:
-        random.shuffle(active_servers)
-        return active_servers
 
-    # Si no hay servidores activos, intentar con todos como último recurso
-    logger.error("¡ALERTA! No hay servidores activos disponibles. Intentando con todos.")
-    random.shuffle(SERVERS)
-    return SERVERS
+health_checker = HealthChecker(
+    check_server_health, update_server_health, probe_scheduler, HEALTH_CHECK_CONCURRENCY
+)
+outlier_detector = OutlierDetector(
+    load_tracker,
+    eject_server,
+    consecutive_5xx=OUTLIER_CONSECUTIVE_5XX,
+    consecutive_slow=OUTLIER_CONSECUTIVE_SLOW,
+    latency_factor=OUTLIER_LATENCY_FACTOR,
+    latency_min=OUTLIER_LATENCY_MIN
+)
 
 
 def health_check_loop():
-    """Función que verifica periódicamente el estado de los servidores"""
-    while True:
-        for server in SERVERS:
-            is_healthy = check_server_health(server)
+    """Función que verifica el estado de los servidores en paralelo y con intervalos adaptativos"""
+    health_checker.run(backend_registry.servers)
+
+
+def registry_watch_loop():
+    """Recarga el archivo de backends cuando cambia y elimina los que terminaron de drenarse"""
+    backend_registry.watch(BACKENDS_POLL_INTERVAL, lambda server: load_tracker.snapshot(server)[0])
+
+
+def handle_admin_backends(method, payload, token, remote_addr):
+    """
+    Lógica de /admin/backends compartida por ambos motores; retorna (cuerpo JSON, código HTTP).
+    POST {"url": ..., "weight": ...} registra un backend y DELETE {"url": ...} lo drena y lo quita.
+    """
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode()):
+            return {"error": "Token de administración inválido"}, 401
+    elif remote_addr not in LOOPBACK_ADDRESSES:
+        return {"error": "Sin LB_ADMIN_TOKEN, la API de administración solo acepta solicitudes locales"}, 403
+    if method == 'GET':
+        return {"backends": backend_registry.snapshot()}, 200
+
+    url = (payload or {}).get("url", "")
+    parts = urlsplit(url)
+    if parts.scheme != "http" or not parts.netloc:
+        return {"error": "Se requiere una 'url' del tipo http://host:puerto"}, 400
+
+    if method == 'POST':
+        try:
+            weight = int(payload.get("weight", 1))
+        except (TypeError, ValueError):
+            return {"error": "El peso debe ser un número entero"}, 400
+        if weight < 1:
+            return {"error": "El peso debe ser mayor que cero"}, 400
+        backend_registry.register(url, weight)
+        # Verificar cuanto antes al nuevo backend
+        health_checker.mark_suspect(url.rstrip("/"))
+        return {"registered": url.rstrip("/"), "weight": weight}, 201
+
+    if not backend_registry.deregister(url):
+        return {"error": "El backend no fue registrado por la API (los del archivo se quitan editándolo)"}, 404
+    return {"draining": url.rstrip("/")}, 202
+
+
+@app.route('/admin/backends', methods=['GET', 'POST', 'DELETE'])
+def admin_backends():
+    """API de administración para registrar y quitar backends"""
+    body, status = handle_admin_backends(
+        request.method, request.get_json(silent=True), request.headers.get('X-Admin-Token'), request.remote_addr
+    )
+    return jsonify(body), status
+
+
+def forward_request(server, method, upstream_path, headers, data=None, encode_chunked=False, read_timeout=None):
+    """Envía la solicitud a un backend y registra el resultado; retorna (respuesta, conexión del pool)"""
+    load_tracker.start(server)
+    started = time.time()
+    try:
+        # Reenviar la solicitud usando una conexión keep-alive del pool
+        resp, conn = pool_manager.request(
+            server,
+            method,
+            upstream_path,
+            headers=headers,
+            body=data,
+            timeout=3,  # Tiempo de espera para detectar rápidamente servidores caídos
+            encode_chunked=encode_chunked,
+            read_timeout=read_timeout
+        )
+    except Exception as e:
+        # Un fallo cuenta como una muestra de latencia alta para la estrategia
+        load_tracker.record_latency(server, time.time() - started)
+        load_tracker.finish(server)
+
+        # Registrar el error pero sin mostrar detalles técnicos
+        logger.error(f"❌ Error al conectar con {server}: {str(e)}")
+        breakers.get(server).record_failure(type(e).__name__)
+        metrics.record_error(server, type(e).__name__)
+        raise
+
+    latency = time.time() - started
+    load_tracker.record_latency(server, latency)
+    latency_window.add(latency)
+    metrics.observe_upstream(server, resp.status, latency)
+
+    # Si llegamos aquí, la solicitud fue exitosa
+    logger.info(f"✅ Solicitud exitosa a: {server}{upstream_path}")
+
+    # Circuit breaker y detección pasiva: los fallos o respuestas lentas seguidas sacan al servidor
+    record_outcome(server, resp.status, latency)
+    return resp, conn
+
+
+def discard_upstream_response(server, conn):
+    """Cierra la respuesta de un backend que no se entregará al cliente"""
+    pool_manager.discard(server, conn)
+    load_tracker.finish(server)
+
+
+def submit_in_slot(server, method, upstream_path, headers):
+    """
+    Envía la solicitud desde hedge_executor, en un thread libre reservado con hedge_slots; retorna el
+    future y un Event que se activa cuando la solicitud empieza a enviarse
+    """
+    started = threading.Event()
 
-            if is_healthy and server in failed_servers:
-                # Servidor recuperado
-                del failed_servers[server]
-                logger.info(f"⚡ Health check: Servidor {server} recuperado y vuelve a estar activo")
-            elif not is_healthy and server not in failed_servers:
-                # Servidor caído
-                failed_servers[server] = time.time()
-                logger.warning(f"❌ Health check: Servidor {server} detectado como caído")
+    def run():
+        started.set()
+        try:
+            return forward_request(server, method, upstream_path, headers)
+        finally:
+            hedge_slots.release()
 
-        # Esperar hasta el próximo health check
-        time.sleep(HEALTH_CHECK_INTERVAL)
+    return hedge_executor.submit(run), started
+
+
+def hedged_request(server, backups, tried, method, upstream_path, headers):
+    """
+    Envía una solicitud idempotente sin cuerpo a 'server' y, si no respondió tras el retardo de hedge,
+    una copia a uno de 'backups'; retorna (servidor, respuesta, conexión) de la primera que responda.
+    """
+    if not hedge_slots.acquire(blocking=False):
+        # Sin threads libres no hay hedging: bajo carga, una copia solo duplicaría el trabajo
+        resp, conn = forward_request(server, method, upstream_path, headers)
+        return server, resp, conn
+    future, started = submit_in_slot(server, method, upstream_path, headers)
+    futures = {future: server}
+    # El retardo cuenta desde que la solicitud se envía, no desde que se encoló
+    started.wait()
+    done, _ = wait(futures, timeout=hedge_delay())
+    if not done and hedge_slots.acquire(blocking=False):
+        backup = reserve_hedge_backup(backups, tried)
+        if backup:
+            futures[submit_in_slot(backup, method, upstream_path, headers)[0]] = backup
+        else:
+            hedge_slots.release()
+
+    winner = None
+    error = None
+    pending = set(futures)
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                resp, conn = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if winner is None:
+                winner = (futures[future], resp, conn)
+            else:
+                discard_upstream_response(futures[future], conn)
+
+    # La copia que sigue en curso se descarta en cuanto responda
+    def discard_late(future):
+        if future.exception() is None:
+            discard_upstream_response(futures[future], future.result()[1])
+
+    for future in pending:
+        future.add_done_callback(discard_late)
+
+    if winner is None:
+        raise error
+    if winner[0] != server:
+        metrics.record_retry("hedge_win")
+    return winner
 
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def proxy(path):
+    # Caché de respuestas para las rutas de lectura
+    route = f"/{path}"
+    cache_ttl = response_cache.ttl_for(request.method, route)
+    cache_key = stale = None
+    if cache_ttl:
+        cache_key = response_cache.key(request.method, route, request.query_string, request.headers)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            # 304 si el cliente ya tiene la versión guardada (If-None-Match)
+            status, headers, body = cached.reply(request.headers.get('If-None-Match'))
+            response = Response(body, status, headers)
+            response.headers['X-Cache'] = 'HIT'
+            metrics.record_response(status)
+            return response
+        cache_generation = response_cache.generation
+        # Una copia vencida con ETag se revalida con el backend en lugar de pedir el cuerpo otra vez
+        stale = response_cache.stale(cache_key)
+    elif request.method in MUTATING_METHODS:
+        # Invalidar antes de la escritura descarta también las lecturas que están en camino
+        response_cache.invalidate()
+
     # Obtener servidores activos
     active_servers = get_active_servers()
+    retry_budget.record_request()
 
     # Intentar con cada servidor hasta encontrar uno que funcione
+    method = request.method
     last_error = None
+    tried = set()
 
     for server in active_servers:
-        url = f"{server}/{path}"
+        if server in tried:
+            continue
+        if tried and not is_retryable(method, last_error):
+            # Una solicitud no idempotente pudo haberse procesado: repetirla podría duplicarla
+            logger.error(f"❌ {method} a {server} no se reintenta: {str(last_error)}")
+            metrics.record_response(502)
+            return "El servidor backend falló y la solicitud no se reintentó para evitar duplicarla.", 502
+
+        # En HALF_OPEN solo pasa un número limitado de solicitudes de prueba
+        breaker = breakers.get(server)
+        if not breaker.allow_request():
+            continue
+        if tried and not spend_retry("retry"):
+            breaker.release()
+            break
+        tried.add(server)
+
+        upstream_path = f"/{path}"
+        if request.query_string:
+            upstream_path += "?" + request.query_string.decode("latin-1")
 
         # Crear una nueva solicitud al servidor seleccionado
-        method = request.method
-        headers = {k: v for k, v in request.headers if k != 'Host'}
-        data = request.get_data()
+        headers = {
+            k: v for k, v in request.headers
+            if k.lower() != 'host' and k.lower() not in HOP_BY_HOP_HEADERS
+        }
+        if stale is not None:
+            headers = with_if_none_match(headers, stale.etag)
+
+        encode_chunked = False
+        body_reader = None
+        if not STREAM_RELAY:
+            data = request.get_data()
+        elif request.content_length:
+            # El cuerpo se envía al backend por bloques, manteniendo el Content-Length original
+            body_reader = data = RequestBodyReader(request.stream)
+        elif request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body_reader = RequestBodyReader(request.stream)
+            data = iter(body_reader)
+            encode_chunked = True
+        else:
+            data = None
 
         try:
-            # Reenviar la solicitud al servidor seleccionado
-            resp = requests.request(
-                method=method,
-                url=url,
-                headers=headers,
-                data=data,
-                cookies=request.cookies,
-                params=request.args,
-                allow_redirects=False,
-                stream=True,
-                timeout=3  # Tiempo de espera para detectar rápidamente servidores caídos
-            )
+            if accepts_event_stream(request.headers):
+                # Un stream de eventos (SSE) no se duplica con hedging y puede pasar hasta
+                # EVENT_STREAM_TIMEOUT sin datos
+                resp, conn = forward_request(server, method, upstream_path, headers, data, encode_chunked,
+                                             read_timeout=EVENT_STREAM_TIMEOUT)
+            elif HEDGE_ENABLED and method in IDEMPOTENT_METHODS and not data:
+                # Si el backend tarda más que el percentil configurado, se envía una copia a otro
+                backups = [s for s in active_servers if s not in tried]
+                server, resp, conn = hedged_request(server, backups, tried, method, upstream_path, headers)
+            else:
+                resp, conn = forward_request(server, method, upstream_path, headers, data, encode_chunked)
+        except Exception as e:
+            last_error = e
 
-            # Si llegamos aquí, la solicitud fue exitosa
-            logger.info(f"✅ Solicitud exitosa a: {url}")
+            # Un cuerpo ya enviado parcialmente no puede repetirse en otro servidor
+            if body_reader is not None and body_reader.bytes_read > 0:
+                metrics.record_response(502)
+                return "El servidor backend falló mientras recibía la solicitud.", 502
+            # Continuar con el siguiente servidor
+            continue
+
+        if stale is not None and resp.status == 304 and etag_matches(stale.etag, resp.getheader('ETag')):
+            # La copia vencida sigue vigente: se renueva y se responde desde la caché
+            resp.read()
+            pool_manager.release(server, conn, resp)
+            load_tracker.finish(server)
+            response_cache.revalidate(cache_key, stale, cache_ttl, cache_generation)
+            status, headers, body = stale.reply(request.headers.get('If-None-Match'))
+            response = Response(body, status, headers)
+            response.headers['X-Cache'] = 'REVALIDATED'
+            metrics.record_response(status)
+            return response
+
+        if method in MUTATING_METHODS:
+            response_cache.invalidate()
+
+        event_stream = is_event_stream(resp.getheader('Content-Type'))
+        if event_stream:
+            # Un stream de eventos puede durar horas: no cuenta como solicitud en curso para el balanceo
+            load_tracker.finish(server)
 
-            # Si el servidor estaba marcado como caído, quitarlo de la lista
-            if server in failed_servers:
-                del failed_servers[server]
-                logger.info(f"⚡ Servidor {server} recuperado y vuelve a estar activo")
+        upstream_headers = [(k, v) for k, v in resp.getheaders() if k.lower() not in HOP_BY_HOP_HEADERS]
+        cache_writer = None
+        if cache_key is not None:
+            cache_headers = [(k, v) for k, v in upstream_headers if k.lower() != 'content-length']
+            cache_headers.append(('X-Upstream-Server', server))
+            cache_writer = response_cache.writer(cache_key, cache_ttl, cache_generation, resp.status, cache_headers)
 
-            # Crear una respuesta Flask a partir de la respuesta del servidor
+        # Crear una respuesta Flask a partir de la respuesta del servidor
+        if STREAM_RELAY or event_stream:
+            # El cuerpo no se decodifica, por lo que Content-Length sigue siendo válido
             response = Response(
-                resp.content,
-                resp.status_code,
-                [
-                    (k, v) for k, v in resp.headers.items()
-                    if k.lower() not in ('transfer-encoding', 'content-encoding', 'content-length')
-                ]
+                stream_upstream_response(server, conn, resp, cache_writer, track_load=not event_stream),
+                resp.status,
+                upstream_headers,
+                direct_passthrough=True
+            )
+        else:
+            content = resp.read()
+            pool_manager.release(server, conn, resp)
+            load_tracker.finish(server)
+            if cache_writer:
+                cache_writer.write(content)
+                cache_writer.commit()
+            response = Response(
+                content,
+                resp.status,
+                [(k, v) for k, v in upstream_headers if k.lower() != 'content-length']
             )
 
-            # Agregar un encabezado personalizado que indica qué servidor atendió la solicitud
-            response.headers['X-Upstream-Server'] = server
-
-            return response
+        # Agregar un encabezado personalizado que indica qué servidor atendió la solicitud
+        response.headers['X-Upstream-Server'] = server
+        if cache_key is not None:
+            response.headers['X-Cache'] = 'MISS'
 
-        except Exception as e:
-            # Registrar el error pero sin mostrar detalles técnicos
-            last_error = e
-            logger.error(f"❌ Error al conectar con {server}: {str(e)}")
-            failed_servers[server] = time.time()
-            # Continuar con el siguiente servidor
+        metrics.record_response(resp.status)
+        return response
 
-    # Si llegamos aquí, todos los servidores intentados fallaron
+    # Si llegamos aquí, todos los servidores intentados fallaron (o se agotó el presupuesto de reintentos)
     error_response = f"No se pudo completar la solicitud. Todos los servidores están caídos o no responden."
     logger.critical(f"TODOS LOS SERVIDORES FALLARON. Último error: {str(last_error)}")
+    metrics.record_response(503)
     return error_response, 503
 
 
-@app.route('/status', methods=['GET'])
-def server_status():
-    """Endpoint para verificar el estado de los servidores"""
-    status = {}
-
-    for server in SERVERS:
-        if server in failed_servers:
-            downtime = time.time() - failed_servers[server]
-            status[server] = {
-                "status": "DOWN",
-                "downtime_seconds": int(downtime),
-                "retry_in": max(0, int(RETRY_INTERVAL - downtime))
-            }
-        else:
-            status[server] = {"status": "UP"}
-
-    active_count = sum(1 for server in SERVERS if server not in failed_servers)
+def render_status_html(pool_stats=None):
+    """Genera la página HTML con el estado de los servidores (compartida por ambos motores)"""
+    servers = backend_registry.servers()
+    status = {server: breakers.get(server).snapshot() for server in servers}
+    active_count = sum(1 for info in status.values() if info["state"] == CLOSED)
 
     html = f"""
     <html>
@@ -175,7 +677,9 @@ def server_status():
             .server {{ margin-bottom: 10px; padding: 10px; border-radius: 5px; }}
             .up {{ background-color: #d4edda; color: #155724; }}
             .down {{ background-color: #f8d7da; color: #721c24; }}
+            .half {{ background-color: #fff3cd; color: #856404; }}
             .summary {{ margin-top: 20px; font-weight: bold; }}
+            .pool, .score, .transition {{ margin-bottom: 5px; font-size: 0.9em; color: #555; }}
         </style>
         <meta http-equiv="refresh" content="5">
     </head>
@@ -183,13 +687,65 @@ def server_status():
         <h1>Estado de los Servidores</h1>
     """
 
+    intervals = probe_scheduler.intervals()
     for server, info in status.items():
-        if info["status"] == "UP":
-            html += f'<div class="server up">✅ {server}: ACTIVO</div>'
+        probe = f' · health check cada {intervals[server]:.0f} s' if server in intervals else ''
+        failures = f'{info["failure_rate"]:.0%} de fallos en {info["window"]} solicitudes'
+        if info["state"] == CLOSED:
+            html += f'<div class="server up">✅ {server}: ACTIVO (circuito cerrado, {failures}){probe}</div>'
+        elif info["state"] == HALF_OPEN:
+            html += f'<div class="server half">🔎 {server}: EN PRUEBA (circuito semiabierto, {info["trials_in_flight"]} solicitudes de prueba en curso){probe}</div>'
         else:
-            html += f'<div class="server down">❌ {server}: CAÍDO (por {info["downtime_seconds"]} segundos, reintento en {info["retry_in"]} segundos)</div>'
+            html += f'<div class="server down">❌ {server}: CAÍDO (circuito abierto hace {info["open_for"]} segundos, prueba en {info["retry_in"]} segundos){probe}</div>'
+
+    # Backends quitados que todavía terminan solicitudes en curso
+    for server, since in backend_registry.draining().items():
+        outstanding = load_tracker.snapshot(server)[0]
+        html += (
+            f'<div class="server half">⏳ {server}: DRENANDO hace {int(time.time() - since)} segundos '
+            f'({outstanding} solicitudes en curso, no recibe solicitudes nuevas)</div>'
+        )
+
+    html += f'<div class="summary">Servidores activos: {active_count} de {len(servers)}</div>'
+
+    # Últimas transiciones de los circuit breakers
+    if breakers.transitions:
+        html += '<h2>Transiciones de circuito</h2>'
+        for timestamp, server, old_state, new_state, reason in reversed(breakers.transitions):
+            html += (
+                f'<div class="transition">{time.strftime("%H:%M:%S", time.localtime(timestamp))} '
+                f'{server}: {old_state} → {new_state} ({reason})</div>'
+            )
+
+    # Puntajes de la estrategia de balanceo por backend
+    html += f'<h2>Estrategia de balanceo: {strategy.name}</h2>'
+    for server, info in strategy.scores(servers).items():
+        ewma = "sin datos" if info["ewma_ms"] is None else f'{info["ewma_ms"]} ms'
+        html += (
+            f'<div class="score">{server}: {info["outstanding"]} en curso, latencia EWMA {ewma}, '
+            f'peso {info["weight"]}, puntaje {info["score"]}</div>'
+        )
+
+    # Estadísticas de la caché de respuestas
+    cache = response_cache.stats()
+    html += '<h2>Caché de respuestas</h2>'
+    html += (
+        f'<div class="pool">{cache["hits"]} aciertos, {cache["misses"]} fallos, '
+        f'{cache["evictions"]} desalojos, {cache["expirations"]} expiradas, '
+        f'{cache["invalidations"]} invalidaciones, {cache["revalidations"]} revalidadas, '
+        f'{cache["entries"]} entradas ({cache["bytes"]} bytes)</div>'
+    )
+
+    # Estadísticas del pool de conexiones keep-alive
+    if pool_stats:
+        html += '<h2>Pool de conexiones</h2>'
+        for server, stats in pool_stats.items():
+            html += (
+                f'<div class="pool">{server}: {stats["hits"]} reutilizadas, '
+                f'{stats["new_connections"]} nuevas, {stats["discarded"]} descartadas, '
+                f'{stats["idle"]} inactivas, {stats["in_use"]} en uso</div>'
+            )
 
-    html += f'<div class="summary">Servidores activos: {active_count} de {len(SERVERS)}</div>'
     html += """
     </body>
     </html>
@@ -198,18 +754,80 @@ def server_status():
     return html
 
 
+def render_metrics(pool_stats=None):
+    """Genera /metrics en formato de texto de Prometheus (compartido por ambos motores)"""
+    lines = metrics.render()
+    servers = backend_registry.servers() + list(backend_registry.draining())
+
+    lines += [
+        '# HELP lb_upstream_in_flight Solicitudes en curso hacia cada backend.',
+        '# TYPE lb_upstream_in_flight gauge',
+    ]
+    for server in servers:
+        lines.append(format_sample('lb_upstream_in_flight', [('upstream', server)], load_tracker.snapshot(server)[0]))
+
+    lines += [
+        '# HELP lb_circuit_state Estado del circuit breaker de cada backend (1 en el estado actual).',
+        '# TYPE lb_circuit_state gauge',
+    ]
+    for server in backend_registry.servers():
+        current = breakers.get(server).state
+        for state in (CLOSED, HALF_OPEN, OPEN):
+            lines.append(format_sample('lb_circuit_state', [('upstream', server), ('state', state)], int(state == current)))
+
+    cache = response_cache.stats()
+    for name in ("hits", "misses", "evictions", "expirations", "invalidations", "revalidations"):
+        lines += [f'# TYPE lb_cache_{name}_total counter', format_sample(f'lb_cache_{name}_total', [], cache[name])]
+    lines += ['# TYPE lb_cache_bytes gauge', format_sample('lb_cache_bytes', [], cache["bytes"])]
+
+    if pool_stats:
+        lines += ['# TYPE lb_pool_connections_total counter']
+        for server, stats in pool_stats.items():
+            for kind in ("hits", "new_connections", "discarded"):
+                lines.append(format_sample('lb_pool_connections_total', [('upstream', server), ('kind', kind)], stats[kind]))
+
+    lines += [
+        '# HELP lb_log_records_dropped_total Registros de log descartados porque la cola estaba llena.',
+        '# TYPE lb_log_records_dropped_total counter',
+        format_sample('lb_log_records_dropped_total', [], DroppingQueueHandler.dropped),
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(render_metrics(pool_manager.stats()), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/status', methods=['GET'])
+def server_status():
+    """Endpoint para verificar el estado de los servidores"""
+    return render_status_html(pool_manager.stats())
+
+
 # Verificar que los servidores estén activos al inicio
 def check_servers_on_startup():
     logger.info("Verificando servidores al inicio...")
-    for server in SERVERS:
-        if check_server_health(server):
+    for server, is_healthy in health_checker.probe_all(backend_registry.servers()).items():
+        if is_healthy:
             logger.info(f"✅ Servidor {server} activo")
         else:
-            failed_servers[server] = time.time()
+            breakers.get(server).force_open("no responde al inicio")
             logger.warning(f"❌ Servidor {server} no responde al inicio")
 
 
 if __name__ == '__main__':
+    # El motor también puede elegirse por argumento: python load_balancer.py async
+    engine = sys.argv[1] if len(sys.argv) > 1 else ENGINE
+
+    if engine == 'async':
+        # El motor asíncrono reutiliza la configuración y el estado de este módulo
+        sys.modules.setdefault('load_balancer', sys.modules[__name__])
+        import async_balancer
+        async_balancer.main()
+        sys.exit(0)
+
     # Verificar servidores al inicio
     check_servers_on_startup()
 
@@ -217,6 +835,10 @@ if __name__ == '__main__':
     health_thread = threading.Thread(target=health_check_loop, daemon=True)
     health_thread.start()
 
+    # Iniciar el thread que vigila el archivo de backends
+    registry_thread = threading.Thread(target=registry_watch_loop, daemon=True)
+    registry_thread.start()
+
     logger.info("Balanceador de carga iniciado en http://localhost:8080")
     logger.info("Puedes verificar el estado de los servidores en http://localhost:8080/status")
-    app.run(host='0.0.0.0', port=8080, debug=True, use_reloader=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8080, debug=True, use_reloader=False)
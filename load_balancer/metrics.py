@@ -0,0 +1,127 @@
+'''
+Métricas del balanceador en formato de texto de Prometheus (/metrics).
+
+Los contadores e histogramas se actualizan en memoria con un lock de corta duración; el texto se
+genera solo cuando alguien consulta /metrics, por lo que el costo en el camino del proxy es mínimo.
+'''
+
+import bisect
+import threading
+
+# Límites superiores (segundos) de los buckets del histograma de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{escape_label(v)}"' for k, v in labels) + '}'
+
+
+def format_sample(name, labels, value):
+    return f'{name}{format_labels(labels)} {value}'
+
+
+class Histogram:
+    """Histograma acumulativo de una serie (buckets fijos)"""
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # El último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, buckets, value):
+        self.counts[bisect.bisect_left(buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Contadores de solicitudes, errores e histogramas de latencia por backend y código de estado"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._responses = {}  # código entregado al cliente -> cantidad
+        self._upstream_requests = {}  # (backend, código) -> cantidad
+        self._upstream_errors = {}  # (backend, tipo de error) -> cantidad
+        self._latency = {}  # (backend, código) -> Histogram
+        self._retries = {}  # tipo (retry, hedge, hedge_win, budget_exhausted) -> cantidad
+
+    def record_response(self, status):
+        """Respuesta entregada al cliente (incluye las servidas desde la caché y los 502/503 propios)"""
+        with self._lock:
+            self._responses[status] = self._responses.get(status, 0) + 1
+
+    def observe_upstream(self, server, status, latency):
+        key = (server, status)
+        with self._lock:
+            self._upstream_requests[key] = self._upstream_requests.get(key, 0) + 1
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(self.buckets)
+            histogram.observe(self.buckets, latency)
+
+    def record_error(self, server, error):
+        key = (server, error)
+        with self._lock:
+            self._upstream_errors[key] = self._upstream_errors.get(key, 0) + 1
+
+    def record_retry(self, kind):
+        with self._lock:
+            self._retries[kind] = self._retries.get(kind, 0) + 1
+
+    def render(self):
+        """Retorna las líneas de texto de las métricas propias"""
+        with self._lock:
+            responses = dict(self._responses)
+            requests = dict(self._upstream_requests)
+            errors = dict(self._upstream_errors)
+            retries = dict(self._retries)
+            latency = {key: (list(h.counts), h.sum, h.count) for key, h in self._latency.items()}
+
+        lines = [
+            '# HELP lb_requests_total Respuestas entregadas a los clientes por código de estado.',
+            '# TYPE lb_requests_total counter',
+        ]
+        for status, count in sorted(responses.items()):
+            lines.append(format_sample('lb_requests_total', [('status', status)], count))
+
+        lines += [
+            '# HELP lb_upstream_requests_total Respuestas recibidas de cada backend por código de estado.',
+            '# TYPE lb_upstream_requests_total counter',
+        ]
+        for (server, status), count in sorted(requests.items()):
+            lines.append(format_sample('lb_upstream_requests_total', [('upstream', server), ('status', status)], count))
+
+        lines += [
+            '# HELP lb_upstream_errors_total Errores de conexión o timeouts al contactar cada backend.',
+            '# TYPE lb_upstream_errors_total counter',
+        ]
+        for (server, error), count in sorted(errors.items()):
+            lines.append(format_sample('lb_upstream_errors_total', [('upstream', server), ('error', error)], count))
+
+        lines += [
+            '# HELP lb_retries_total Reintentos y copias de hedge enviadas, hedges ganados y presupuesto agotado.',
+            '# TYPE lb_retries_total counter',
+        ]
+        for kind, count in sorted(retries.items()):
+            lines.append(format_sample('lb_retries_total', [('kind', kind)], count))
+
+        lines += [
+            '# HELP lb_upstream_latency_seconds Tiempo hasta recibir los encabezados de la respuesta del backend.',
+            '# TYPE lb_upstream_latency_seconds histogram',
+        ]
+        for (server, status), (counts, total, count) in sorted(latency.items()):
+            labels = [('upstream', server), ('status', status)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(format_sample('lb_upstream_latency_seconds_bucket', labels + [('le', bound)], cumulative))
+            lines.append(format_sample('lb_upstream_latency_seconds_sum', labels, round(total, 6)))
+            lines.append(format_sample('lb_upstream_latency_seconds_count', labels, count))
+        return lines
@@ -0,0 +1,242 @@
+'''
+Caché de respuestas del balanceador para las rutas de lectura.
+
+Guarda en memoria las respuestas GET de las rutas configuradas, con un TTL por ruta y un límite
+de entradas y de bytes (desalojo LRU). Cualquier solicitud que modifica datos (POST, PUT, DELETE)
+invalida la caché completa.
+
+Las respuestas con ETag se revalidan en lugar de descartarse: al vencer, la copia se conserva y la
+siguiente solicitud se envía al backend con If-None-Match. Si el backend responde 304, la copia
+vuelve a estar vigente sin transferir el cuerpo otra vez. Si el cliente ya tiene la versión de la
+copia (su If-None-Match coincide), el balanceador le responde 304 directamente.
+'''
+
+import threading
+import time
+from collections import OrderedDict
+
+MUTATING_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# Encabezados de la respuesta completa que se repiten en un 304
+NOT_MODIFIED_HEADERS = {'etag', 'vary', 'cache-control', 'content-location', 'date', 'expires', 'x-upstream-server'}
+
+
+def header_value(headers, name):
+    """Valor de un encabezado en una lista de pares (sin distinguir mayúsculas), o None"""
+    name = name.lower()
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """Comparación débil de If-None-Match: "*" o alguno de los ETags de la lista, con o sin W/"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+
+def with_if_none_match(headers, etag):
+    """Copia de los encabezados hacia el backend con el ETag agregado a If-None-Match"""
+    result = {k: v for k, v in headers.items() if k.lower() != 'if-none-match'}
+    previous = header_value(headers.items(), 'If-None-Match')
+    if previous and previous.strip() == '*':
+        result['If-None-Match'] = previous  # "*" ya incluye cualquier ETag
+    else:
+        result['If-None-Match'] = f"{previous}, {etag}" if previous else etag
+    return result
+
+
+class CachedResponse:
+    def __init__(self, status, headers, body, expires):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        self.etag = header_value(headers, 'ETag')
+        self.stale = False
+
+    def reply(self, if_none_match):
+        """(estado, encabezados, cuerpo) para el cliente: 304 sin cuerpo si ya tiene esta versión"""
+        if etag_matches(if_none_match, self.etag):
+            return 304, [(k, v) for k, v in self.headers if k.lower() in NOT_MODIFIED_HEADERS], b''
+        return self.status, self.headers, self.body
+
+
+class CacheWriter:
+    """Acumula el cuerpo de una respuesta mientras se transmite y la guarda al terminar"""
+
+    def __init__(self, cache, key, ttl, generation, status, headers):
+        self.cache = cache
+        self.key = key
+        self.ttl = ttl
+        self.generation = generation
+        self.status = status
+        self.headers = headers
+        self.chunks = []
+        self.size = 0
+        self.too_large = False
+
+    def write(self, chunk):
+        if self.too_large:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_entry_bytes:
+            # Las respuestas muy grandes se transmiten sin guardarse
+            self.too_large = True
+            self.chunks = []
+            return
+        self.chunks.append(chunk)
+
+    def commit(self):
+        if not self.too_large:
+            self.cache.put(self.key, self.status, self.headers, b''.join(self.chunks), self.ttl, self.generation)
+
+
+def parse_route_ttls(value):
+    """Convierte "/api/tasks=2,/=2" en un diccionario ruta -> TTL en segundos"""
+    ttls = {}
+    for item in value.split(','):
+        if '=' in item:
+            route, ttl = item.rsplit('=', 1)
+            ttls[route.strip()] = float(ttl)
+    return ttls
+
+
+class ResponseCache:
+    """Caché LRU con TTL por ruta, segura para usar desde varios threads"""
+
+    def __init__(self, route_ttls, max_entries=256, max_bytes=32 * 1024 * 1024, max_entry_bytes=4 * 1024 * 1024):
+        self.route_ttls = route_ttls
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.revalidations = 0
+
+    def ttl_for(self, method, path):
+        """TTL de la ruta, o None si la solicitud no se puede guardar en caché"""
+        if method != 'GET':
+            return None
+        return self.route_ttls.get(path)
+
+    @staticmethod
+    def key(method, path, query, headers):
+        # Las respuestas dependen también de la representación pedida por el cliente
+        return (method, path, query, headers.get('Accept', ''), headers.get('Accept-Encoding', ''))
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        """Entrada vigente, o None; las vencidas con ETag se conservan para revalidarlas (stale)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires <= time.time():
+                if not entry.stale:
+                    self.expirations += 1
+                if entry.etag is None:
+                    self._remove(key)
+                else:
+                    entry.stale = True
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def stale(self, key):
+        """Entrada vencida que se puede revalidar con su ETag, o None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.etag is not None and entry.expires <= time.time():
+                return entry
+            return None
+
+    def revalidate(self, key, entry, ttl, generation):
+        """El backend confirmó (304) que la entrada sigue vigente: se renueva su TTL"""
+        with self._lock:
+            if generation != self._generation or self._entries.get(key) is not entry:
+                return False
+            entry.expires = time.time() + ttl
+            entry.stale = False
+            self._entries.move_to_end(key)
+            self.revalidations += 1
+            return True
+
+    def put(self, key, status, headers, body, ttl, generation):
+        """Guarda la respuesta solo si no hubo una escritura desde que se pidió (misma generación)"""
+        if status != 200 or len(body) > self.max_entry_bytes or not self._is_storable(headers):
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedResponse(status, headers, body, time.time() + ttl)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    @staticmethod
+    def _is_storable(headers):
+        for k, v in headers:
+            if k.lower() == 'set-cookie':
+                return False
+            if k.lower() == 'cache-control' and ('no-store' in v or 'private' in v):
+                return False
+        return True
+
+    def writer(self, key, ttl, generation, status, headers):
+        return CacheWriter(self, key, ttl, generation, status, headers)
+
+    def invalidate(self):
+        """Descarta todas las entradas y las respuestas que estén en camino de guardarse"""
+        with self._lock:
+            self._generation += 1
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "revalidations": self.revalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
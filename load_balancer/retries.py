@@ -0,0 +1,95 @@
+'''
+Reintentos y hedging de solicitudes en el balanceador.
+
+- Solo GET y HEAD se consideran idempotentes: en las rutas antiguas de la aplicación PUT y DELETE
+  usan la posición de la tarea, por lo que repetirlos puede modificar o borrar otra tarea.
+- Los reintentos y las copias de hedge consumen un presupuesto global, proporcional al tráfico,
+  para que durante una caída no multipliquen la carga sobre los backends que quedan.
+'''
+
+import errno
+import threading
+import time
+from collections import deque
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD'}
+
+
+def is_connection_refused(error):
+    """Indica si el backend rechazó la conexión (la solicitud no llegó a enviarse)"""
+    while error is not None:
+        if isinstance(error, ConnectionRefusedError) or getattr(error, 'errno', None) == errno.ECONNREFUSED:
+            return True
+        # aiohttp envuelve el error del socket en ClientConnectorError.os_error
+        error = getattr(error, 'os_error', None) or error.__cause__
+    return False
+
+
+def is_retryable(method, error):
+    """GET y HEAD se reintentan ante cualquier fallo; el resto solo si la conexión fue rechazada"""
+    return method in IDEMPOTENT_METHODS or is_connection_refused(error)
+
+
+class RetryBudget:
+    """
+    Presupuesto de reintentos en una ventana deslizante de 'window' segundos: se permiten
+    min_per_second * window reintentos más 'ratio' veces las solicitudes de la ventana.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=5, window=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._buckets = deque()  # [segundo, solicitudes, reintentos]
+        self._lock = threading.Lock()
+
+    def _current(self):
+        now = int(time.time())
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self):
+        with self._lock:
+            self._current()[1] += 1
+
+    def try_spend(self):
+        """Reserva un reintento si queda presupuesto"""
+        with self._lock:
+            bucket = self._current()
+            requests = sum(b[1] for b in self._buckets)
+            retries = sum(b[2] for b in self._buckets)
+            if retries >= self.min_per_second * self.window + self.ratio * requests:
+                return False
+            bucket[2] += 1
+            return True
+
+
+class LatencyWindow:
+    """Últimas muestras de latencia de los backends, para calcular el retardo del hedge"""
+
+    def __init__(self, size=1000, min_samples=20, refresh=1.0):
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self._samples = deque(maxlen=size)
+        self._cache = {}  # percentil -> (calculado en, valor)
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        self._samples.append(latency)
+
+    def percentile(self, p):
+        """Percentil p (0-100) de las muestras, recalculado como mucho una vez por 'refresh' segundos"""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(p)
+            if cached and now - cached[0] < self.refresh:
+                return cached[1]
+            samples = sorted(self._samples)
+            value = None
+            if len(samples) >= self.min_samples:
+                value = samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+            self._cache[p] = (now, value)
+            return value
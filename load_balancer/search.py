@@ -0,0 +1,218 @@
+'''
+Búsqueda de texto en los títulos de las tareas con un índice invertido en memoria.
+
+- Los títulos se dividen en términos en minúsculas y sin tildes ("Revisión" -> "revision"), así que
+  una búsqueda sin tildes encuentra títulos con tildes y al revés.
+- Una consulta es una lista de términos que deben aparecer todos; un término que termina en "*" es
+  un prefijo ("revis*" encuentra "revisar", "revisión", ...).
+- Los resultados se ordenan por relevancia. Con BM25, un término pesa más cuanto más corto es el
+  título (en un título, repetir una palabra no lo hace más relevante). Como todas las tareas del
+  resultado contienen todos los términos, la relevancia la decide la longitud del título: primero
+  los títulos más cortos y, a igual longitud, por id.
+
+Cada término tiene sus tareas (posting) agrupadas por longitud del título y, en cada grupo, por id.
+La búsqueda recorre los postings del término menos frecuente en ese orden y se detiene al juntar
+'limit' tareas que contienen los demás términos: las primeras que encuentra son las más relevantes.
+
+Las actualizaciones son incrementales: una tarea nueva tiene el id más alto, así que se agrega al
+final de su grupo. Una tarea borrada se quita del índice de títulos y sus postings se descartan al
+recorrerlos; el posting de un término se limpia cuando más de la mitad de sus entradas son de tareas borradas.
+'''
+
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from collections import defaultdict
+from itertools import islice
+
+# Letras y números (el guion bajo separa términos, igual que en el tokenizador de SQLite FTS5)
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+QUERY_PATTERN = re.compile(r"([^\W_]+)(\*?)")
+# Tildes, diéresis y demás marcas que quedan separadas de la letra al descomponer (NFKD)
+COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+
+# Términos nuevos que se acumulan en una lista aparte antes de mezclarlos con el vocabulario ordenado
+RECENT_TERMS_MAX = 4096
+
+
+def fold(text):
+    """Minúsculas y sin marcas diacríticas: "Canción" -> "cancion" (la ñ queda como n)"""
+    if text.isascii():
+        return text.lower()
+    return COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text.casefold()))
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+def parse_query(query):
+    """Lista de (término, es prefijo) de una consulta, sin repetidos y en orden"""
+    clauses = []
+    for term, star in QUERY_PATTERN.findall(fold(query)):
+        clause = (term, bool(star))
+        if clause not in clauses:
+            clauses.append(clause)
+    return clauses
+
+
+class SearchIndex:
+    """
+    Índice invertido de los títulos: término -> {longitud del título: array de números de id}.
+    Las tareas se identifican por el número de su id ("t12" -> 12). Es seguro usarlo desde varios threads.
+    """
+
+    def __init__(self, max_expansions=256):
+        self.max_expansions = max_expansions  # Términos por prefijo (los primeros en orden alfabético)
+        self._postings = {}
+        self._stale = {}  # Término -> entradas de tareas borradas que todavía están en su posting
+        self._doc_terms = {}  # Número de id -> términos del título, para verificar y filtrar
+        # Vocabulario ordenado para expandir los prefijos con búsqueda binaria, más los términos
+        # nuevos en una lista chica; puede incluir términos que ya no tienen postings
+        self._terms = []
+        self._recent_terms = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, items, max_expansions=256):
+        """Índice de (número de id, título); ordena cada grupo una sola vez en lugar de insertar"""
+        index = cls(max_expansions)
+        groups = defaultdict(list)
+        doc_terms = index._doc_terms
+        for number, title in items:
+            terms = doc_terms[number] = tuple(tokenize(title))
+            for term in set(terms):
+                groups[term, len(terms)].append(number)
+        postings = index._postings
+        for (term, length), numbers in groups.items():
+            numbers.sort()
+            postings.setdefault(term, {})[length] = array('q', numbers)
+        index._terms = sorted(postings)
+        return index
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, number, title):
+        with self._lock:
+            self._remove(number)
+            terms = self._doc_terms[number] = tuple(tokenize(title))
+            for term in set(terms):
+                buckets = self._postings.get(term)
+                if buckets is None:
+                    buckets = self._postings[term] = {}
+                    self._add_term(term)
+                numbers = buckets.get(len(terms))
+                if numbers is None:
+                    buckets[len(terms)] = array('q', [number])
+                elif numbers[-1] < number:
+                    numbers.append(number)  # El caso habitual: el id más alto hasta ahora
+                else:
+                    bisect.insort(numbers, number)
+
+    def remove(self, number):
+        with self._lock:
+            self._remove(number)
+
+    def _remove(self, number):
+        terms = self._doc_terms.pop(number, None)
+        if terms is None:
+            return
+        for term in set(terms):
+            stale = self._stale[term] = self._stale.get(term, 0) + 1
+            if stale * 2 > sum(len(numbers) for numbers in self._postings[term].values()):
+                self._compact(term)
+
+    def _live(self, number, term, length):
+        terms = self._doc_terms.get(number)
+        return terms is not None and len(terms) == length and term in terms
+
+    def _compact(self, term):
+        """Quita del posting del término las entradas de tareas borradas"""
+        buckets = {}
+        for length, numbers in self._postings[term].items():
+            live = array('q', (number for number in numbers if self._live(number, term, length)))
+            if live:
+                buckets[length] = live
+        self._stale.pop(term, None)
+        if buckets:
+            self._postings[term] = buckets
+        else:
+            del self._postings[term]
+
+    def _add_term(self, term):
+        position = bisect.bisect_left(self._terms, term)
+        if position < len(self._terms) and self._terms[position] == term:
+            return  # Sigue en el vocabulario desde que se borró su última tarea
+        bisect.insort(self._recent_terms, term)
+        if len(self._recent_terms) > RECENT_TERMS_MAX:
+            # Mezclar dos listas ordenadas es lineal; de paso se quitan los términos sin postings
+            merged = sorted(self._terms + self._recent_terms)
+            self._terms = [t for t in merged if t in self._postings]
+            self._recent_terms = []
+
+    def _expand(self, term, prefix):
+        """Términos del índice para una cláusula: el término exacto, o los que empiezan con el prefijo"""
+        if not prefix:
+            return [term] if term in self._postings else []
+        found = []
+        for vocabulary in (self._terms, self._recent_terms):
+            for candidate in islice(vocabulary, bisect.bisect_left(vocabulary, term), None):
+                if not candidate.startswith(term):
+                    break
+                if candidate in self._postings:
+                    found.append(candidate)
+                    if len(found) > 2 * self.max_expansions:
+                        break
+        return sorted(found)[:self.max_expansions]
+
+    def _size(self, terms):
+        return sum(len(numbers) for term in terms for numbers in self._postings[term].values())
+
+    def _ordered(self, terms):
+        """(longitud, número) de las tareas con alguno de los términos, por longitud y luego por id"""
+        buckets = defaultdict(list)
+        for term in terms:
+            for length, numbers in self._postings[term].items():
+                buckets[length].append(numbers)
+        for length in sorted(buckets):
+            arrays = buckets[length]
+            for number in arrays[0] if len(arrays) == 1 else heapq.merge(*arrays):
+                yield length, number
+
+    def search(self, clauses, limit, accept=None):
+        """
+        Números de id de las 'limit' tareas más relevantes que contienen todas las cláusulas
+        (lista de (término, es prefijo)) y cumplen accept(número), de mayor a menor relevancia.
+        """
+        with self._lock:
+            groups = []  # Por cláusula, los términos del índice que la cumplen
+            for term, prefix in clauses:
+                terms = self._expand(term, prefix)
+                if not terms:
+                    return []
+                groups.append(terms)
+            if not groups or limit <= 0:
+                return []
+
+            # Se recorre la cláusula con menos postings y se verifican todas en los términos de cada
+            # tarea (lo que también descarta las entradas de tareas borradas)
+            groups.sort(key=self._size)
+            required = [frozenset(terms) for terms in groups]
+            result = []
+            previous = None
+            for length, number in self._ordered(groups[0]):
+                if (length, number) == previous:
+                    continue  # La misma tarea en dos términos de un prefijo
+                previous = length, number
+                terms = self._doc_terms.get(number)
+                if terms is None or len(terms) != length:
+                    continue
+                if all(not group.isdisjoint(terms) for group in required) and (accept is None or accept(number)):
+                    result.append(number)
+                    if len(result) == limit:
+                        break
+            return result
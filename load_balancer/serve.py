@@ -0,0 +1,107 @@
+'''
+Servidor de producción de app.py con gunicorn: varios procesos (workers) con varios threads cada uno,
+para usar todos los núcleos con un solo comando.
+
+    pip install gunicorn
+    python serve.py 5001        # en lugar de: python app.py 5001 (servidor de desarrollo)
+
+- APP_WORKERS procesos (por defecto, uno por CPU) con APP_THREADS threads cada uno. Un stream de
+  GET /api/tasks/events ocupa un thread mientras está abierto: cada worker admite streams hasta la
+  mitad de sus threads (TASKS_EVENTS_MAX_CLIENTS, si no se define).
+- La aplicación se carga una sola vez antes de crear los workers (APP_PRELOAD=1): un error al
+  importarla detiene el arranque. Los threads no sobreviven a fork, así que cada worker rehace su
+  estado propio (almacenamiento, eventos, envío de logs) con app.after_fork().
+- Cada worker se reemplaza después de APP_MAX_REQUESTS solicitudes, más un número al azar de hasta
+  APP_MAX_REQUESTS_JITTER para que no se reinicien todos a la vez.
+- kill -HUP <pid>: vuelve a leer la configuración, crea workers nuevos y los anteriores terminan las
+  solicitudes en curso. Con APP_PRELOAD=1 el código no se recarga: para desplegar una versión nueva,
+  reiniciar el servidor o usar APP_PRELOAD=0.
+- kill -TERM <pid>: deja de aceptar conexiones y espera hasta APP_GRACEFUL_TIMEOUT segundos a las
+  solicitudes en curso. Los streams de eventos se cierran enseguida y los clientes se reconectan.
+- Las conexiones keep-alive duran APP_KEEPALIVE segundos, más que LB_POOL_IDLE_TIMEOUT, para que el
+  backend no cierre una conexión que el pool del balanceador todavía considera reutilizable.
+'''
+
+import multiprocessing
+import os
+import signal
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+APP_WORKERS = int(os.environ.get("APP_WORKERS", multiprocessing.cpu_count()))
+APP_THREADS = int(os.environ.get("APP_THREADS", 32))
+APP_PRELOAD = os.environ.get("APP_PRELOAD", "1") == "1"
+APP_MAX_REQUESTS = int(os.environ.get("APP_MAX_REQUESTS", 10000))  # 0: los workers no se reemplazan
+APP_MAX_REQUESTS_JITTER = int(os.environ.get("APP_MAX_REQUESTS_JITTER", 1000))
+APP_GRACEFUL_TIMEOUT = int(os.environ.get("APP_GRACEFUL_TIMEOUT", 30))
+APP_KEEPALIVE = int(os.environ.get("APP_KEEPALIVE", 65))
+
+# Los streams de eventos no pueden ocupar todos los threads de un worker
+os.environ.setdefault("TASKS_EVENTS_MAX_CLIENTS", str(max(1, APP_THREADS // 2)))
+
+
+def app_module():
+    """El módulo app, si ya se cargó en este proceso (con APP_PRELOAD=0 el proceso principal no lo carga)"""
+    return sys.modules.get("app")
+
+
+# --- Hooks de gunicorn ---
+
+def when_ready(server):
+    # Un solo registro en el balanceador por instancia, desde el proceso principal
+    if os.environ.get("BALANCER_URL"):
+        import app
+        port = server.address[0][1]
+        app.register_with_balancer(os.environ.get("BACKEND_URL", f"http://localhost:{port}"))
+
+
+def post_fork(server, worker):
+    app = app_module()
+    if app is not None:
+        app.after_fork()
+
+
+def post_worker_init(worker):
+    # gunicorn detiene los workers con SIGTERM (también al recargar con HUP); los streams de eventos
+    # no terminan solos y demorarían la salida hasta APP_GRACEFUL_TIMEOUT
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(sig, frame):
+        app_module().worker_stopping()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+class TaskServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"Servidor iniciado en puerto: {port} ({APP_WORKERS} workers de {APP_THREADS} threads)")
+    TaskServer({
+        "bind": f"0.0.0.0:{port}",
+        "workers": APP_WORKERS,
+        "worker_class": "gthread",
+        "threads": APP_THREADS,
+        "preload_app": APP_PRELOAD,
+        "max_requests": APP_MAX_REQUESTS,
+        "max_requests_jitter": APP_MAX_REQUESTS_JITTER,
+        "graceful_timeout": APP_GRACEFUL_TIMEOUT,
+        "keepalive": APP_KEEPALIVE,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+    }).run()
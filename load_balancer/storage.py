@@ -0,0 +1,1057 @@
+'''
+Almacenamiento de las tareas del gestor (app.py).
+
+- JsonTaskStore: el archivo tasks.json, que se lee y se reescribe completo en cada operación.
+  Las escrituras son atómicas (archivo temporal + fsync + rename) y se serializan entre procesos
+  con un lock sobre tasks.json.lock, por lo que varias instancias pueden compartir el archivo.
+  Las lecturas se sirven desde memoria mientras el archivo no cambie (mtime, tamaño e inodo).
+  El archivo se escribe en JSON compacto (o MessagePack, o indentado) y se lee en cualquiera de ellos.
+- SqliteTaskStore: una base SQLite en modo WAL. Cada operación modifica una sola fila, los lectores
+  no bloquean a los escritores y varias instancias de app.py pueden usar la misma base a la vez.
+  Al crearse importa una única vez las tareas de tasks.json.
+- JournalTaskStore: cada operación se agrega como una línea a tasks.journal y el estado es la última
+  instantánea (tasks.json) más las líneas del journal. Un thread compacta el journal en una
+  instantánea nueva cuando supera un tamaño máximo.
+
+Cada tarea tiene un id estable ("t12") que no cambia al borrar otras tareas y no se reutiliza.
+Todos los motores guardan un contador de versión junto con los datos, que se incrementa con cada
+escritura: app.py lo expone como ETag y rechaza las escrituras con una versión esperada distinta.
+
+Todos los motores ofrecen búsqueda de texto en los títulos (search.py) con un índice invertido en
+memoria que se actualiza con cada operación en lugar de reconstruirse.
+
+El motor se elige con create_store() según la variable de entorno TASKS_STORAGE (json, sqlite o journal).
+'''
+
+import base64
+import bisect
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from search import SearchIndex
+from serialization import FILE_FORMATS, dumps_document, dumps_json, loads_document, loads_json
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class VersionConflict(Exception):
+    """La versión de los datos no es la que esperaba el cliente"""
+
+    def __init__(self, current_version):
+        super().__init__(f"Las tareas cambiaron (versión actual {current_version})")
+        self.current_version = current_version
+
+
+# Formato de los ids: una letra y un número, para no confundirlos con las posiciones de las rutas antiguas
+TASK_ID_PATTERN = r"t[0-9]+"
+
+
+def format_task_id(number):
+    return f"t{number}"
+
+
+def task_id_number(task_id):
+    """Número de un id ('t12' -> 12); 0 si no tiene el formato de los ids generados"""
+    if isinstance(task_id, str) and re.fullmatch(TASK_ID_PATTERN, task_id):
+        return int(task_id[1:])
+    return 0
+
+
+def validate_tasks(tasks, next_id=1):
+    """
+    Filtra las tareas que no contienen el campo 'title' y asegura que todas tengan 'completed' e 'id'.
+    Las tareas sin id (archivos anteriores) o con un id repetido reciben uno nuevo en orden, así que
+    todos los procesos que leen el mismo archivo les asignan los mismos ids.
+    Retorna (tareas válidas, número del siguiente id).
+    """
+    valid_tasks = []
+    for task in tasks:
+        if isinstance(task, dict) and 'title' in task:
+            if 'completed' not in task:
+                task['completed'] = False  # Si no tiene 'completed', lo agregamos como False
+            valid_tasks.append(task)
+
+    next_id = max([next_id] + [task_id_number(task.get('id')) + 1 for task in valid_tasks])
+    seen = set()
+    for position, task in enumerate(valid_tasks):
+        if task_id_number(task.get('id')) == 0 or task['id'] in seen:
+            fields = {key: value for key, value in task.items() if key != 'id'}
+            task = valid_tasks[position] = {'id': format_task_id(next_id), **fields}
+            next_id += 1
+        seen.add(task['id'])
+    return valid_tasks, next_id
+
+
+# Criterios de orden de los listados paginados: campos de la clave de orden (única gracias al id)
+SORT_FIELDS = {
+    "id": ("id",),
+    "title": ("title", "id"),
+}
+
+
+def sort_key(sort, task):
+    return tuple(task_id_number(task['id']) if field == "id" else task[field] for field in SORT_FIELDS[sort])
+
+
+def encode_cursor(sort, key):
+    """Cursor opaco con la clave de orden de la última tarea entregada"""
+    raw = json.dumps([sort, list(key)], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    """Clave de orden de un cursor; ValueError si es inválido o de otro criterio de orden"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+    fields = SORT_FIELDS[sort]
+    if cursor_sort != sort or not isinstance(key, list) or len(key) != len(fields):
+        raise ValueError("El cursor corresponde a otro orden")
+    for field, value in zip(fields, key):
+        if not isinstance(value, int if field == "id" else str):
+            raise ValueError("Cursor inválido")
+    return tuple(key)
+
+
+def prefix_end(prefix):
+    """Menor cadena mayor que todas las que empiezan con 'prefix' (límite de un rango por prefijo)"""
+    return prefix + '\U0010ffff'
+
+
+class TaskIndex:
+    """
+    Tareas en orden de creación indexadas por id en un dict, que conserva el orden de inserción:
+    buscar, completar y borrar una tarea es O(1). La lista ordenada y las vistas ordenadas para
+    paginar se arman solo al leerlas después de un cambio. Las tareas no se modifican en el lugar,
+    sino que se reemplazan por una copia, por lo que una lista ya entregada a un lector no cambia.
+    """
+
+    def __init__(self, tasks=(), next_id=1):
+        self.by_id = {task['id']: task for task in tasks}
+        self.next_id = next_id
+        self._list = None
+        self._views = {}  # (orden, completed) -> (claves ordenadas, tareas en ese orden)
+        self._search = None  # SearchIndex, se arma en la primera búsqueda
+        self._search_pending = None  # Cambios de una copia que todavía no se pasaron al índice compartido
+        self._search_lock = threading.Lock()
+
+    def _changed(self):
+        self._list = None
+        self._views = {}
+
+    def copy(self, share_search=False):
+        """
+        Copia para modificar. Con share_search, la copia usa el mismo índice de búsqueda y guarda sus
+        cambios hasta commit_search(), para no reconstruirlo en cada escritura.
+        """
+        index = TaskIndex(self.by_id.values(), self.next_id)
+        if share_search and self._search is not None:
+            index._search, index._search_pending = self._search, []
+        return index
+
+    def adopt_search(self, previous):
+        """
+        Usa el índice de búsqueda de 'previous', otra versión de las mismas tareas (p. ej. el archivo
+        que escribió otro proceso), y le aplica las diferencias de títulos en lugar de armarlo de nuevo
+        """
+        with previous._search_lock:
+            search = previous._search
+        if search is None:
+            return
+        old, new = previous.by_id, self.by_id
+        for task_id in old.keys() - new.keys():
+            search.remove(task_id_number(task_id))
+        for task_id, task in new.items():
+            old_task = old.get(task_id)
+            if old_task is None or old_task['title'] != task['title']:
+                search.add(task_id_number(task_id), task['title'])
+        self._search = search
+
+    def commit_search(self):
+        """Aplica al índice de búsqueda compartido los cambios de esta copia (una vez guardada)"""
+        if self._search_pending:
+            for number, title in self._search_pending:
+                self._update_search(number, title)
+        self._search_pending = None
+
+    def _search_changed(self, task_id, title):
+        """Registra un título nuevo (o None si la tarea se borró) en el índice de búsqueda, si existe"""
+        if self._search is None:
+            return
+        if self._search_pending is not None:
+            self._search_pending.append((task_id_number(task_id), title))
+        else:
+            self._update_search(task_id_number(task_id), title)
+
+    def _update_search(self, number, title):
+        if title is None:
+            self._search.remove(number)
+        else:
+            self._search.add(number, title)
+
+    def search(self, clauses, limit, completed=None):
+        """Las 'limit' tareas más relevantes para la consulta (lista de (término, es prefijo) de search.py)"""
+        with self._search_lock:
+            if self._search is None:
+                self._search = SearchIndex.build(
+                    (task_id_number(task['id']), task['title']) for task in self.by_id.values()
+                )
+        by_id = self.by_id
+
+        def accept(number):
+            # Con el índice compartido, puede incluir tareas de una versión posterior a esta copia
+            task = by_id.get(format_task_id(number))
+            return task is not None and (completed is None or task['completed'] == completed)
+        return [by_id[format_task_id(number)] for number in self._search.search(clauses, limit, accept)]
+
+    def list(self):
+        if self._list is None:
+            self._list = list(self.by_id.values())
+        return self._list
+
+    def _view(self, sort, completed):
+        view = self._views.get((sort, completed))
+        if view is None:
+            tasks = self.list()
+            if completed is not None:
+                tasks = [task for task in tasks if task['completed'] == completed]
+            keys = [sort_key(sort, task) for task in tasks]
+            order = sorted(range(len(tasks)), key=keys.__getitem__)  # Ya ordenada por id en el caso habitual: O(n)
+            view = self._views[(sort, completed)] = ([keys[i] for i in order], [tasks[i] for i in order])
+        return view
+
+    def page(self, limit, after=None, sort="id", descending=False, completed=None, prefix=None):
+        """
+        Hasta 'limit' tareas a continuación de la clave 'after' en el orden pedido, con búsqueda
+        binaria sobre la vista ordenada. Retorna (tareas, si hay más).
+        """
+        keys, tasks = self._view(sort, completed)
+        lo, hi = 0, len(keys)
+        if after is not None:
+            if descending:
+                hi = bisect.bisect_left(keys, after)
+            else:
+                lo = bisect.bisect_right(keys, after)
+        if prefix and sort == "title":
+            # Ordenadas por título, las que tienen el prefijo forman un rango contiguo
+            lo = max(lo, bisect.bisect_left(keys, (prefix,)))
+            hi = min(hi, bisect.bisect_left(keys, (prefix_end(prefix),)))
+
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        result = []
+        for position in positions:
+            task = tasks[position]
+            if prefix and not task['title'].startswith(prefix):
+                continue
+            if len(result) == limit:
+                return result, True
+            result.append(task)
+        return result, False
+
+    def get(self, task_id):
+        return self.by_id.get(task_id)
+
+    def id_at(self, index):
+        tasks = self.list()
+        return tasks[index]['id'] if 0 <= index < len(tasks) else None
+
+    def insert(self, task):
+        self.by_id[task['id']] = task
+        self.next_id = max(self.next_id, task_id_number(task['id']) + 1)
+        self._changed()
+        self._search_changed(task['id'], task['title'])
+        return task
+
+    def add(self, title):
+        return self.insert({'id': format_task_id(self.next_id), 'title': title, 'completed': False})
+
+    def complete(self, task_id):
+        task = self.by_id.get(task_id)
+        if task is None:
+            return None
+        # Reasignar una clave existente conserva su posición en el dict
+        task = self.by_id[task_id] = dict(task, completed=True)
+        self._changed()
+        return task
+
+    def delete(self, task_id):
+        task = self.by_id.pop(task_id, None)
+        if task is not None:
+            self._changed()
+            self._search_changed(task_id, None)
+        return task
+
+    def apply(self, operation):
+        """Aplica una operación de un lote ({"op": "add", "title": ...} o {"op": "complete" | "delete", "id": ...})"""
+        if operation["op"] == "add":
+            return self.add(operation["title"])
+        if operation["op"] == "complete":
+            return self.complete(operation["id"])
+        return self.delete(operation["id"])
+
+
+class TaskStore:
+    """
+    Interfaz común de los motores de almacenamiento; las tareas se identifican por su id.
+    Las escrituras retornan (tarea o None si no existe, nueva versión) y, si se indica
+    expected_version y no coincide con la versión actual, lanzan VersionConflict sin modificar nada.
+    """
+
+    def read(self):
+        """Retorna (versión, tareas en orden) de forma consistente; la lista no debe modificarse"""
+        raise NotImplementedError
+
+    def version(self):
+        """Versión actual, sin leer las tareas; para responder 304 a las lecturas condicionales"""
+        return self.read()[0]
+
+    def list(self):
+        return self.read()[1]
+
+    def get(self, task_id):
+        """Retorna (versión, tarea o None si no existe)"""
+        raise NotImplementedError
+
+    def id_at(self, index):
+        """Retorna (versión, id de la tarea en la posición 'index' o None); para las rutas antiguas"""
+        version, tasks = self.read()
+        return version, (tasks[index]['id'] if 0 <= index < len(tasks) else None)
+
+    def page(self, limit, after=None, sort="id", descending=False, completed=None, prefix=None):
+        """
+        Página de un listado: hasta 'limit' tareas con clave de orden posterior a 'after' (anterior
+        si descending), filtradas por estado y por prefijo del título. Retorna (versión, tareas, si hay más).
+        """
+        raise NotImplementedError
+
+    def search(self, clauses, limit, completed=None):
+        """
+        Búsqueda de texto en los títulos: las 'limit' tareas más relevantes que contienen todos los
+        términos (lista de (término, es prefijo) de search.parse_query). Retorna (versión, tareas).
+        """
+        raise NotImplementedError
+
+    def add(self, title, expected_version=None):
+        raise NotImplementedError
+
+    def complete(self, task_id, expected_version=None):
+        raise NotImplementedError
+
+    def delete(self, task_id, expected_version=None):
+        raise NotImplementedError
+
+    def apply_batch(self, operations, expected_version=None):
+        """
+        Aplica una lista de operaciones ({"op": "add", "title": ...}, {"op": "complete" | "delete", "id": ...})
+        en orden, con una sola escritura y un solo incremento de versión. Retorna (una tarea o None por
+        operación, nueva versión); las operaciones sobre tareas inexistentes no impiden las demás.
+        """
+        raise NotImplementedError
+
+    def after_fork(self):
+        """
+        En un proceso hijo creado con fork (los workers de serve.py), descarta el estado propio del
+        proceso padre: locks que pudo tener tomados un thread que no existe en el hijo, conexiones y threads.
+        """
+
+
+def file_mode(path, default=0o644):
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        return default
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Lock exclusivo entre procesos sobre lock_path (no excluye a otros threads del mismo proceso)"""
+    with open(lock_path, "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def check_version(current_version, expected_version):
+    if expected_version is not None and expected_version != current_version:
+        raise VersionConflict(current_version)
+
+
+class JsonTaskStore(TaskStore):
+    """
+    Tareas guardadas en un único archivo: {"version": n, "next_id": m, "tasks": [...]}, en el formato
+    file_format de serialization.py ("json" compacto, "pretty" o "msgpack")
+    """
+
+    def __init__(self, path, file_format="json"):
+        self.path = path
+        self.file_format = file_format
+        self.lock_path = path + ".lock"
+        self._thread_lock = threading.Lock()
+        # Caché de la última lectura: (firma del archivo, versión, TaskIndex); nunca se modifica en el lugar
+        self._cache = None
+        self._cache_lock = threading.Lock()
+
+    def after_fork(self):
+        self._thread_lock = threading.Lock()
+        self._cache = None
+        self._cache_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Lock exclusivo entre threads y entre procesos durante un ciclo leer-modificar-escribir"""
+        with self._thread_lock, file_lock(self.lock_path):
+            yield
+
+    def _signature(self):
+        """Identifica el contenido del archivo; el rename atómico de cada escritura cambia el inodo"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _load(self):
+        """Retorna (versión, TaskIndex) desde la caché, o vuelve a leer el archivo si cambió"""
+        signature = self._signature()
+        with self._cache_lock:
+            if self._cache is not None and self._cache[0] == signature:
+                return self._cache[1], self._cache[2]
+        version, index = self._read_file()
+        # Si el archivo cambió entre stat() y la lectura, la firma no coincidirá y se leerá otra vez
+        with self._cache_lock:
+            if self._cache is not None:
+                # Otro proceso escribió el archivo: el índice de búsqueda se actualiza con las diferencias
+                index.adopt_search(self._cache[2])
+            self._cache = (signature, version, index)
+        return version, index
+
+    def read(self):
+        version, index = self._load()
+        return version, index.list()
+
+    def version(self):
+        # Con la caché al día es solo un stat() del archivo
+        return self._load()[0]
+
+    def get(self, task_id):
+        version, index = self._load()
+        return version, index.get(task_id)
+
+    def page(self, limit, after=None, sort="id", descending=False, completed=None, prefix=None):
+        version, index = self._load()
+        return (version,) + index.page(limit, after, sort, descending, completed, prefix)
+
+    def search(self, clauses, limit, completed=None):
+        version, index = self._load()
+        return version, index.search(clauses, limit, completed)
+
+    def _read_file(self):
+        """
+        Carga las tareas desde el archivo. Si el archivo no existe o tiene un formato incorrecto, retorna una lista vacía.
+        El formato anterior (solo el arreglo de tareas) se lee como versión 0.
+        """
+        if not os.path.exists(self.path):
+            return 0, TaskIndex()  # Si no existe el archivo, retornamos una lista vacía
+
+        with open(self.path, "rb") as file:
+            try:
+                data = loads_document(file.read())  # Cargamos las tareas desde el archivo
+            except ValueError:
+                return 0, TaskIndex()  # Si hay un error al decodificar, retornamos una lista vacía
+        if isinstance(data, list):
+            return 0, TaskIndex(*validate_tasks(data))
+        tasks, next_id = validate_tasks(data.get("tasks", []), data.get("next_id", 1))
+        return data.get("version", 0), TaskIndex(tasks, next_id)
+
+    def _save(self, version, index):
+        """Escribe un archivo temporal completo y lo reemplaza atómicamente: nadie ve un archivo a medias"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tasks-", suffix=".tmp")
+        try:
+            # mkstemp crea el archivo con permisos 0600: conservar los del archivo reemplazado
+            os.chmod(tmp_path, file_mode(self.path))
+            with os.fdopen(fd, "wb") as file:
+                data = {"version": version, "next_id": index.next_id, "tasks": index.list()}
+                file.write(dumps_document(data, self.file_format))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if fcntl:
+            # Persistir también la entrada del directorio que apunta al archivo nuevo
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _update(self, expected_version, change):
+        """Aplica change(TaskIndex) bajo el lock; retorna (resultado de change, nueva versión)"""
+        with self._locked():
+            version, cached_index = self._load()
+            check_version(version, expected_version)
+            # Se modifica una copia: el índice en caché puede estar en uso por otras solicitudes
+            index = cached_index.copy(share_search=True)
+            result = change(index)
+            if result is None:
+                return None, version
+            self._save(version + 1, index)
+            index.commit_search()
+            with self._cache_lock:
+                self._cache = (self._signature(), version + 1, index)
+            return result, version + 1
+
+    def add(self, title, expected_version=None):
+        return self._update(expected_version, lambda index: index.add(title))
+
+    def complete(self, task_id, expected_version=None):
+        return self._update(expected_version, lambda index: index.complete(task_id))
+
+    def delete(self, task_id, expected_version=None):
+        return self._update(expected_version, lambda index: index.delete(task_id))
+
+    def apply_batch(self, operations, expected_version=None):
+        results = []
+
+        def change(index):
+            results[:] = [index.apply(operation) for operation in operations]
+            return results if any(result is not None for result in results) else None
+        _, version = self._update(expected_version, change)
+        return results, version
+
+
+class SqliteTaskStore(TaskStore):
+    """
+    Tareas guardadas en SQLite (modo WAL), una fila por tarea.
+
+    Para la búsqueda, unos triggers registran cada alta y baja en task_changes. Cada proceso pone al
+    día su índice en memoria con las filas nuevas de esa tabla, también las que escribieron otros procesos.
+    """
+
+    # Filas de task_changes que se conservan; un proceso más atrasado arma su índice de nuevo
+    SEARCH_LOG_KEEP = 100000
+
+    def __init__(self, path, migrate_from=None):
+        self.path = path
+        self._local = threading.local()  # Una conexión por thread del servidor
+        self._search = None  # SearchIndex, se arma en la primera búsqueda
+        self._search_seq = 0  # Última fila de task_changes aplicada al índice
+        self._search_lock = threading.Lock()
+        with self._write() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " title TEXT NOT NULL,"
+                " completed INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Índices para los listados paginados por título y por estado
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_by_title ON tasks (title, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_by_completed ON tasks (completed, id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+            # Altas y bajas para los índices de búsqueda (title NULL: la tarea se borró)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_changes ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " task_id INTEGER NOT NULL,"
+                " title TEXT)"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS tasks_log_insert AFTER INSERT ON tasks BEGIN"
+                " INSERT INTO task_changes (task_id, title) VALUES (new.id, new.title); END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS tasks_log_delete AFTER DELETE ON tasks BEGIN"
+                " INSERT INTO task_changes (task_id, title) VALUES (old.id, NULL); END"
+            )
+            if migrate_from:
+                self._migrate(conn, migrate_from)
+        # Una conexión de SQLite no debe pasar a un proceso hijo: la de la configuración no se conserva
+        self._local.conn.close()
+        del self._local.conn
+
+    def after_fork(self):
+        self._local = threading.local()
+        self._search = None
+        self._search_seq = 0
+        self._search_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: las transacciones se abren explícitamente con BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")  # Los lectores no bloquean a los escritores
+            conn.execute("PRAGMA synchronous=NORMAL")  # Con WAL sigue siendo seguro ante caídas del proceso
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Transacción de escritura; BEGIN IMMEDIATE toma el lock de escritura desde el inicio"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _version(conn):
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    def _update(self, expected_version, change):
+        """Aplica change(conexión) en una transacción; retorna (resultado de change, nueva versión)"""
+        with self._write() as conn:
+            version = self._version(conn)
+            check_version(version, expected_version)
+            result = change(conn)
+            if result is None:
+                return None, version
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(version + 1),))
+            if (version + 1) % 1000 == 0:
+                conn.execute(
+                    "DELETE FROM task_changes WHERE seq <= (SELECT MAX(seq) FROM task_changes) - ?",
+                    (self.SEARCH_LOG_KEEP,)
+                )
+        return result, version + 1
+
+    @staticmethod
+    def _migrate(conn, json_path):
+        """Importa tasks.json la primera vez que se crea la base (una sola instancia lo hace)"""
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from'").fetchone():
+            return
+        version, index = JsonTaskStore(json_path)._load()
+        # Se conservan los ids de tasks.json; el id de la tarea es el rowid ("t12" -> 12)
+        conn.executemany(
+            "INSERT INTO tasks (id, title, completed) VALUES (?, ?, ?)",
+            [(task_id_number(task['id']), task['title'], int(bool(task['completed']))) for task in index.list()]
+        )
+        # AUTOINCREMENT no debe reutilizar los ids de tareas ya borradas en tasks.json
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'tasks'")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)", (index.next_id - 1,))
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (json_path,))
+
+    @staticmethod
+    def _to_task(row):
+        return {'id': format_task_id(row[0]), 'title': row[1], 'completed': bool(row[2])}
+
+    @staticmethod
+    def _row(conn, task_id):
+        """Fila (id, title, completed) de la tarea; búsqueda por la clave primaria"""
+        number = task_id_number(task_id)
+        if number == 0:
+            return None
+        return conn.execute("SELECT id, title, completed FROM tasks WHERE id = ?", (number,)).fetchone()
+
+    @contextmanager
+    def _snapshot(self):
+        """Transacción de lectura: todas las consultas ven la misma instantánea de la base"""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def read(self):
+        with self._snapshot() as conn:
+            version = self._version(conn)
+            tasks = [self._to_task(row) for row in conn.execute("SELECT id, title, completed FROM tasks ORDER BY id")]
+        return version, tasks
+
+    def version(self):
+        with self._snapshot() as conn:
+            return self._version(conn)
+
+    def get(self, task_id):
+        with self._snapshot() as conn:
+            row = self._row(conn, task_id)
+            return self._version(conn), (self._to_task(row) if row else None)
+
+    def _sync_search(self, conn):
+        """Aplica al índice de búsqueda las filas nuevas de task_changes, o lo arma desde cero"""
+        if self._search is not None:
+            oldest = conn.execute("SELECT MIN(seq) FROM task_changes").fetchone()[0]
+            if oldest is None or oldest <= self._search_seq + 1:
+                changes = conn.execute(
+                    "SELECT seq, task_id, title FROM task_changes WHERE seq > ? ORDER BY seq", (self._search_seq,)
+                )
+                for seq, number, title in changes:
+                    if title is None:
+                        self._search.remove(number)
+                    else:
+                        self._search.add(number, title)
+                    self._search_seq = seq
+                return
+        self._search_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM task_changes").fetchone()[0]
+        self._search = SearchIndex.build(conn.execute("SELECT id, title FROM tasks"))
+
+    def search(self, clauses, limit, completed=None):
+        # El índice queda exactamente en la instantánea de la transacción, que también filtra los resultados
+        with self._search_lock, self._snapshot() as conn:
+            self._sync_search(conn)
+            rows = {}
+
+            def accept(number):
+                row = conn.execute("SELECT id, title, completed FROM tasks WHERE id = ?", (number,)).fetchone()
+                if row is None or (completed is not None and bool(row[2]) != completed):
+                    return False
+                rows[number] = row
+                return True
+            numbers = self._search.search(clauses, limit, accept)
+            return self._version(conn), [self._to_task(rows[number]) for number in numbers]
+
+    def id_at(self, index):
+        with self._snapshot() as conn:
+            row = None
+            if index >= 0:
+                row = conn.execute("SELECT id FROM tasks ORDER BY id LIMIT 1 OFFSET ?", (index,)).fetchone()
+            return self._version(conn), (format_task_id(row[0]) if row else None)
+
+    def page(self, limit, after=None, sort="id", descending=False, completed=None, prefix=None):
+        # Paginación por clave (keyset): cada página es un recorrido acotado de un índice
+        columns = ", ".join(SORT_FIELDS[sort])
+        conditions, params = [], []
+        if completed is not None:
+            conditions.append("completed = ?")
+            params.append(int(completed))
+        if prefix:
+            conditions.append("title >= ? AND title < ?")
+            params += [prefix, prefix_end(prefix)]
+        if after is not None:
+            conditions.append(f"({columns}) {'<' if descending else '>'} ({', '.join('?' * len(after))})")
+            params += list(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = "DESC" if descending else "ASC"
+        order = ", ".join(f"{column} {direction}" for column in columns.split(", "))
+        with self._snapshot() as conn:
+            rows = conn.execute(
+                f"SELECT id, title, completed FROM tasks {where} ORDER BY {order} LIMIT ?", params + [limit + 1]
+            ).fetchall()
+            version = self._version(conn)
+        return version, [self._to_task(row) for row in rows[:limit]], len(rows) > limit
+
+    def add(self, title, expected_version=None):
+        def change(conn):
+            cursor = conn.execute("INSERT INTO tasks (title, completed) VALUES (?, 0)", (title,))
+            return {'id': format_task_id(cursor.lastrowid), 'title': title, 'completed': False}
+        return self._update(expected_version, change)
+
+    def complete(self, task_id, expected_version=None):
+        def change(conn):
+            row = self._row(conn, task_id)
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET completed = 1 WHERE id = ?", (row[0],))
+            return self._to_task((row[0], row[1], True))
+        return self._update(expected_version, change)
+
+    def delete(self, task_id, expected_version=None):
+        def change(conn):
+            row = self._row(conn, task_id)
+            if row is None:
+                return None
+            conn.execute("DELETE FROM tasks WHERE id = ?", (row[0],))
+            return self._to_task(row)
+        return self._update(expected_version, change)
+
+    def apply_batch(self, operations, expected_version=None):
+        results = []
+
+        def change(conn):
+            for operation in operations:
+                if operation["op"] == "add":
+                    cursor = conn.execute("INSERT INTO tasks (title, completed) VALUES (?, 0)", (operation["title"],))
+                    results.append(self._to_task((cursor.lastrowid, operation["title"], False)))
+                    continue
+                row = self._row(conn, operation["id"])
+                if row is None:
+                    results.append(None)
+                elif operation["op"] == "complete":
+                    conn.execute("UPDATE tasks SET completed = 1 WHERE id = ?", (row[0],))
+                    results.append(self._to_task((row[0], row[1], True)))
+                else:
+                    conn.execute("DELETE FROM tasks WHERE id = ?", (row[0],))
+                    results.append(self._to_task(row))
+            return results if any(result is not None for result in results) else None
+        # Todas las operaciones se confirman juntas en la transacción de _update
+        _, version = self._update(expected_version, change)
+        return results, version
+
+
+class JournalTaskStore(TaskStore):
+    """
+    Instantánea (tasks.json, mismo formato que JsonTaskStore) más un journal de operaciones, una por
+    línea: {"v": versión, "op": "add" | "complete" | "delete" | "batch", ...}. Una escritura solo agrega una
+    línea y actualiza el índice en memoria, así que su costo no depende del total de tareas.
+
+    Varios procesos pueden compartir los archivos: las escrituras se serializan con el lock de
+    tasks.json.lock y cada proceso aplica las líneas nuevas del journal antes de leer o escribir.
+    Al compactar se escribe la instantánea y luego se reemplaza el journal por uno vacío (otro inodo),
+    lo que indica a los demás procesos que deben recargar la instantánea.
+    """
+
+    def __init__(self, snapshot_path, journal_path, max_bytes=1024 * 1024, fsync=True, file_format="json"):
+        self.snapshot = JsonTaskStore(snapshot_path, file_format)
+        self.journal_path = journal_path
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._start()
+
+    def after_fork(self):
+        self.snapshot.after_fork()
+        self._start()
+
+    def _start(self):
+        """Carga el estado en memoria e inicia el thread de compactación (también en cada proceso hijo)"""
+        self._state_lock = threading.Lock()
+        self._version = 0
+        self._index = TaskIndex()  # Solo se usa con _state_lock tomado
+        self._journal_ino = None  # Inodo del journal aplicado (None si no existe)
+        self._offset = 0  # Bytes del journal ya aplicados
+
+        self._compact_requested = threading.Event()
+        threading.Thread(target=self._compaction_loop, daemon=True, name="journal-compactor").start()
+        with self._state_lock:
+            self._reload(None)  # La instantánea se carga aunque todavía no exista el journal
+            self._refresh()
+
+    # --- Aplicación del journal (siempre con _state_lock tomado) ---
+
+    @staticmethod
+    def _apply(index, entry):
+        """Aplica una operación al índice; retorna la tarea afectada"""
+        op = entry["op"]
+        # Los journals anteriores a los ids no los guardaban: se asignan y se resuelven posiciones al aplicar
+        if op == "add":
+            task = entry["task"]
+            if "id" not in task:
+                task = {'id': format_task_id(index.next_id), **task}
+            return index.insert(task)
+        task_id = entry["id"] if "id" in entry else index.id_at(entry["index"])
+        if op == "complete":
+            return index.complete(task_id)
+        if op == "delete":
+            return index.delete(task_id)
+        raise ValueError(f"Operación desconocida en el journal: {op}")
+
+    @classmethod
+    def _apply_entry(cls, index, entry):
+        """Aplica una línea del journal: una operación o un lote ("batch") de operaciones"""
+        if entry["op"] == "batch":
+            return [cls._apply(index, operation) for operation in entry["ops"]]
+        return cls._apply(index, entry)
+
+    def _apply_lines(self, file):
+        """Aplica las líneas completas desde la posición actual de 'file'"""
+        for line in file:
+            if not line.endswith(b"\n"):
+                break  # Línea a medio escribir (p. ej. el proceso se cayó durante un append)
+            entry = loads_json(line)
+            # Las operaciones que ya están en la instantánea se omiten
+            if entry["v"] > self._version:
+                self._apply_entry(self._index, entry)
+                self._version = entry["v"]
+            self._offset += len(line)
+
+    def _refresh(self):
+        """Aplica lo que otros procesos agregaron al journal, o recarga todo si fue compactado"""
+        try:
+            file = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            if self._journal_ino is not None:
+                self._reload(None)
+            return
+        with file:
+            st = os.fstat(file.fileno())
+            if st.st_ino != self._journal_ino:
+                self._reload(file)
+            elif st.st_size > self._offset:
+                file.seek(self._offset)
+                self._apply_lines(file)
+
+    def _reload(self, journal_file):
+        version, index = self.snapshot._load()
+        # El índice de la instantánea está en la caché de JsonTaskStore: se aplica el journal a una copia,
+        # que conserva el índice de búsqueda de la versión anterior
+        previous, index = self._index, index.copy()
+        index.adopt_search(previous)
+        self._version, self._index = version, index
+        self._journal_ino = os.fstat(journal_file.fileno()).st_ino if journal_file else None
+        self._offset = 0
+        if journal_file is not None:
+            self._apply_lines(journal_file)
+
+    def _sync(self):
+        """Aplica los cambios del journal solo si cambió desde la última vez"""
+        try:
+            st = os.stat(self.journal_path)
+            unchanged = (st.st_ino, st.st_size) == (self._journal_ino, self._offset)
+        except FileNotFoundError:
+            unchanged = self._journal_ino is None
+        if not unchanged:
+            self._refresh()
+
+    # --- API pública ---
+
+    def read(self):
+        with self._state_lock:
+            self._sync()
+            return self._version, self._index.list()
+
+    def version(self):
+        with self._state_lock:
+            self._sync()
+            return self._version
+
+    def get(self, task_id):
+        with self._state_lock:
+            self._sync()
+            return self._version, self._index.get(task_id)
+
+    def page(self, limit, after=None, sort="id", descending=False, completed=None, prefix=None):
+        with self._state_lock:
+            self._sync()
+            return (self._version,) + self._index.page(limit, after, sort, descending, completed, prefix)
+
+    def search(self, clauses, limit, completed=None):
+        # El índice se modifica en el lugar con cada línea del journal; solo se rearma tras una recarga
+        with self._state_lock:
+            self._sync()
+            return self._version, self._index.search(clauses, limit, completed)
+
+    def _append(self, expected_version, entry_for):
+        """Verifica la versión y agrega la operación al journal; retorna (tarea afectada, nueva versión)"""
+        with self.snapshot._locked(), self._state_lock:
+            self._refresh()
+            check_version(self._version, expected_version)
+            entry = entry_for(self._index)
+            if entry is None:
+                return None, self._version
+            entry["v"] = self._version + 1
+
+            line = dumps_json(entry) + b"\n"
+            with open(self.journal_path, "ab") as file:
+                # Descartar una línea incompleta que haya dejado un proceso caído
+                if os.fstat(file.fileno()).st_size != self._offset:
+                    file.truncate(self._offset)
+                file.write(line)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+                self._journal_ino = os.fstat(file.fileno()).st_ino
+
+            # El índice en memoria se actualiza solo si la línea quedó escrita
+            result = self._apply_entry(self._index, entry)
+            self._version = entry["v"]
+            self._offset += len(line)
+            if self._offset > self.max_bytes:
+                self._compact_requested.set()
+            return result, self._version
+
+    def add(self, title, expected_version=None):
+        return self._append(expected_version, lambda index: {
+            "op": "add", "task": {'id': format_task_id(index.next_id), 'title': title, 'completed': False}
+        })
+
+    def complete(self, task_id, expected_version=None):
+        return self._append(expected_version, lambda index: (
+            {"op": "complete", "id": task_id} if index.get(task_id) is not None else None
+        ))
+
+    def delete(self, task_id, expected_version=None):
+        return self._append(expected_version, lambda index: (
+            {"op": "delete", "id": task_id} if index.get(task_id) is not None else None
+        ))
+
+    def apply_batch(self, operations, expected_version=None):
+        # Las operaciones que no encuentran su tarea no se escriben: se valida contra el índice más
+        # lo que el propio lote agrega y borra, sin copiarlo
+        entries = []
+
+        def entry_for(index):
+            next_id, added, deleted = index.next_id, set(), set()
+            for operation in operations:
+                task_id = operation.get("id")
+                if operation["op"] == "add":
+                    task = {'id': format_task_id(next_id), 'title': operation["title"], 'completed': False}
+                    entries.append({"op": "add", "task": task})
+                    added.add(task['id'])
+                    next_id += 1
+                elif task_id in deleted or (task_id not in added and index.get(task_id) is None):
+                    entries.append(None)
+                else:
+                    entries.append({"op": operation["op"], "id": task_id})
+                    if operation["op"] == "delete":
+                        deleted.add(task_id)
+            written = [entry for entry in entries if entry is not None]
+            return {"op": "batch", "ops": written} if written else None
+
+        applied, version = self._append(expected_version, entry_for)
+        applied = iter(applied or [])
+        return [next(applied) if entry is not None else None for entry in entries], version
+
+    # --- Compactación ---
+
+    def compact(self):
+        """Escribe una instantánea con el estado actual y reemplaza el journal por uno vacío"""
+        with self.snapshot._locked(), self._state_lock:
+            self._refresh()
+            if self._offset == 0:
+                return
+            self.snapshot._save(self._version, self._index)
+            directory = os.path.dirname(os.path.abspath(self.journal_path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".journal-", suffix=".tmp")
+            os.close(fd)
+            os.chmod(tmp_path, file_mode(self.journal_path))
+            os.replace(tmp_path, self.journal_path)
+            self._journal_ino = os.stat(self.journal_path).st_ino
+            self._offset = 0
+
+    def _compaction_loop(self):
+        while True:
+            self._compact_requested.wait()
+            self._compact_requested.clear()
+            try:
+                self.compact()
+            except OSError as e:
+                print(f"Error al compactar el journal de tareas: {e}")
+
+
+def create_store(kind, json_path, sqlite_path, journal_max_bytes=1024 * 1024, journal_fsync=True, file_format="json"):
+    """Crea el motor de almacenamiento configurado ("json", "sqlite" o "journal")"""
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"Formato de archivo desconocido: {file_format} (usa {', '.join(FILE_FORMATS)})")
+    if kind == "json":
+        return JsonTaskStore(json_path, file_format)
+    if kind == "sqlite":
+        return SqliteTaskStore(sqlite_path, migrate_from=json_path)
+    if kind == "journal":
+        journal_path = os.path.splitext(json_path)[0] + ".journal"
+        return JournalTaskStore(json_path, journal_path, journal_max_bytes, journal_fsync, file_format)
+    raise ValueError(f"Motor de almacenamiento desconocido: {kind} (usa json, sqlite o journal)")
@@ -0,0 +1,211 @@
+'''
+Estrategias de balanceo de carga para el balanceador.
+
+Cada estrategia recibe la lista de servidores activos y la retorna ordenada por preferencia:
+el proxy intenta con el primero y usa el resto como respaldo si falla.
+'''
+
+import itertools
+import random
+import threading
+
+
+class BackendStats:
+    """Métricas en vivo de un backend: solicitudes en curso y latencia promedio (EWMA)"""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.ewma = None  # Segundos; None mientras no haya muestras
+        self.requests = 0
+
+
+class LoadTracker:
+    """Registra las solicitudes en curso y la latencia de cada backend, compartido entre threads"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, server):
+        stats = self._stats.get(server)
+        if stats is None:
+            stats = self._stats[server] = BackendStats()
+        return stats
+
+    def start(self, server):
+        with self._lock:
+            stats = self._get(server)
+            stats.outstanding += 1
+            stats.requests += 1
+
+    def record_latency(self, server, seconds):
+        with self._lock:
+            stats = self._get(server)
+            if stats.ewma is None:
+                stats.ewma = seconds
+            else:
+                stats.ewma = self.alpha * seconds + (1 - self.alpha) * stats.ewma
+
+    def finish(self, server):
+        with self._lock:
+            stats = self._get(server)
+            stats.outstanding = max(0, stats.outstanding - 1)
+
+    def snapshot(self, server):
+        """Retorna (solicitudes en curso, latencia EWMA en segundos o None)"""
+        with self._lock:
+            stats = self._get(server)
+            return stats.outstanding, stats.ewma
+
+
+class Strategy:
+    """Interfaz base: ordenar los servidores activos y exponer sus puntajes"""
+
+    name = "base"
+
+    def __init__(self, tracker, weights=None):
+        self.tracker = tracker
+        # Se conserva el mismo diccionario: el registro de backends actualiza los pesos en caliente
+        self.weights = weights if weights is not None else {}
+
+    def order(self, servers):
+        raise NotImplementedError
+
+    def score(self, server):
+        """Valor que usa la estrategia para decidir (menor es mejor, si aplica)"""
+        return None
+
+    def scores(self, servers):
+        result = {}
+        for server in servers:
+            outstanding, ewma = self.tracker.snapshot(server)
+            result[server] = {
+                "outstanding": outstanding,
+                "ewma_ms": None if ewma is None else round(ewma * 1000, 1),
+                "weight": self.weights.get(server, 1),
+                "score": self.score(server),
+            }
+        return result
+
+
+class RandomStrategy(Strategy):
+    """Orden aleatorio (comportamiento original del balanceador)"""
+
+    name = "random"
+
+    def order(self, servers):
+        servers = list(servers)
+        random.shuffle(servers)
+        return servers
+
+
+class RoundRobinStrategy(Strategy):
+    """Turnos rotativos entre los servidores activos"""
+
+    name = "round_robin"
+
+    def __init__(self, tracker, weights=None):
+        super().__init__(tracker, weights)
+        self._counter = itertools.count()
+
+    def order(self, servers):
+        servers = list(servers)
+        if not servers:
+            return servers
+        start = next(self._counter) % len(servers)
+        return servers[start:] + servers[:start]
+
+
+class WeightedRoundRobinStrategy(Strategy):
+    """Round-robin ponderado suave (como nginx): reparte según el peso sin ráfagas al mismo servidor"""
+
+    name = "weighted_round_robin"
+
+    def __init__(self, tracker, weights=None):
+        super().__init__(tracker, weights)
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def order(self, servers):
+        servers = list(servers)
+        if not servers:
+            return servers
+        with self._lock:
+            total = 0
+            for server in servers:
+                weight = self.weights.get(server, 1)
+                self._current[server] = self._current.get(server, 0) + weight
+                total += weight
+            chosen = max(servers, key=lambda s: self._current[s])
+            self._current[chosen] -= total
+        return [chosen] + [s for s in servers if s != chosen]
+
+    def score(self, server):
+        return self._current.get(server, 0)
+
+
+class LeastOutstandingStrategy(Strategy):
+    """Elige el servidor con menos solicitudes en curso"""
+
+    name = "least_outstanding"
+
+    def order(self, servers):
+        servers = list(servers)
+        random.shuffle(servers)  # Desempate aleatorio
+        return sorted(servers, key=self.score)
+
+    def score(self, server):
+        return self.tracker.snapshot(server)[0]
+
+
+class PowerOfTwoEwmaStrategy(Strategy):
+    """
+    Power of two choices: toma dos servidores al azar y elige el de menor costo,
+    donde el costo es la latencia EWMA multiplicada por las solicitudes en curso + 1.
+    """
+
+    name = "p2c_ewma"
+
+    def order(self, servers):
+        servers = list(servers)
+        if len(servers) < 2:
+            return servers
+        first, second = random.sample(servers, 2)
+        chosen = first if self.score(first) <= self.score(second) else second
+        rest = sorted((s for s in servers if s != chosen), key=self.score)
+        return [chosen] + rest
+
+    def score(self, server):
+        outstanding, ewma = self.tracker.snapshot(server)
+        # Un servidor sin muestras tiene costo 0 para que reciba tráfico y se mida
+        return round((ewma or 0.0) * (outstanding + 1) * 1000, 2)
+
+
+STRATEGIES = {
+    cls.name: cls for cls in (
+        RandomStrategy,
+        RoundRobinStrategy,
+        WeightedRoundRobinStrategy,
+        LeastOutstandingStrategy,
+        PowerOfTwoEwmaStrategy,
+    )
+}
+
+
+def parse_weights(value):
+    """Convierte "http://host:5001=3,http://host:5002=1" en un diccionario servidor -> peso"""
+    weights = {}
+    for item in value.split(','):
+        if '=' in item:
+            server, weight = item.rsplit('=', 1)
+            weights[server.strip()] = int(weight)
+    return weights
+
+
+def create_strategy(name, tracker, weights=None):
+    """Crea la estrategia configurada; lanza ValueError si el nombre no existe"""
+    try:
+        return STRATEGIES[name](tracker, weights)
+    except KeyError:
+        raise ValueError(f"Estrategia desconocida: {name}. Opciones: {', '.join(STRATEGIES)}")
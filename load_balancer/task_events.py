@@ -0,0 +1,255 @@
+'''
+Eventos de cambios de las tareas para GET /api/tasks/events (Server-Sent Events), compartidos entre
+todas las instancias de app.py que usan los mismos archivos.
+
+- Cada escritura agrega una línea a tasks.events: {"v": versión, "changes": [...]}, con un cambio
+  compacto por operación ({"op": "add", "task": {...}}, {"op": "complete", "id": "t7"} o
+  {"op": "delete", "id": "t7"}).
+- Cada proceso tiene un thread que lee las líneas nuevas del archivo (las de todas las instancias)
+  y las entrega a sus suscriptores en orden de versión. Dos instancias pueden agregar sus líneas en
+  otro orden que el de sus escrituras: una versión adelantada espera a las anteriores hasta
+  'reorder_wait' segundos.
+- Los últimos eventos se conservan en memoria: un cliente que se reconecta con Last-Event-ID recibe
+  los que se perdió. Si no se puede garantizar que reciba todos (faltan en el historial, falta una
+  versión o el cliente no los consume a tiempo) recibe un evento "reset" y debe volver a leer las tareas.
+- Al superar 'max_bytes' el archivo se renombra a tasks.events.1 y se empieza uno nuevo.
+'''
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from serialization import dumps_json
+from storage import file_lock
+
+HEARTBEAT = b": \n\n"  # Comentario SSE: mantiene viva la conexión y detecta clientes desconectados
+
+
+def dumps_line(version, changes):
+    """Línea de tasks.events; la versión va primero para leerla sin decodificar el resto"""
+    return b'{"v":%d,"changes":%s}\n' % (version, dumps_json(changes))
+
+
+def reset_frame(version):
+    return f'event: reset\ndata: {{"v":{version if version is not None else "null"}}}\n\n'.encode()
+
+
+class Subscription:
+    """Eventos pendientes de una conexión de GET /api/tasks/events, ya codificados en formato SSE"""
+
+    def __init__(self, after, queue_size):
+        self.after = after  # Versión que el cliente ya tiene: no se le envían las anteriores
+        self.closed = False
+        self._queue = queue.Queue(queue_size)
+
+    def put(self, frame):
+        """Encola un evento; retorna False si el cliente no los consume a tiempo (cola llena)"""
+        try:
+            self._queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self, frame):
+        """Descarta lo pendiente y termina la transmisión con 'frame' (un reset)"""
+        self.closed = True
+        with self._queue.mutex:
+            self._queue.queue.clear()
+        self._queue.put_nowait(frame)
+
+    def frames(self, heartbeat):
+        """Bloques a transmitir: eventos, un comentario cada 'heartbeat' segundos sin eventos y el reset final"""
+        while True:
+            try:
+                frame = self._queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield HEARTBEAT
+                continue
+            yield frame
+            if self.closed and self._queue.empty():
+                return
+
+
+class TaskEventLog:
+    def __init__(self, path, max_bytes=1024 * 1024, history=1000, poll_interval=0.1, reorder_wait=1.0,
+                 queue_size=1000):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.reorder_wait = reorder_wait
+        self.queue_size = queue_size
+        self._history_size = history
+        self._start()
+
+    def after_fork(self):
+        """En un proceso hijo creado con fork (serve.py): estado y thread de lectura propios"""
+        self._start()
+
+    def _start(self):
+        # Estadísticas
+        self.published = 0
+        self.delivered = 0
+        self.resets = 0
+
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()  # Protege el estado de entrega y los suscriptores
+        self._subscribers = set()
+        self._history = deque(maxlen=self._history_size)  # (versión, evento SSE) entregados, en orden
+        self._version = None  # Última versión entregada
+        self._pending = {}  # Versión adelantada -> (evento SSE, momento en que se leyó)
+
+        # Lectura del archivo (solo desde el thread de lectura)
+        self._file = None
+        self._ino = None
+        self._partial = b""
+
+        with self._lock:
+            self._poll()  # El historial arranca con los eventos que ya están en el archivo
+        threading.Thread(target=self._run, daemon=True, name="task-events").start()
+
+    # --- Escritura (cualquier instancia) ---
+
+    def publish(self, version, changes):
+        """Agrega los cambios de la escritura que produjo 'version'; nunca lanza excepciones"""
+        line = dumps_line(version, changes)
+        try:
+            with self._write_lock, file_lock(self.lock_path):
+                # Se abre en cada escritura: si otra instancia rotó el archivo, se escribe en el nuevo
+                with open(self.path, "ab") as file:
+                    file.write(line)
+                    size = file.tell()
+                if size > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+            self.published += 1
+        except OSError as e:
+            # Los suscriptores verán que falta la versión y recibirán un reset
+            print(f"Error al publicar el evento de tareas en {self.path}: {e}")
+
+    # --- Suscriptores (solicitudes de GET /api/tasks/events) ---
+
+    def subscribe(self, last_version=None):
+        """
+        Suscripción a los eventos posteriores a last_version (Last-Event-ID del cliente); sin versión,
+        solo a los nuevos. Los eventos que el cliente se perdió se encolan primero.
+        """
+        with self._lock:
+            subscription = Subscription(self._version or 0, self.queue_size)
+            if last_version is not None and self._version is not None and last_version < self._version:
+                missed = [(version, frame) for version, frame in self._history if version > last_version]
+                if not missed or missed[0][0] != last_version + 1 or len(missed) > self.queue_size:
+                    subscription.close(reset_frame(self._version))
+                    self.resets += 1
+                    return subscription
+                for _, frame in missed:
+                    subscription.put(frame)
+            elif last_version is not None:
+                # El cliente puede tener una versión que este proceso todavía no leyó del archivo
+                subscription.after = last_version
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close(self):
+        """
+        Termina todas las transmisiones (el proceso se está deteniendo), sin reset: los clientes se
+        reconectan con Last-Event-ID a otro proceso y reciben los eventos que se perdieron.
+        """
+        with self._lock:
+            for subscription in self._subscribers:
+                subscription.close(HEARTBEAT)
+            self._subscribers.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self._version,
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "delivered": self.delivered,
+                "resets": self.resets,
+                "pending": len(self._pending),
+            }
+
+    # --- Thread de lectura ---
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with self._lock:
+                    self._poll()
+            except (OSError, ValueError) as e:
+                print(f"Error al leer los eventos de tareas de {self.path}: {e}")
+
+    def _poll(self):
+        """Lee las líneas nuevas; al rotar, termina el archivo anterior antes de pasar al nuevo"""
+        try:
+            ino = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            ino = None
+        if self._file is not None:
+            self._read_lines()
+            if ino != self._ino:
+                self._file.close()
+                self._file, self._partial = None, b""
+        if self._file is None and ino is not None:
+            try:
+                self._file = open(self.path, "rb")
+            except FileNotFoundError:
+                return
+            self._ino = os.fstat(self._file.fileno()).st_ino
+            self._read_lines()
+        self._release(time.monotonic())
+
+    def _read_lines(self):
+        data = self._partial + self._file.read()
+        lines = data.split(b"\n")
+        self._partial = lines.pop()  # Línea a medio escribir: se completa en la próxima lectura
+        now = time.monotonic()
+        for line in lines:
+            if not line.startswith(b'{"v":'):
+                continue
+            version = int(line[5:line.index(b",")])  # b'{"v":12,"changes":...}'
+            if self._version is None or version > self._version:
+                self._pending[version] = (b"id: %d\nevent: tasks\ndata: %s\n\n" % (version, line), now)
+            # Una versión ya superada llegó tarde: los suscriptores ya recibieron un reset por ella
+
+    def _release(self, now):
+        """Entrega las versiones consecutivas; si falta una por más de reorder_wait, la saltea con un reset"""
+        while self._pending:
+            version = self._version + 1 if self._version is not None else min(self._pending)
+            if version not in self._pending:
+                oldest = min(received for _, received in self._pending.values())
+                if now - oldest < self.reorder_wait:
+                    return
+                # Una escritura sin evento (la instancia se cayó antes de publicarlo, p. ej.)
+                self._skip_to(min(self._pending) - 1)
+                continue
+            frame, _ = self._pending.pop(version)
+            self._version = version
+            self._history.append((version, frame))
+            for subscription in list(self._subscribers):
+                if version > subscription.after:
+                    if subscription.put(frame):
+                        self.delivered += 1
+                    else:
+                        # El cliente no consume los eventos a tiempo: se lo desconecta con un reset
+                        self._subscribers.discard(subscription)
+                        subscription.close(reset_frame(version))
+                        self.resets += 1
+
+    def _skip_to(self, version):
+        """Da por entregadas las versiones faltantes hasta 'version': quien no las tenía recibe un reset"""
+        for subscription in list(self._subscribers):
+            if subscription.after < version:
+                self._subscribers.discard(subscription)
+                subscription.close(reset_frame(version))
+                self.resets += 1
+        self._version = version
+        self._history.clear()  # El historial ya no es continuo: los clientes atrasados reciben un reset
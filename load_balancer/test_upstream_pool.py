@@ -0,0 +1,93 @@
+'''
+Pruebas del pool de conexiones: una conexión reutilizada que el backend cierra después de leer la
+solicitud solo se reintenta si el método es idempotente.
+
+    python -m pytest test_upstream_pool.py
+'''
+
+import http.client
+import socket
+import threading
+import unittest
+
+from upstream_pool import PoolManager
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok"
+
+
+class DroppingBackend:
+    """
+    Backend mínimo: en cada conexión responde la primera solicitud con keep-alive y cierra la conexión
+    después de leer la segunda, sin responderla (como un backend que se reinicia). Cuenta las
+    solicitudes recibidas por método.
+    """
+
+    def __init__(self):
+        self.received = {}
+        self._lock = threading.Lock()
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self._server.getsockname()[1]}"
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self._server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile("rb") as reader:
+            for answered in (True, False):
+                request_line = reader.readline()
+                if not request_line:
+                    return
+                length = 0
+                for line in iter(reader.readline, b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                reader.read(length)
+                with self._lock:
+                    method = request_line.split()[0].decode()
+                    self.received[method] = self.received.get(method, 0) + 1
+                if answered:
+                    conn.sendall(OK)
+
+    def count(self, method):
+        with self._lock:
+            return self.received.get(method, 0)
+
+
+class ReusedConnectionRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = DroppingBackend()
+        self.pools = PoolManager()
+
+    def tearDown(self):
+        self.backend.close()
+
+    def send(self, method, body=None):
+        response, pooled = self.pools.request(self.backend.url, method, "/api/tasks", body=body)
+        data = response.read()
+        self.pools.release(self.backend.url, pooled, response)
+        return response.status, data
+
+    def test_post_is_not_sent_twice(self):
+        self.assertEqual(self.send("GET"), (200, b"ok"))  # Deja una conexión en el pool
+        with self.assertRaises(http.client.RemoteDisconnected):
+            self.send("POST", body=b'{"title": "una tarea"}')
+        self.assertEqual(self.backend.count("POST"), 1)
+
+    def test_get_is_retried_on_a_new_connection(self):
+        self.assertEqual(self.send("GET"), (200, b"ok"))
+        self.assertEqual(self.send("GET"), (200, b"ok"))
+        self.assertEqual(self.backend.count("GET"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+'''
+Pool de conexiones HTTP keep-alive hacia los servidores backend del balanceador
+'''
+
+import http.client
+import select
+import threading
+import time
+from urllib.parse import urlsplit
+
+from retries import IDEMPOTENT_METHODS
+
+
+class PooledConnection:
+    """Conexión HTTP reutilizable junto con sus datos de uso"""
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+        self.requests = 0
+        self.last_used = time.time()
+
+    def is_dropped(self):
+        """Detecta si el servidor cerró la conexión mientras estaba inactiva"""
+        sock = self.conn.sock
+        if sock is None:
+            return True
+        try:
+            # Un socket inactivo que es "legible" significa EOF o datos inesperados
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable)
+        except (OSError, ValueError):
+            return True
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class UpstreamPool:
+    """Pool de conexiones para un único servidor backend"""
+
+    def __init__(self, server, max_size, idle_timeout, max_requests):
+        parts = urlsplit(server)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+
+        self._lock = threading.Lock()
+        self._idle = []  # Pila LIFO: la conexión usada más recientemente está más "caliente"
+        self._generation = 0
+        self.in_use = 0
+
+        # Estadísticas
+        self.hits = 0
+        self.new_connections = 0
+        self.discarded = 0
+
+    def _is_expired(self, pooled, now):
+        return (now - pooled.last_used > self.idle_timeout
+                or pooled.requests >= self.max_requests)
+
+    def acquire(self, timeout):
+        """Obtiene una conexión del pool o crea una nueva si no hay disponibles"""
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                pooled = self._idle.pop()
+                if self._is_expired(pooled, now) or pooled.is_dropped():
+                    self.discarded += 1
+                    pooled.close()
+                    continue
+                self.hits += 1
+                self.in_use += 1
+                pooled.conn.timeout = timeout
+                pooled.conn.sock.settimeout(timeout)
+                return pooled, True
+
+            self.new_connections += 1
+            self.in_use += 1
+            generation = self._generation
+
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        return PooledConnection(conn, generation), False
+
+    def release(self, pooled, reusable=True):
+        """Devuelve la conexión al pool, o la cierra si ya no puede reutilizarse"""
+        pooled.last_used = time.time()
+        with self._lock:
+            self.in_use -= 1
+            if (reusable and pooled.generation == self._generation
+                    and pooled.requests < self.max_requests
+                    and len(self._idle) < self.max_size):
+                self._idle.append(pooled)
+                return
+            self.discarded += 1
+        pooled.close()
+
+    def evict(self):
+        """Cierra las conexiones inactivas y evita que las que están en uso vuelvan al pool"""
+        with self._lock:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            self.discarded += len(idle)
+        for pooled in idle:
+            pooled.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "new_connections": self.new_connections,
+                "discarded": self.discarded,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+            }
+
+
+class PoolManager:
+    """Administra un pool de conexiones por cada servidor backend, compartido entre threads"""
+
+    def __init__(self, max_size=10, idle_timeout=60, max_requests=1000):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get_pool(self, server):
+        with self._lock:
+            pool = self._pools.get(server)
+            if pool is None:
+                pool = UpstreamPool(server, self.max_size, self.idle_timeout, self.max_requests)
+                self._pools[server] = pool
+            return pool
+
+    def request(self, server, method, path, headers=None, body=None, timeout=3, encode_chunked=False,
+                read_timeout=None):
+        """
+        Envía una solicitud al servidor usando una conexión del pool; 'timeout' limita la conexión y,
+        salvo que se indique read_timeout, también la espera de la respuesta y de cada bloque del cuerpo.
+        Retorna (respuesta, conexión); la conexión debe liberarse con release() una vez leído el cuerpo.
+        """
+        pool = self.get_pool(server)
+
+        while True:
+            pooled, reused = pool.acquire(timeout)
+            sent = False
+            try:
+                pooled.conn.request(method, path, body=body, headers=headers or {},
+                                    encode_chunked=encode_chunked)
+                sent = True
+                pooled.requests += 1
+                if read_timeout is not None:
+                    pooled.conn.sock.settimeout(read_timeout)
+                response = pooled.conn.getresponse()
+                return response, pooled
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                pool.release(pooled, reusable=False)
+                # Una conexión reutilizada pudo ser cerrada por el servidor: reintentar con una nueva. Si la
+                # solicitud ya se envió, el servidor pudo procesarla antes de cerrar: solo se repite si es
+                # idempotente (un POST repetido crearía una tarea duplicada)
+                if (reused and (body is None or isinstance(body, bytes))
+                        and (method in IDEMPOTENT_METHODS or not sent)):
+                    continue
+                raise
+            except Exception:
+                pool.release(pooled, reusable=False)
+                raise
+
+    def release(self, server, pooled, response):
+        """Libera la conexión; solo vuelve al pool si la respuesta se leyó completa y permite keep-alive"""
+        reusable = response.isclosed() and not response.will_close
+        self.get_pool(server).release(pooled, reusable=reusable)
+
+    def discard(self, server, pooled):
+        """Cierra la conexión sin leer la respuesta (p. ej. la copia perdedora de un hedge)"""
+        self.get_pool(server).release(pooled, reusable=False)
+
+    def evict(self, server):
+        self.get_pool(server).evict()
+
+    def stats(self):
+        with self._lock:
+            pools = dict(self._pools)
+        return {server: pool.stats() for server, pool in pools.items()}
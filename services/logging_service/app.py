@@ -1 +1,188 @@
-# app.py
\ No newline at end of file
+'''
+Servicio de logs: recibe eventos por HTTP y los guarda en log.txt (log_writer.py).
+
+POST /log acepta un evento JSON ({"message": "...", ...}), una lista JSON de eventos o un lote NDJSON
+(Content-Type: application/x-ndjson, un evento por línea, como los que envía event_shipper.py).
+Responde 202 en cuanto los eventos están en el buffer, sin esperar a que se escriban.
+
+GET /log consulta log.txt y sus segmentos rotados (o los logs de LOG_QUERY_FILES) por rango de tiempo,
+palabras y nivel, y transmite las líneas a medida que las encuentra (log_query.py).
+'''
+
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+from log_query import LogQuery, query_key
+from log_writer import LogWriter, RateMeter, RingBuffer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LOG_FILE = os.environ.get("LOG_FILE", os.path.join(HERE, "log.txt"))
+# Buffer entre las solicitudes y el thread de escritura; lleno, las solicitudes reciben 503
+LOG_BUFFER_EVENTS = int(os.environ.get("LOG_BUFFER_EVENTS", 100000))
+LOG_BUFFER_BYTES = int(os.environ.get("LOG_BUFFER_BYTES", 64 * 1024 * 1024))
+LOG_MAX_EVENT_BYTES = int(os.environ.get("LOG_MAX_EVENT_BYTES", 16 * 1024))  # Eventos más grandes se descartan
+LOG_MAX_BODY_BYTES = int(os.environ.get("LOG_MAX_BODY_BYTES", 16 * 1024 * 1024))
+LOG_COMMIT_MAX_EVENTS = int(os.environ.get("LOG_COMMIT_MAX_EVENTS", 10000))  # Eventos por write()
+# fsync después de cada grupo ("always"), a lo sumo cada LOG_FSYNC_INTERVAL segundos ("interval") o nunca ("never")
+LOG_FSYNC = os.environ.get("LOG_FSYNC", "interval")
+LOG_FSYNC_INTERVAL = float(os.environ.get("LOG_FSYNC_INTERVAL", 1.0))
+# Rotación de log.txt a log.txt.N por tamaño o por tiempo (segundos, 0: solo por tamaño)
+LOG_ROTATE_BYTES = int(os.environ.get("LOG_ROTATE_BYTES", 64 * 1024 * 1024))
+LOG_ROTATE_INTERVAL = float(os.environ.get("LOG_ROTATE_INTERVAL", 0))
+LOG_ROTATE_KEEP = int(os.environ.get("LOG_ROTATE_KEEP", 10))
+# Otros logs consultables con GET /log?file=nombre, como "nombre=ruta,nombre=ruta"
+LOG_QUERY_FILES = os.environ.get("LOG_QUERY_FILES", ",".join([
+    "balancer=" + os.path.join(HERE, "..", "..", "load_balancer", "balancer.log"),
+    "fallas=" + os.path.join(HERE, "..", "..", "fallas", "app_logs.txt"),
+]))
+LOG_INDEX_INTERVAL = int(os.environ.get("LOG_INDEX_INTERVAL", 256 * 1024))  # Bytes entre muestras del índice
+LOG_QUERY_MAX_LINES = int(os.environ.get("LOG_QUERY_MAX_LINES", 100000))  # Tope de 'limit'
+
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl")
+LEVEL = re.compile(r"[A-Za-z]+")
+
+query_files = dict(entry.split("=", 1) for entry in LOG_QUERY_FILES.split(",") if "=" in entry)
+
+
+app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = LOG_MAX_BODY_BYTES
+
+buffer = RingBuffer(LOG_BUFFER_EVENTS, LOG_BUFFER_BYTES)
+writer = LogWriter(LOG_FILE, buffer, LOG_FSYNC, LOG_FSYNC_INTERVAL, LOG_ROTATE_BYTES, LOG_ROTATE_INTERVAL,
+                   LOG_ROTATE_KEEP, LOG_COMMIT_MAX_EVENTS)
+atexit.register(writer.close)
+
+queries = LogQuery(LOG_INDEX_INTERVAL)
+ingest_rate = RateMeter()
+stats_lock = threading.Lock()
+invalid_events = 0
+
+
+def valid_event(event):
+    return isinstance(event, dict) and isinstance(event.get("message"), str)
+
+
+def encode_event(event):
+    """JSON compacto del evento sin la llave inicial: log_writer.py le antepone "received" """
+    event.pop("received", None)
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8")[1:] + b"\n"
+
+
+def parse_ndjson(body):
+    """Eventos de un lote NDJSON listos para el buffer, y la cantidad de líneas inválidas"""
+    items, invalid = [], 0
+    for line in body.split(b"\n"):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            invalid += 1
+            continue
+        if not valid_event(event) or len(line) > LOG_MAX_EVENT_BYTES:
+            invalid += 1
+        elif b'"received"' in line:
+            items.append(encode_event(event))
+        else:
+            items.append(line[1:] + b"\n")  # La línea ya es el JSON del evento: no se vuelve a codificar
+    return items, invalid
+
+
+def parse_json(data):
+    events = data if isinstance(data, list) else [data]
+    items, invalid = [], 0
+    for event in events:
+        item = encode_event(event) if valid_event(event) else None
+        if item is None or len(item) > LOG_MAX_EVENT_BYTES:
+            invalid += 1
+        else:
+            items.append(item)
+    return items, invalid
+
+
+# Recepción de eventos: uno, una lista o un lote NDJSON
+@app.route('/log', methods=['POST'])
+def ingest():
+    global invalid_events
+    if request.mimetype in NDJSON_MIMETYPES:
+        items, invalid = parse_ndjson(request.get_data())
+    else:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "Se esperaba un evento JSON o un lote NDJSON"}), 400
+        items, invalid = parse_json(data)
+
+    if invalid:
+        with stats_lock:
+            invalid_events += invalid
+    if not items:
+        return jsonify({"error": "Ningún evento válido (cada evento necesita 'message')", "invalid": invalid}), 400
+    if len(items) > buffer.capacity:
+        return jsonify({"error": f"El lote supera los {buffer.capacity} eventos del buffer"}), 413
+    if not buffer.put_many(items, sum(map(len, items))):
+        # El cliente reintenta el lote completo más tarde
+        return jsonify({"error": "Buffer lleno"}), 503, {"Retry-After": "1"}
+    ingest_rate.add(len(items))
+    return jsonify({"accepted": len(items), "invalid": invalid}), 202
+
+
+# Consulta: GET /log?from=2026-10-18T14:02&to=2026-10-18T14:05&q=error&q=tarea&level=ERROR&limit=100&file=balancer
+@app.route('/log', methods=['GET'])
+def query():
+    start, stop = request.args.get("from"), request.args.get("to")
+    start_key = query_key(start) if start else None
+    stop_key = query_key(stop) if stop else None
+    if (start and start_key is None) or (stop and stop_key is None):
+        return jsonify({"error": "'from' y 'to' son fechas como 2026-10-18T14:02:30.500 (o un prefijo)"}), 400
+    keywords = [keyword for keyword in request.args.getlist("q") if keyword.strip()]
+    if any("\n" in keyword for keyword in keywords):
+        return jsonify({"error": "'q' no puede tener saltos de línea"}), 400
+    level = request.args.get("level")
+    if level and not LEVEL.fullmatch(level):
+        return jsonify({"error": "'level' es un nivel como ERROR o INFO"}), 400
+    limit = request.args.get("limit", LOG_QUERY_MAX_LINES, type=int)
+    if limit <= 0:
+        return jsonify({"error": "'limit' debe ser positivo"}), 400
+
+    name = request.args.get("file")
+    if name and name not in query_files:
+        return jsonify({"error": f"Archivo desconocido: {name}", "files": sorted(query_files)}), 404
+    path = query_files[name] if name else LOG_FILE
+
+    ranges = queries.plan(path, start_key, stop_key)
+    lines = queries.read(ranges, keywords, level, min(limit, LOG_QUERY_MAX_LINES))
+    # Las líneas de log.txt son eventos JSON; las de los demás, texto
+    return Response(stream_with_context(lines), mimetype="text/plain" if name else "application/x-ndjson")
+
+
+# Contadores de ingesta, profundidad del buffer y estado de la escritura
+@app.route('/stats')
+def stats():
+    events, size = buffer.depth()
+    return jsonify({
+        "accepted": buffer.accepted,
+        "rejected": buffer.rejected,
+        "invalid": invalid_events,
+        "ingest_rate": ingest_rate.rate(),
+        "buffer": {"events": events, "bytes": size, "capacity": buffer.capacity, "max_bytes": buffer.max_bytes},
+        "writer": writer.stats(),
+    })
+
+
+@app.route("/health", methods=["GET"])
+def health_check():
+    return jsonify({"status": "ok"}), 200
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5003
+    print(f"Servicio de logs iniciado en puerto: {port} (archivo {LOG_FILE})")
+    # Sin debug: el reloader importaría el módulo en otro proceso con su propio thread de escritura
+    app.run(host='0.0.0.0', port=port, threaded=True)
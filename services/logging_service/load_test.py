@@ -0,0 +1,164 @@
+'''
+Prueba de carga del servicio de logs.
+
+Inicia el servicio en un directorio temporal (o usa uno ya iniciado con --url) y lo carga durante
+--duration segundos desde --threads threads, cada uno con su conexión keep-alive. Cada solicitud es un
+lote NDJSON de --batch eventos, como los de event_shipper.py (--batch 1: un evento JSON por solicitud).
+Muestra los eventos por segundo aceptados, las latencias de las solicitudes, la profundidad máxima del
+buffer y, con el servicio propio, verifica que todos los eventos aceptados quedaron escritos.
+
+Uso:
+    python load_test.py [--threads 8] [--batch 200] [--duration 10] [--fsync interval] [--url URL]
+'''
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT = 5013
+
+
+def wait_until_ready(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió a tiempo")
+
+
+def make_body(batch, worker):
+    """Cuerpo y Content-Type de una solicitud; el cuerpo se arma una vez por thread"""
+    timestamp = datetime.now().isoformat(timespec="milliseconds")
+    events = [{"timestamp": timestamp, "message": f"Evento de prueba {worker}-{i}: Nueva tarea añadida",
+               "source": "load_test"} for i in range(batch)]
+    if batch == 1:
+        return json.dumps(events[0]).encode(), "application/json"
+    return b"".join(json.dumps(event, ensure_ascii=False).encode() + b"\n" for event in events), "application/x-ndjson"
+
+
+def run_load(url, threads, batch, duration):
+    results = {"accepted": 0, "rejected": 0, "errors": 0, "latencies": [], "max_depth": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(number):
+        body, content_type = make_body(batch, number)
+        session = requests.Session()
+        accepted = rejected = errors = 0
+        latencies = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{url}/log", data=body, headers={"Content-Type": content_type}, timeout=10)
+            except requests.RequestException:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response.status_code == 202:
+                accepted += batch
+            elif response.status_code == 503:
+                rejected += batch
+            else:
+                errors += 1
+        with lock:
+            results["accepted"] += accepted
+            results["rejected"] += rejected
+            results["errors"] += errors
+            results["latencies"] += latencies
+
+    def monitor():
+        # Profundidad del buffer durante la prueba
+        while time.perf_counter() < deadline:
+            try:
+                depth = requests.get(f"{url}/stats", timeout=1).json()["buffer"]["events"]
+                results["max_depth"] = max(results["max_depth"], depth)
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)] + [threading.Thread(target=monitor)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results["elapsed"] = time.perf_counter() - start
+    return results
+
+
+def count_lines(log_file):
+    total = 0
+    for path in [log_file] + glob.glob(glob.escape(log_file) + ".*"):
+        with open(path, "rb") as file:
+            total += sum(chunk.count(b"\n") for chunk in iter(lambda: file.read(1 << 20), b""))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=200, help='Eventos por solicitud (1: un evento JSON)')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--fsync', default='interval', help='LOG_FSYNC del servicio propio')
+    parser.add_argument('--url', help='Servicio ya iniciado (no se verifica el archivo)')
+    args = parser.parse_args()
+
+    service = log_file = None
+    url = args.url
+    if url is None:
+        # El servicio escribe en un directorio temporal para no ensuciar el proyecto
+        workdir = tempfile.mkdtemp(prefix='log-load-')
+        log_file = os.path.join(workdir, 'log.txt')
+        env = dict(os.environ, LOG_FILE=log_file, LOG_FSYNC=args.fsync)
+        service = subprocess.Popen([sys.executable, os.path.join(HERE, 'app.py'), str(PORT)], cwd=workdir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://localhost:{PORT}"
+
+    try:
+        wait_until_ready(url)
+        result = run_load(url, args.threads, args.batch, args.duration)
+        latencies = sorted(result["latencies"])
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float('nan')
+
+        print(f"threads={args.threads} lote={args.batch} duración={result['elapsed']:.1f}s")
+        print(f"  eventos aceptados:  {result['accepted']} ({result['accepted'] / result['elapsed']:.0f}/s)")
+        print(f"  eventos rechazados: {result['rejected']} (buffer lleno)   errores: {result['errors']}")
+        print(f"  latencia por solicitud: p50 {percentile(0.50):.2f} ms  p99 {percentile(0.99):.2f} ms  "
+              f"máx {percentile(1.0):.2f} ms")
+        print(f"  buffer: máximo {result['max_depth']} eventos en espera")
+
+        stats = requests.get(f"{url}/stats").json()
+        while stats["buffer"]["events"]:
+            time.sleep(0.1)
+            stats = requests.get(f"{url}/stats").json()
+        writer = stats["writer"]
+        print(f"  escritura: {writer['commits']} grupos, {writer['events_per_commit']} eventos por grupo, "
+              f"{writer['fsyncs']} fsync, {writer['rotations']} rotaciones")
+        if log_file:
+            written = count_lines(log_file)
+            status = "OK" if written == stats["accepted"] else "FALTAN EVENTOS"
+            print(f"  archivo: {written} líneas de {stats['accepted']} eventos aceptados: {status}")
+    finally:
+        if service:
+            service.terminate()
+            service.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+'''
+Consultas por rango de tiempo sobre archivos de log ordenados por tiempo: log.txt y sus segmentos
+rotados (log.txt.N), y otros logs con una marca de tiempo al principio de cada línea
+(balancer.log: "2025-05-29 10:03:30,837 - INFO - ...", app_logs.txt: "[2025-06-26 15:02:04] ...").
+
+- Cada segmento se lee con mmap: solo se leen las páginas del rango consultado.
+- Índice disperso por segmento: la marca de tiempo de la primera línea después de cada múltiplo de
+  'interval' bytes, con su posición. No se arma recorriendo el archivo, sino leyendo una línea cada
+  'interval' bytes, y se guarda en memoria por inodo: un segmento rotado conserva su índice y el del
+  archivo activo se extiende a medida que crece.
+- Con el índice, el rango [desde, hasta) de un segmento se ubica leyendo a lo sumo 'interval' bytes
+  por extremo. Sin filtros, el rango se transmite tal cual, en bloques; con palabras o nivel, se
+  buscan en cada bloque y solo se examinan los registros donde aparecen.
+- Un registro es una línea con marca de tiempo más las siguientes que no la tienen (las de un
+  traceback, p. ej.): los filtros se aplican al registro completo y se devuelve completo.
+'''
+
+import bisect
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from log_writer import segments
+
+# "received" de log.txt, "2025-05-29 10:03:30,837" de balancer.log o "[2025-06-26 15:02:04]" de app_logs.txt
+LINE_TIMESTAMP = re.compile(rb'(?:\{"received":"|\[)?(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:[.,](\d{3}))?')
+TEXT_TIMESTAMP = re.compile(LINE_TIMESTAMP.pattern.decode())
+RECEIVED = b'{"received":"'  # Principio de cada línea de log.txt
+# Límites de una consulta: "2026-10-18T14:02", "2026-10-18 14:02:30.500", "2026-10-18"...
+QUERY_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}(?::\d{2}(?::\d{2}(?:\.\d{1,3})?)?)?)?")
+
+CHUNK_SIZE = 256 * 1024  # Bytes por bloque transmitido
+PROBE_BYTES = 64 * 1024  # Bytes que se leen como máximo para tomar una muestra del índice
+
+
+def query_key(value):
+    """Marca de tiempo de una consulta como clave comparable con las de las líneas, o None si no es válida"""
+    if not QUERY_TIMESTAMP.fullmatch(value):
+        return None
+    return value.replace(" ", "T").encode()
+
+
+def line_key(data, pos):
+    """Clave de la línea que empieza en 'pos' ("2026-10-18T14:02:30.500"), o None si no tiene marca de tiempo"""
+    match = LINE_TIMESTAMP.match(data, pos)
+    if match is None:
+        return None
+    date, time, millis = match.groups()
+    return b"%sT%s.%s" % (date, time, millis or b"000")
+
+
+class SparseIndex:
+    """Muestras (clave, posición) de un archivo, una cada 'interval' bytes como mucho, en orden"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.keys = []
+        self.offsets = []
+        self._next = 0  # Próximo múltiplo de 'interval' a muestrear
+        self.last = None  # Clave de la última línea completa, si tiene marca de tiempo
+        self.lock = threading.Lock()  # Dos consultas no lo extienden a la vez
+
+    def matches(self, data, size):
+        """False si el inodo ahora es de otro archivo (se borró un segmento y se reutilizó el número)"""
+        if size < self._next - self.interval:
+            return False
+        return not self.offsets or line_key(data, self.offsets[0]) == self.keys[0]
+
+    def extend(self, data, end):
+        """Agrega las muestras de data[:end] que faltan (el archivo activo crece entre consultas)"""
+        if end:
+            self.last = line_key(data, data.rfind(b"\n", 0, end - 1) + 1)
+        while self._next < end:
+            pos = 0 if self._next == 0 else data.find(b"\n", self._next - 1, end) + 1
+            if pos == 0 and self._next:
+                return  # La línea siguiente todavía no está completa
+            limit = min(end, pos + PROBE_BYTES)
+            while pos < limit:
+                key = line_key(data, pos)
+                if key is not None:
+                    if not self.keys or key >= self.keys[-1]:
+                        self.keys.append(key)
+                        self.offsets.append(pos)
+                    break
+                pos = data.find(b"\n", pos, limit) + 1
+                if pos == 0:
+                    break
+            self._next += self.interval
+
+    def lower_bound(self, data, end, key):
+        """Posición de la primera línea con clave >= key (end si no hay ninguna)"""
+        if self.last is not None and key > self.last:
+            return end  # Un segmento anterior al rango: no se lee
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys):
+            # Pasada la última muestra: el resto del archivo es más corto que 'interval'
+            pos, stop = (self.offsets[-1] if self.offsets else 0), end
+        else:
+            pos, stop = (self.offsets[i - 1] if i else 0), self.offsets[i]
+        while pos < stop:
+            line = line_key(data, pos)
+            if line is not None and line >= key:
+                return pos
+            pos = data.find(b"\n", pos, end) + 1
+            if pos == 0:
+                return end
+        return stop
+
+
+class LogQuery:
+    """Consultas sobre un grupo de archivos de log; los índices se comparten entre consultas"""
+
+    def __init__(self, interval=256 * 1024, max_indexes=256):
+        self.interval = interval
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()  # (dispositivo, inodo) -> SparseIndex, el más usado al final
+        self._lock = threading.Lock()
+
+    def _index(self, st, data):
+        with self._lock:
+            key = (st.st_dev, st.st_ino)
+            index = self._indexes.get(key)
+            if index is None or not index.matches(data, st.st_size):
+                index = self._indexes[key] = SparseIndex(self.interval)
+                while len(self._indexes) > self.max_indexes:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(key)
+            return index
+
+    def plan(self, path, start=None, stop=None):
+        """
+        Rangos a leer de 'path' y sus segmentos rotados: [(mmap, desde, hasta)], del más antiguo al más
+        reciente. start y stop son claves de query_key(); stop no se incluye.
+        """
+        ranges = []
+        try:
+            for segment in [p for _, p in segments(path)] + [path]:
+                try:
+                    with open(segment, "rb") as file:
+                        st = os.fstat(file.fileno())
+                        if not st.st_size:
+                            continue
+                        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                except FileNotFoundError:
+                    continue  # Lo borró la rotación
+                end = data.rfind(b"\n") + 1  # Sin la última línea si todavía se está escribiendo
+                index = self._index(st, data)
+                with index.lock:
+                    index.extend(data, end)
+                    first = index.lower_bound(data, end, start) if start else 0
+                    last = index.lower_bound(data, end, stop) if stop else end
+                if first < last:
+                    ranges.append((data, first, last))
+                else:
+                    data.close()
+        except BaseException:
+            for data, _, _ in ranges:
+                data.close()
+            raise
+        return ranges
+
+    @staticmethod
+    def read(ranges, keywords=(), level=None, limit=None):
+        """
+        Bloques de líneas de los rangos de plan(); con palabras o nivel, solo los registros que contienen
+        todas las palabras y el nivel, sin distinguir mayúsculas
+        """
+        # Con palabras solo en ASCII, se buscan en bytes en minúsculas (mucho más rápido que re.IGNORECASE);
+        # con acentos u otros caracteres, en el texto decodificado con re.IGNORECASE ("ÉXITO" y "éxito")
+        text = not all(keyword.isascii() for keyword in keywords)
+        if text:
+            patterns = [re.compile(re.escape(keyword), re.IGNORECASE) for keyword in keywords]
+        else:
+            patterns = [re.compile(re.escape(keyword.lower().encode())) for keyword in keywords]
+        if level:
+            # El patrón del nivel empieza con una alternativa, que re prueba posición por posición: antes
+            # se busca la palabra sola, mucho más rápido (y es la que recorre el bloque si no hay palabras)
+            level = re.escape(level.lower())
+            level_pattern = r'"level":\s*"%s"|\s-\s%s\s-\s' % (level, level)
+            if text:
+                patterns += [re.compile(level, re.IGNORECASE), re.compile(level_pattern, re.IGNORECASE)]
+            else:
+                patterns += [re.compile(level.encode()), re.compile(level_pattern.encode())]
+        remaining = limit
+        try:
+            for data, first, last in ranges:
+                if patterns:
+                    blocks = _filtered(data, first, last, patterns, text)
+                else:
+                    blocks = _blocks(data, first, last)
+                for block in blocks:
+                    if remaining is not None:
+                        lines = block.count(b"\n")
+                        if lines >= remaining:
+                            cut = -1
+                            for _ in range(remaining):
+                                cut = block.find(b"\n", cut + 1)
+                            yield block[:cut + 1]
+                            return
+                        remaining -= lines
+                    yield block
+        finally:
+            for data, _, _ in ranges:
+                data.close()
+
+
+def _blocks(data, first, last, records=False):
+    """data[first:last] en bloques de líneas completas (o de registros completos, con records)"""
+    pos = first
+    while pos < last:
+        end = min(last, pos + CHUNK_SIZE)
+        if end < last:
+            # El bloque termina en una línea completa; el resto va en el siguiente
+            end = data.rfind(b"\n", pos, end) + 1 or data.find(b"\n", end, last) + 1 or last
+            while records and end < last and not LINE_TIMESTAMP.match(data, end):
+                end = data.find(b"\n", end, last) + 1 or last
+        yield data[pos:end]
+        pos = end
+
+
+def _filtered(data, first, last, patterns, text):
+    """
+    Registros que cumplen todos los patrones, por bloques: el primero se busca en el bloque (en
+    minúsculas o decodificado, según 'text') y los demás solo en los registros donde aparece
+    """
+    search, rest = patterns[0], patterns[1:]
+    newline, timestamp = ("\n", TEXT_TIMESTAMP) if text else (b"\n", LINE_TIMESTAMP)
+    for block in _blocks(data, first, last, records=True):
+        # surrogateescape: los bytes que no son UTF-8 vuelven a ser los mismos al codificar
+        haystack = block.decode("utf-8", "surrogateescape") if text else block.lower()
+        lines = haystack if text else block  # Las marcas de tiempo se buscan sin pasar a minúsculas ("T")
+        size = len(haystack)
+        # En log.txt cada línea es un registro: se comprueba para todo el bloque con dos count()
+        single_lines = block.startswith(RECEIVED) and block.count(b"\n" + RECEIVED) + 1 == block.count(b"\n")
+        found = []
+        pos = 0
+        while True:
+            match = search.search(haystack, pos)
+            if match is None:
+                break
+            # Del principio del registro (la línea con marca de tiempo) hasta la siguiente que la tenga
+            start = haystack.rfind(newline, 0, match.start()) + 1
+            while not single_lines and start > pos and not timestamp.match(lines, start):
+                start = haystack.rfind(newline, 0, start - 1) + 1
+            end = haystack.find(newline, match.end() - 1) + 1 or size
+            while not single_lines and end < size and not timestamp.match(lines, end):
+                end = haystack.find(newline, end) + 1 or size
+            if all(pattern.search(haystack, start, end) for pattern in rest):
+                found.append(haystack[start:end] if text else block[start:end])
+            pos = end
+        if found:
+            yield "".join(found).encode("utf-8", "surrogateescape") if text else b"".join(found)
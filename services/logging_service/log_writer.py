@@ -0,0 +1,252 @@
+'''
+Escritura de los eventos del servicio de logs: un ring buffer acotado y un thread que los guarda en
+log.txt por grupos (group commit).
+
+- Una solicitud solo copia sus eventos al buffer y responde, sin esperar al disco. Un lote entra
+  completo o no entra: si no hay lugar, la solicitud recibe 503 y el cliente lo reintenta más tarde
+  (event_shipper.py lo guarda en su spill).
+- El thread de escritura toma todos los eventos acumulados y los escribe con un solo write(). Mientras
+  escribe o espera un fsync se acumulan los siguientes, así que con más carga los grupos son más
+  grandes y el costo por evento baja.
+- Cada línea es el evento en JSON, con "received" (el momento en que se escribió su grupo) como
+  primer campo: el archivo queda ordenado por "received".
+- fsync: "always" (después de cada grupo), "interval" (a lo sumo cada fsync_interval segundos) o
+  "never" (lo decide el sistema operativo).
+- Rotación: al superar rotate_bytes, o rotate_interval segundos después de abrirlo, log.txt pasa a ser
+  el segmento log.txt.N (el número más alto es el más reciente) y se conservan los últimos 'keep'.
+'''
+
+import glob
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def segments(path):
+    """Segmentos rotados de 'path' como [(número, ruta)], del más antiguo al más reciente"""
+    found = []
+    for segment in glob.glob(glob.escape(path) + ".*"):
+        suffix = segment[len(path) + 1:]
+        if suffix.isdigit():
+            found.append((int(suffix), segment))
+    return sorted(found)
+
+
+class RingBuffer:
+    """Cola de eventos (bytes) acotada por cantidad y por tamaño, sobre una lista de tamaño fijo"""
+
+    def __init__(self, capacity, max_bytes):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+
+        # Estadísticas
+        self.accepted = 0
+        self.rejected = 0
+
+        self._slots = [None] * capacity
+        self._head = 0  # Posición del evento más antiguo
+        self._count = 0
+        self._bytes = 0
+        self._ready = threading.Condition()
+
+    def put_many(self, items, size):
+        """Agrega todos los eventos ('size' bytes en total) o ninguno; retorna False si no hay lugar"""
+        with self._ready:
+            if self._count + len(items) > self.capacity or self._bytes + size > self.max_bytes:
+                self.rejected += len(items)
+                return False
+            tail = (self._head + self._count) % self.capacity
+            first = min(len(items), self.capacity - tail)
+            self._slots[tail:tail + first] = items[:first]
+            self._slots[:len(items) - first] = items[first:]  # El resto vuelve al principio de la lista
+            self._count += len(items)
+            self._bytes += size
+            self.accepted += len(items)
+            self._ready.notify()
+            return True
+
+    def take(self, max_items, timeout):
+        """Saca hasta max_items eventos en orden; si no hay ninguno, espera hasta 'timeout' segundos"""
+        with self._ready:
+            if not self._count:
+                self._ready.wait(timeout)
+            count = min(self._count, max_items)
+            if not count:
+                return []
+            end = self._head + count
+            if end <= self.capacity:
+                items = self._slots[self._head:end]
+                self._slots[self._head:end] = [None] * count
+            else:
+                end -= self.capacity
+                items = self._slots[self._head:] + self._slots[:end]
+                self._slots[self._head:] = [None] * (self.capacity - self._head)
+                self._slots[:end] = [None] * end
+            self._head = end % self.capacity
+            self._count -= count
+            self._bytes -= sum(map(len, items))
+            return items
+
+    def wake(self):
+        with self._ready:
+            self._ready.notify()
+
+    def depth(self):
+        """(eventos, bytes) en espera de ser escritos"""
+        with self._ready:
+            return self._count, self._bytes
+
+
+class RateMeter:
+    """Eventos por segundo en los últimos 'window' segundos, en cubetas de un segundo"""
+
+    def __init__(self, window=10):
+        self.window = window
+        self._buckets = deque()  # [segundo, eventos]
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        second = int(time.monotonic())
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == second:
+                self._buckets[-1][1] += count
+            else:
+                self._buckets.append([second, count])
+                while self._buckets[0][0] <= second - self.window:
+                    self._buckets.popleft()
+
+    def rate(self):
+        oldest = int(time.monotonic()) - self.window
+        with self._lock:
+            return sum(count for second, count in self._buckets if second > oldest) / self.window
+
+
+class LogWriter:
+    def __init__(self, path, buffer, fsync="interval", fsync_interval=1.0, rotate_bytes=64 * 1024 * 1024,
+                 rotate_interval=0, keep=10, commit_max_events=10000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconocida: {fsync} (usa {', '.join(FSYNC_POLICIES)})")
+        self.path = path
+        self.buffer = buffer
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval  # Segundos; 0: solo por tamaño
+        self.keep = keep
+        self.commit_max_events = commit_max_events
+
+        # Estadísticas
+        self.committed = 0
+        self.commits = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        self.lost = 0  # Eventos de grupos que no se pudieron escribir
+        self.last_commit_ms = 0.0
+        self.commit_rate = RateMeter()
+
+        self._received = ""  # Último "received" escrito: nunca retrocede, aunque lo haga el reloj
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+        self._stopping = False
+        self._open()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="log-writer")
+        self._thread.start()
+
+    def close(self, timeout=5.0):
+        """Escribe lo que quede en el buffer y cierra el archivo; pensado para atexit"""
+        self._stopping = True
+        self.buffer.wake()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "committed": self.committed,
+            "commits": self.commits,
+            "events_per_commit": round(self.committed / self.commits, 1) if self.commits else 0,
+            "commit_rate": self.commit_rate.rate(),
+            "last_commit_ms": round(self.last_commit_ms, 3),
+            "bytes_written": self.bytes_written,
+            "fsyncs": self.fsyncs,
+            "rotations": self.rotations,
+            "lost": self.lost,
+            "file_bytes": self._size,
+        }
+
+    # --- Thread de escritura ---
+
+    def _run(self):
+        # Sin eventos, el thread se despierta igual para el fsync pendiente y la rotación por tiempo
+        idle = max(0.01, min(1.0, self.fsync_interval)) if self.fsync == "interval" else 1.0
+        while True:
+            items = self.buffer.take(self.commit_max_events, timeout=idle)
+            if items:
+                self._commit(items)
+            elif self._stopping:
+                break
+            now = time.monotonic()
+            try:
+                if self._unsynced and (self.fsync == "always" or (self.fsync == "interval" and
+                                                                  now - self._last_fsync >= self.fsync_interval)):
+                    self._sync(now)
+                if self._size and (self._size >= self.rotate_bytes or
+                                   (self.rotate_interval and now - self._opened >= self.rotate_interval)):
+                    self._rotate()
+            except OSError as e:
+                print(f"Error al sincronizar o rotar {self.path}: {e}")
+        try:
+            if self.fsync != "never":
+                self._sync(time.monotonic())
+            self._file.close()
+        except OSError as e:
+            print(f"Error al cerrar {self.path}: {e}")
+
+    def _commit(self, items):
+        start = time.perf_counter()
+        received = datetime.now().isoformat(timespec="milliseconds")
+        self._received = received = max(received, self._received)
+        prefix = b'{"received":"%s",' % received.encode()
+        data = prefix + prefix.join(items)  # Cada evento es su JSON sin la llave inicial, con salto de línea
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            self.lost += len(items)
+            print(f"Error al escribir {len(items)} eventos en {self.path}: {e}")
+            return
+        self._size += len(data)
+        self._unsynced = True
+        self.committed += len(items)
+        self.commits += 1
+        self.bytes_written += len(data)
+        self.commit_rate.add(len(items))
+        self.last_commit_ms = (time.perf_counter() - start) * 1000
+
+    def _sync(self, now):
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+        self._unsynced = False
+        self._last_fsync = now
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        self._opened = time.monotonic()
+
+    def _rotate(self):
+        if self.fsync != "never":
+            self._sync(time.monotonic())
+        self._file.close()
+        try:
+            existing = segments(self.path)
+            number = existing[-1][0] + 1 if existing else 1
+            os.replace(self.path, f"{self.path}.{number}")
+        finally:
+            self._open()
+        self.rotations += 1
+        for _, old in existing[:max(0, len(existing) + 1 - self.keep)]:
+            os.unlink(old)
@@ -0,0 +1,76 @@
+'''
+Pruebas de la recepción de eventos de app.py: el lote NDJSON se pasa al buffer sin volver a
+codificar cada evento, salvo los que traen su propio "received".
+
+    python -m pytest test_app.py
+'''
+
+import json
+import os
+import tempfile
+import unittest
+
+# app.py abre LOG_FILE al importarse: las pruebas escriben en un directorio temporal
+directory = tempfile.TemporaryDirectory()
+os.environ["LOG_FILE"] = os.path.join(directory.name, "log.txt")
+
+import app  # noqa: E402
+
+
+def stored(item):
+    """El evento tal como queda en log.txt, con el "received" que le antepone log_writer.py"""
+    return json.loads(b'{"received":"2026-10-18T14:02:30.500",' + item)
+
+
+class ParseNdjsonTest(unittest.TestCase):
+    def test_lines_are_reused_without_reencoding(self):
+        line = b'{"message": "Nueva tarea a\\u00f1adida", "source": "app",  "level": "INFO"}'
+        items, invalid = app.parse_ndjson(line + b"\n")
+        # El mismo JSON sin la llave inicial: los espacios y los escapes originales se conservan
+        self.assertEqual((items, invalid), ([line[1:] + b"\n"], 0))
+        self.assertEqual(stored(items[0])["message"], "Nueva tarea añadida")
+
+    def test_event_received_is_replaced(self):
+        items, invalid = app.parse_ndjson(b'{"received": "1999-01-01", "message": "viejo"}\n')
+        self.assertEqual(invalid, 0)
+        self.assertEqual(stored(items[0]), {"received": "2026-10-18T14:02:30.500", "message": "viejo"})
+
+    def test_invalid_lines_are_counted_and_skipped(self):
+        too_long = json.dumps({"message": "x" * app.LOG_MAX_EVENT_BYTES}).encode()
+        body = b"\n".join([
+            b'{"message": "uno"}\r',
+            b"",
+            b"no es json",
+            b'{"source": "sin message"}',
+            b'["no", "es", "un", "objeto"]',
+            too_long,
+            b'  {"message": "dos"}  ',
+        ])
+        items, invalid = app.parse_ndjson(body)
+        self.assertEqual([stored(item)["message"] for item in items], ["uno", "dos"])
+        self.assertEqual(invalid, 4)
+
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+
+    def test_ndjson_batch_is_accepted(self):
+        body = b"".join(json.dumps({"message": f"evento {n}"}).encode() + b"\n" for n in range(5)) + b"roto\n"
+        response = self.client.post("/log", data=body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json(), {"accepted": 5, "invalid": 1})
+
+    def test_batch_without_valid_events_is_rejected(self):
+        response = self.client.post("/log", data=b'{"source": "x"}\n', content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_larger_than_the_buffer_is_rejected(self):
+        capacity = app.buffer.capacity
+        body = b"".join(b'{"message": "e"}\n' for _ in range(capacity + 1))
+        response = self.client.post("/log", data=body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 413)
+
+
+if __name__ == "__main__":
+    unittest.main()
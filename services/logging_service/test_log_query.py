@@ -0,0 +1,82 @@
+'''
+Pruebas de las consultas de log_query.py: rangos de tiempo sobre varios segmentos y filtros que
+devuelven registros completos (la línea con fecha y las siguientes sin fecha).
+
+    python -m pytest test_log_query.py
+'''
+
+import os
+import tempfile
+import unittest
+
+import log_query
+from log_query import LogQuery, query_key
+
+BALANCER_LOG = (
+    "2025-05-29 10:03:30,837 - INFO - Verificando servidores al inicio...\n"
+    "2025-05-29 10:03:31,002 - ERROR - Error al reenviar la solicitud\n"
+    "Traceback (most recent call last):\n"
+    "  File \"load_balancer.py\", line 410, in forward_request\n"
+    "ConnectionResetError: conexión reiniciada\n"
+    "2025-05-29 10:03:32,100 - INFO - Éxito al reintentar\n"
+)
+
+
+class LogQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queries = LogQuery(interval=64)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+        return path
+
+    def query(self, path, start=None, stop=None, keywords=(), level=None, limit=None):
+        ranges = self.queries.plan(path, start and query_key(start), stop and query_key(stop))
+        return b"".join(self.queries.read(ranges, keywords, level, limit)).decode()
+
+    def test_time_range_spans_rotated_segments(self):
+        lines = [f'{{"received":"2026-10-18T14:{minute:02d}:00.000","message":"evento {minute}"}}\n'
+                 for minute in range(60)]
+        path = self.write("log.txt", "".join(lines[40:]))
+        self.write("log.txt.1", "".join(lines[:20]))
+        self.write("log.txt.2", "".join(lines[20:40]))
+        self.assertEqual(self.query(path, "2026-10-18T14:15", "2026-10-18T14:45"), "".join(lines[15:45]))
+        self.assertEqual(self.query(path, "2026-10-18 14:58"), "".join(lines[58:]))
+        self.assertEqual(self.query(path, "2026-10-18T14:10", limit=3), "".join(lines[10:13]))
+        self.assertEqual(self.query(path, "2026-10-18T15"), "")
+
+    def test_level_filter_returns_the_whole_traceback(self):
+        path = self.write("balancer.log", BALANCER_LOG)
+        error = "".join(BALANCER_LOG.splitlines(keepends=True)[1:5])
+        self.assertEqual(self.query(path, level="ERROR"), error)
+        # La palabra está en una línea del traceback: se devuelve el registro desde su encabezado
+        self.assertEqual(self.query(path, keywords=["connectionreset"]), error)
+
+    def test_keywords_ignore_case_beyond_ascii(self):
+        path = self.write("balancer.log", BALANCER_LOG)
+        last = BALANCER_LOG.splitlines(keepends=True)[-1]
+        self.assertEqual(self.query(path, keywords=["éxito"]), last)
+        self.assertEqual(self.query(path, keywords=["CONEXIÓN"], level="error"),
+                         "".join(BALANCER_LOG.splitlines(keepends=True)[1:5]))
+
+    def test_records_are_not_split_between_blocks(self):
+        traceback = "".join(f"  línea {n} del traceback\n" for n in range(200))
+        text = ("2025-05-29 10:00:00,000 - INFO - antes\n"
+                f"2025-05-29 10:00:01,000 - ERROR - falla\n{traceback}"
+                "2025-05-29 10:00:02,000 - INFO - después\n")
+        path = self.write("balancer.log", text)
+        chunk_size, log_query.CHUNK_SIZE = log_query.CHUNK_SIZE, 256
+        try:
+            self.assertEqual(self.query(path, level="error"), f"2025-05-29 10:00:01,000 - ERROR - falla\n{traceback}")
+        finally:
+            log_query.CHUNK_SIZE = chunk_size
+
+
+if __name__ == "__main__":
+    unittest.main()
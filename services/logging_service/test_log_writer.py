@@ -0,0 +1,113 @@
+'''
+Pruebas de log_writer.py: el ring buffer (vuelta al principio de la lista y lotes que entran
+completos o no entran) y la escritura por grupos con rotación.
+
+    python -m pytest test_log_writer.py
+'''
+
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+from collections import deque
+
+from log_writer import LogWriter, RingBuffer, segments
+
+
+def event(number, size=0):
+    """Un evento como los guarda app.py: su JSON sin la llave inicial, con salto de línea"""
+    return json.dumps({"message": f"evento {number}", "padding": "x" * size})[1:].encode() + b"\n"
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_wraparound_keeps_order(self):
+        buffer = RingBuffer(capacity=7, max_bytes=1 << 20)
+        expected = deque()
+        generator = random.Random(5)
+        number = 0
+        for _ in range(500):
+            if generator.random() < 0.5:
+                items = [event(number + i) for i in range(generator.randint(1, 4))]
+                if buffer.put_many(items, sum(map(len, items))):
+                    expected.extend(items)
+                    number += len(items)
+            else:
+                count = min(generator.randint(1, 5), len(expected))
+                self.assertEqual(buffer.take(count, timeout=0), [expected.popleft() for _ in range(count)])
+            self.assertEqual(buffer.depth(), (len(expected), sum(map(len, expected))))
+        self.assertEqual(buffer.take(100, timeout=0), list(expected))
+
+    def test_batch_is_all_or_nothing_by_count(self):
+        buffer = RingBuffer(capacity=5, max_bytes=1 << 20)
+        self.assertTrue(buffer.put_many([event(n) for n in range(3)], 3 * len(event(0))))
+        items = [event(n) for n in range(3, 6)]
+        self.assertFalse(buffer.put_many(items, sum(map(len, items))))
+        self.assertEqual(buffer.depth()[0], 3)
+        self.assertEqual((buffer.accepted, buffer.rejected), (3, 3))
+        self.assertEqual(buffer.take(10, timeout=0), [event(n) for n in range(3)])
+
+    def test_batch_is_all_or_nothing_by_bytes(self):
+        buffer = RingBuffer(capacity=100, max_bytes=100)
+        small = [event(0)]
+        self.assertTrue(buffer.put_many(small, len(small[0])))
+        large = [event(1, size=30), event(2, size=30)]
+        self.assertFalse(buffer.put_many(large, sum(map(len, large))))
+        self.assertEqual(buffer.depth(), (1, len(small[0])))
+
+    def test_take_waits_for_timeout_when_empty(self):
+        buffer = RingBuffer(capacity=4, max_bytes=1024)
+        start = time.monotonic()
+        self.assertEqual(buffer.take(10, timeout=0.05), [])
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+
+class LogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "log.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_lines(self):
+        lines = []
+        for _, segment in segments(self.path) + [(None, self.path)]:
+            with open(segment, "rb") as file:
+                lines += file.read().splitlines()
+        return [json.loads(line) for line in lines]
+
+    def test_events_are_written_in_order_with_received(self):
+        buffer = RingBuffer(capacity=1000, max_bytes=1 << 20)
+        writer = LogWriter(self.path, buffer, fsync="never")
+        for start in range(0, 300, 30):
+            items = [event(n) for n in range(start, start + 30)]
+            self.assertTrue(buffer.put_many(items, sum(map(len, items))))
+        writer.close()
+        events = self.read_lines()
+        self.assertEqual([e["message"] for e in events], [f"evento {n}" for n in range(300)])
+        received = [e["received"] for e in events]
+        self.assertEqual(received, sorted(received))
+        self.assertEqual(list(events[0])[0], "received")
+
+    def test_rotation_keeps_the_newest_segments(self):
+        buffer = RingBuffer(capacity=1000, max_bytes=1 << 20)
+        # Grupos de un evento: el archivo rota después de cada uno que supera rotate_bytes
+        writer = LogWriter(self.path, buffer, fsync="never", rotate_bytes=200, keep=3, commit_max_events=1)
+        for n in range(10):
+            item = event(n, size=200)
+            self.assertTrue(buffer.put_many([item], len(item)))
+            deadline = time.monotonic() + 5
+            while buffer.depth()[0] or writer.rotations < n + 1:
+                self.assertLess(time.monotonic(), deadline, "el thread de escritura no rotó el archivo")
+                time.sleep(0.01)
+        writer.close()
+        self.assertEqual(writer.rotations, 10)
+        self.assertEqual([number for number, _ in segments(self.path)], [8, 9, 10])
+        self.assertEqual([e["message"] for e in self.read_lines()], [f"evento {n}" for n in (7, 8, 9)])
+        self.assertEqual(writer.committed, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()